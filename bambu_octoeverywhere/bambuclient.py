@@ -4,11 +4,12 @@ import time
 import json
 import socket
 import threading
-from typing import List
+from typing import Callable, List
 
 import paho.mqtt.client as mqtt
 
 from octoeverywhere.sentry import Sentry
+from octoeverywhere.jsoncodec import JsonCodec
 
 from linux_host.config import Config
 from linux_host.networksearch import NetworkSearch
@@ -17,6 +18,46 @@ from .bambucloud import BambuCloud, LoginStatus
 from .bambumodels import BambuState, BambuVersion
 
 
+# Tracks a message that's been published to the printer, until it's acked.
+# The callback is called exactly once, with True if the publish was acked, or False if it failed or hit its deadline.
+class BambuPublishContext:
+
+    def __init__(self, callback:Callable[[bool], None], timeoutSec:float):
+        self.Callback = callback
+        self.TimeoutSec = timeoutSec
+        # Set when the message is sent, since that's when the deadline starts.
+        self.DeadlineSec = time.time() + timeoutSec
+        self.Info:mqtt.MQTTMessageInfo = None
+        self.DeadlineTimer:threading.Timer = None
+        self.Lock = threading.Lock()
+        self.DoneEvent = threading.Event()
+        self.Success = False
+
+
+    # Sets the result and fires the callback, if the context isn't already done.
+    def Complete(self, success:bool) -> None:
+        with self.Lock:
+            if self.DoneEvent.is_set():
+                return
+            self.Success = success
+            self.DoneEvent.set()
+            deadlineTimer = self.DeadlineTimer
+            self.DeadlineTimer = None
+        if deadlineTimer is not None:
+            deadlineTimer.cancel()
+        if self.Callback is not None:
+            try:
+                self.Callback(success)
+            except Exception as e:
+                Sentry.Exception("BambuPublishContext callback exception.", e)
+
+
+    # Blocks until the publish is done, returns True if it was acked.
+    def Wait(self) -> bool:
+        self.DoneEvent.wait(max(0.0, self.DeadlineSec - time.time()) + 1.0)
+        return self.Success
+
+
 class ConnectionContext:
     def __init__(self, isCloud:bool, ipOrHostname:str, userName:str, accessToken:str):
         self.IsCloud = isCloud
@@ -34,6 +75,12 @@ class BambuClient:
     # Useful for debugging.
     _PrintMQTTMessages = False
 
+    # The max number of published messages that can be waiting to be acked, after this publishes will fail right away.
+    c_MaxPendingPublishes = 20
+
+    # The default time a publish has to be acked before it fails.
+    c_PublishTimeoutSec = 20.0
+
     @staticmethod
     def Init(logger:logging.Logger, config:Config, stateTranslator):
         BambuClient._Instance = BambuClient(logger, config, stateTranslator)
@@ -55,6 +102,9 @@ class BambuClient:
         self.HasDoneFirstFullStateSync = False
         self.ReportSubscribeMid = None
         self.IsPendingSubscribe = False
+        # Messages that have been published but not acked yet, by the mqtt message id.
+        self.PendingPublishesLock = threading.Lock()
+        self.PendingPublishes:dict = {}
         self._CleanupStateOnDisconnect()
 
         # This is used to wake up the connection thread if it's sleeping.
@@ -94,19 +144,35 @@ class BambuClient:
         return self.Version
 
 
-    # Sends the pause command, returns is the send was successful or not.
-    def SendPause(self) -> bool:
-        return self._Publish({"print": {"sequence_id": "0", "command": "pause"}})
+    # Sends the pause command, returns False if the command couldn't be sent.
+    # True means the command was sent, but the printer might not have acked it yet. The optional callback will be called with the ack result.
+    def SendPause(self, callback:Callable[[bool], None] = None) -> bool:
+        return self._SendCommand("pause", callback)
 
 
-    # Sends the resume command, returns is the send was successful or not.
-    def SendResume(self) -> bool:
-        return self._Publish({"print": {"sequence_id": "0", "command": "resume"}})
+    # Sends the resume command, returns False if the command couldn't be sent.
+    # True means the command was sent, but the printer might not have acked it yet. The optional callback will be called with the ack result.
+    def SendResume(self, callback:Callable[[bool], None] = None) -> bool:
+        return self._SendCommand("resume", callback)
 
 
-    # Sends the cancel (stop) command, returns is the send was successful or not.
-    def SendCancel(self) -> bool:
-        return self._Publish({"print": {"sequence_id": "0", "command": "stop"}})
+    # Sends the cancel (stop) command, returns False if the command couldn't be sent.
+    # True means the command was sent, but the printer might not have acked it yet. The optional callback will be called with the ack result.
+    def SendCancel(self, callback:Callable[[bool], None] = None) -> bool:
+        return self._SendCommand("stop", callback)
+
+
+    def _SendCommand(self, command:str, callback:Callable[[bool], None]) -> bool:
+        def _OnCommandPublished(success:bool):
+            if success:
+                self.Logger.info(f"Bambu printer acked the {command} command.")
+            else:
+                self.Logger.warning(f"Bambu printer failed to ack the {command} command.")
+            if callback is not None:
+                callback(success)
+        context = self.PublishAsync({"print": {"sequence_id": "0", "command": command}}, _OnCommandPublished)
+        # The ack is still pending for most commands, so this only returns False if the command failed right away, like if we aren't connected.
+        return context.DoneEvent.is_set() is False or context.Success
 
 
     # Sets up, runs, and maintains the MQTT connection.
@@ -132,6 +198,7 @@ class BambuClient:
                 self.Client.on_message = self._OnMessage
                 self.Client.on_disconnect = self._OnDisconnect
                 self.Client.on_subscribe = self._OnSubscribe
+                self.Client.on_publish = self._OnPublish
                 self.Client.on_log = self._OnLog
 
                 # Get the IP to try on this connect
@@ -224,6 +291,12 @@ class BambuClient:
         self.HasDoneFirstFullStateSync = False
         self.ReportSubscribeMid = None
         self.IsPendingSubscribe = False
+        # Anything that wasn't acked won't be now, so fail it.
+        with self.PendingPublishesLock:
+            pending = list(self.PendingPublishes.values())
+            self.PendingPublishes.clear()
+        for context in pending:
+            context.Complete(False)
         # For some reason, the Bambu Cloud MQTT server will fire a disconnect message but doesn't actually disconnect.
         # So we always call disconnect to ensure we force it, to ensure our connection loop closes.
         try:
@@ -303,8 +376,14 @@ class BambuClient:
     # Fired when there's an incoming MQTT message.
     def _OnMessage(self, client, userdata, mqttMsg:mqtt.MQTTMessage):
         try:
+            # We only use the print and info messages, so if the message can't contain either, don't bother parsing it.
+            # Some printers send other messages, like mc_print logs, quite often.
+            payload = mqttMsg.payload
+            if BambuClient._PrintMQTTMessages is False and JsonCodec.MightContainKey(payload, "print") is False and JsonCodec.MightContainKey(payload, "info") is False:
+                return
+
             # Try to deserialize the message.
-            msg = json.loads(mqttMsg.payload)
+            msg = JsonCodec.Loads(payload)
             if msg is None:
                 raise Exception("Parsed json MQTT message returned None")
 
@@ -314,16 +393,17 @@ class BambuClient:
 
             # Since we keep a track of the state locally from the partial updates, we need to feed all updates to our state object.
             isFirstFullSyncResponse = False
+            changedFields = set()
             if "print" in msg:
                 printMsg = msg["print"]
                 try:
                     if self.State is None:
                         # Build the object before we set it.
                         s = BambuState()
-                        s.OnUpdate(printMsg)
+                        changedFields = s.OnUpdate(printMsg)
                         self.State = s
                     else:
-                        self.State.OnUpdate(printMsg)
+                        changedFields = self.State.OnUpdate(printMsg)
                 except Exception as e:
                     Sentry.Exception("Exception calling BambuState.OnUpdate", e)
 
@@ -352,12 +432,12 @@ class BambuClient:
                 except Exception as e:
                     Sentry.Exception("Exception calling BambuVersion.OnUpdate", e)
 
-            # Send all messages to the state translator
+            # Send the changed fields to the state translator
             # This must happen AFTER we update the State object, so it's current.
             try:
                 # Only send the message along if there's a state. This can happen if a push_status isn't the first message we receive.
                 if self.State is not None:
-                    self.StateTranslator.OnMqttMessage(msg, self.State, isFirstFullSyncResponse)
+                    self.StateTranslator.OnMqttMessage(self.State, changedFields, isFirstFullSyncResponse)
             except Exception as e:
                 Sentry.Exception("Exception calling StateTranslator.OnMqttMessage", e)
 
@@ -367,28 +447,88 @@ class BambuClient:
 
     # Publishes a message and blocks until it knows if the message send was successful or not.
     def _Publish(self, msg:dict) -> bool:
+        return self.PublishAsync(msg).Wait()
+
+
+    # Publishes a message and returns right away, without waiting for it to be acked.
+    # The returned context can be used to wait on the result, or the optional callback will be called with the result.
+    # If the message can't be sent, the context will already be completed with a failure.
+    def PublishAsync(self, msg:dict, callback:Callable[[bool], None] = None, timeoutSec:float = c_PublishTimeoutSec) -> BambuPublishContext:
+        context = BambuPublishContext(callback, timeoutSec)
         try:
             # Print for debugging if desired.
             if self.Logger.isEnabledFor(logging.DEBUG):
-                self.Logger.debug("Incoming Bambu Message:\r\n"+json.dumps(msg, indent=3))
+                self.Logger.debug("Outgoing Bambu Message:\r\n"+json.dumps(msg, indent=3))
 
-            # Ensure we are connected.
-            if self.Client is None or not self.Client.is_connected():
+            # Ensure we are connected, so we fail fast.
+            client = self.Client
+            if client is None or not client.is_connected():
                 self.Logger.info("Failed to publish command because we aren't connected.")
                 # Set the sleep event, so if the socket is waiting to reconnect, it will wake up and try again.
                 self.SleepEvent.set()
-                return False
-
-            # Try to publish.
-            state = self.Client.publish(f"device/{self.PrinterSn}/request", json.dumps(msg))
-
-            # Wait for the message publish to be acked.
-            # This will throw if the publish fails.
-            state.wait_for_publish(20)
-            return True
+                context.Complete(False)
+                return context
+
+            with self.PendingPublishesLock:
+                pendingCount = len(self.PendingPublishes)
+            if pendingCount >= BambuClient.c_MaxPendingPublishes:
+                self.Logger.warning("Failed to publish command because too many are already waiting to be acked.")
+                context.Complete(False)
+                return context
+
+            # Try to publish, the deadline starts now that it's being sent.
+            # Note the lock can't be held over the publish, since paho can call _OnPublish on this thread before publish returns.
+            context.DeadlineSec = time.time() + context.TimeoutSec
+            info = client.publish(f"device/{self.PrinterSn}/request", JsonCodec.Dumps(msg))
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.Logger.warning(f"Failed to publish message to bambu printer. Result: {info.rc}")
+                context.Complete(False)
+                return context
+
+            # Track it until _OnPublish is called for it or the deadline is hit.
+            context.Info = info
+            with self.PendingPublishesLock:
+                self.PendingPublishes[info.mid] = context
+            deadlineTimer = threading.Timer(context.TimeoutSec, self._OnPublishDeadline, args=(context,))
+            deadlineTimer.daemon = True
+            with context.Lock:
+                if context.DoneEvent.is_set() is False:
+                    context.DeadlineTimer = deadlineTimer
+                    deadlineTimer.start()
+
+            # If the ack came in before we were tracking it, complete it now.
+            if info.is_published():
+                self._CompletePendingPublish(context, True)
         except Exception as e:
             Sentry.Exception("Failed to publish message to bambu printer.", e)
-        return False
+            context.Complete(False)
+        return context
+
+
+    # Fired when a published message is acked.
+    def _OnPublish(self, client, userdata, mid, reason_code, properties):
+        with self.PendingPublishesLock:
+            context = self.PendingPublishes.get(mid, None)
+        # If the context isn't found, it's not tracked yet and PublishAsync will find it's published.
+        if context is not None:
+            self._CompletePendingPublish(context, True)
+
+
+    # Fired when a published message hits its deadline.
+    def _OnPublishDeadline(self, context:BambuPublishContext):
+        # Check if it's published, in case the ack came in while we weren't tracking it.
+        isPublished = context.Info.is_published()
+        if isPublished is False:
+            self.Logger.warning("Bambu publish wasn't acked before its deadline.")
+        self._CompletePendingPublish(context, isPublished)
+
+
+    # Stops tracking the published message and completes it.
+    def _CompletePendingPublish(self, context:BambuPublishContext, success:bool):
+        with self.PendingPublishesLock:
+            if self.PendingPublishes.get(context.Info.mid, None) is context:
+                del self.PendingPublishes[context.Info.mid]
+        context.Complete(success)
 
 
     # Returns a connection context object we should try to for this connection attempt.
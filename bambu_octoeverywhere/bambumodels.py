@@ -41,30 +41,47 @@ class BambuState:
 
 
     # Called when there's a new print message from the printer.
-    def OnUpdate(self, msg:dict) -> None:
+    # Returns a set of the field names that changed, which is empty if nothing we track changed.
+    def OnUpdate(self, msg:dict) -> set:
         # Get a new value or keep the current.
         # Remember that most of these are partial updates and will only have some values.
-        self.stg_cur = msg.get("stg_cur", self.stg_cur)
-        self.gcode_state = msg.get("gcode_state", self.gcode_state)
-        self.layer_num = msg.get("layer_num", self.layer_num)
-        self.total_layer_num = msg.get("total_layer_num", self.total_layer_num)
-        self.subtask_name = msg.get("subtask_name", self.subtask_name)
-        self.project_id = msg.get("project_id", self.project_id)
-        self.mc_percent = msg.get("mc_percent", self.mc_percent)
-        self.nozzle_temper = msg.get("nozzle_temper", self.nozzle_temper)
-        self.nozzle_target_temper = msg.get("nozzle_target_temper", self.nozzle_target_temper)
-        self.bed_temper = msg.get("bed_temper", self.bed_temper)
-        self.bed_target_temper = msg.get("bed_target_temper", self.bed_target_temper)
-        self.print_error = msg.get("print_error", self.print_error)
+        # The full push_status messages are sent often and most of the values don't change, so we only set the values that did.
+        changedFields = set()
+        self.stg_cur = self._GetUpdatedValue(msg, "stg_cur", self.stg_cur, changedFields)
+        self.gcode_state = self._GetUpdatedValue(msg, "gcode_state", self.gcode_state, changedFields)
+        self.layer_num = self._GetUpdatedValue(msg, "layer_num", self.layer_num, changedFields)
+        self.total_layer_num = self._GetUpdatedValue(msg, "total_layer_num", self.total_layer_num, changedFields)
+        self.subtask_name = self._GetUpdatedValue(msg, "subtask_name", self.subtask_name, changedFields)
+        self.project_id = self._GetUpdatedValue(msg, "project_id", self.project_id, changedFields)
+        self.mc_percent = self._GetUpdatedValue(msg, "mc_percent", self.mc_percent, changedFields)
+        self.nozzle_temper = self._GetUpdatedValue(msg, "nozzle_temper", self.nozzle_temper, changedFields)
+        self.nozzle_target_temper = self._GetUpdatedValue(msg, "nozzle_target_temper", self.nozzle_target_temper, changedFields)
+        self.bed_temper = self._GetUpdatedValue(msg, "bed_temper", self.bed_temper, changedFields)
+        self.bed_target_temper = self._GetUpdatedValue(msg, "bed_target_temper", self.bed_target_temper, changedFields)
+        self.print_error = self._GetUpdatedValue(msg, "print_error", self.print_error, changedFields)
+        self.mc_remaining_time = self._GetUpdatedValue(msg, "mc_remaining_time", self.mc_remaining_time, changedFields)
         ipCam = msg.get("ipcam", None)
-        if ipCam is not None:
-            self.rtsp_url = ipCam.get("rtsp_url", self.rtsp_url)
+        if ipCam is not None and "rtsp_url" in ipCam and ipCam["rtsp_url"] != self.rtsp_url:
+            self.rtsp_url = ipCam["rtsp_url"]
+            changedFields.add("rtsp_url")
 
         # Time remaining has some custom logic, so as it's queried each time it keep counting down in seconds, since Bambu only gives us minutes.
-        old_mc_remaining_time = self.mc_remaining_time
-        self.mc_remaining_time = msg.get("mc_remaining_time", self.mc_remaining_time)
-        if old_mc_remaining_time != self.mc_remaining_time:
+        if "mc_remaining_time" in changedFields:
             self.LastTimeRemainingWallClock = time.time()
+        return changedFields
+
+
+    # Returns the new value for the field if it's in the message and different, otherwise the current value.
+    # If the value changed, the field name is added to the changed set.
+    @staticmethod
+    def _GetUpdatedValue(msg:dict, name:str, current, changedFields:set):
+        if name not in msg:
+            return current
+        value = msg[name]
+        if value == current:
+            return current
+        changedFields.add(name)
+        return value
 
 
     # Returns a time reaming value that counts down in seconds, not just minutes.
@@ -10,10 +10,22 @@ from .bambumodels import BambuState, BambuPrintErrors
 # and to act as the printer state interface for Bambu printers.
 class BambuStateTranslator:
 
+    # The state fields that can change the print state or print info.
+    c_PrintStateFields = frozenset(("gcode_state", "project_id", "subtask_name"))
+    # The state fields that can change the layer info.
+    c_LayerFields = frozenset(("layer_num", "total_layer_num"))
+    # All of the state fields we read when handling a message, so we need to look at the message when they change.
+    c_SubscribedFields = c_PrintStateFields | c_LayerFields | frozenset(("mc_percent", "print_error"))
+
+    # The progress is reported when it changes, but it's also reported at least this often, since the notification
+    # handler uses the progress calls to update its own progress and time based logic.
+    c_ProgressReportIntervalSec = 60.0
+
     def __init__(self, logger) -> None:
         self.Logger = logger
         self.NotificationsHandler:NotificationsHandler = None
         self.LastState:str = None
+        self.LastProgressReportTimeSec:float = 0.0
 
 
     def SetNotificationHandler(self, notificationHandler:NotificationsHandler):
@@ -25,12 +37,23 @@ class BambuStateTranslator:
     def ResetForNewConnection(self):
         # Reset the last state to indicate that we don't know what it is.
         self.LastState = None
+        self.LastProgressReportTimeSec = 0.0
 
 
-    # Fired when any mqtt message comes in.
+    # Fired when any print mqtt message comes in, after the state has been updated.
     # State will always be NOT NONE, since it's going to be created before this call.
+    # changedFields is the set of state field names that changed with this message, from BambuState.OnUpdate.
     # The isFirstFullSyncResponse flag indicates if this is the first full state sync of a new connection.
-    def OnMqttMessage(self, msg:dict, bambuState:BambuState, isFirstFullSyncResponse:bool):
+    def OnMqttMessage(self, bambuState:BambuState, changedFields:set, isFirstFullSyncResponse:bool):
+
+        # Most messages are status reports where nothing we care about changed, so if that's the case, we are done.
+        # Always check the last state, since it's reset for new connections and the state object might not have changed.
+        isProgressReportDue = "mc_percent" in changedFields or time.time() - self.LastProgressReportTimeSec > BambuStateTranslator.c_ProgressReportIntervalSec
+        if isFirstFullSyncResponse is False and isProgressReportDue is False and self.LastState == bambuState.gcode_state and changedFields.isdisjoint(BambuStateTranslator.c_SubscribedFields):
+            return
+        # Restart the interval even if we don't end up reporting, so idle printers still take the fast path above.
+        if isProgressReportDue:
+            self.LastProgressReportTimeSec = time.time()
 
         # First, if we have a new connection and we just synced, make sure the notification handler is in sync.
         if isFirstFullSyncResponse:
@@ -39,7 +62,6 @@ class BambuStateTranslator:
         # Bambu does send some commands when actions happen, but they don't always get sent for all state changes.
         # For example, if a user issues a pause command, we see the command. But if the print goes into an error an pauses, we don't get a pause command.
         # Thus, we have to rely on keeping track of that state and knowing when it changes.
-        # Note we check state for all messages, not just push_status, but it doesn't matter because it will only change on push_status anyways.
         # Here's a list of all states: https://github.com/greghesp/ha-bambulab/blob/e72e343acd3279c9bccba510f94bf0e291fe5aaa/custom_components/bambu_lab/pybambu/const.py#L83C1-L83C21
         if self.LastState != bambuState.gcode_state:
             # We know the state changed.
@@ -73,7 +95,7 @@ class BambuStateTranslator:
             self.LastState = bambuState.gcode_state
 
         #
-        # Next - Handle the progress update.
+        # Next - Handle the progress and layer updates.
         #
         # These are harder to get right, because the printer will send full state objects sometimes when IDLE or PRINTING.
         # Thus if we respond to them, it might not be the correct time. For example, the full sync will always include mc_percent, but we
@@ -81,19 +103,22 @@ class BambuStateTranslator:
         #
         # We only want to consider firing these events if we know this isn't the first time sync from a new connection
         # and we are currently tacking a print.
-        if not isFirstFullSyncResponse and self.NotificationsHandler.IsTrackingPrint():
+        # On the X1, the progress doesn't get reset from the last print when the printer switches into prepare or slicing for the next print.
+        # So we will not send any progress or layer updates in these states, until the state is "RUNNING" and the progress should reset to 0.
+        if not isFirstFullSyncResponse and self.NotificationsHandler.IsTrackingPrint() and bambuState.IsPrepareOrSlicing() is False:
             # Percentage progress update
-            printMsg = msg.get("print", None)
-            if printMsg is not None and "mc_percent" in printMsg:
-                # On the X1, the progress doesn't get reset from the last print when the printer switches into prepare or slicing for the next print.
-                # So we will not send any progress updates in these states, until the state is "RUNNING" and the progress should reset to 0.
-                if bambuState.IsPrepareOrSlicing() is False:
-                    self.BambuOnPrintProgress(bambuState)
+            if isProgressReportDue and bambuState.mc_percent is not None:
+                self.BambuOnPrintProgress(bambuState)
+            # Let the notification handler know the layer changed, so it doesn't have to poll for it.
+            if changedFields.isdisjoint(BambuStateTranslator.c_LayerFields) is False:
+                currentLayer, totalLayers = self.GetCurrentLayerInfo()
+                if currentLayer is not None:
+                    self.NotificationsHandler.OnLayerChanged(currentLayer, 0 if totalLayers is None else totalLayers)
 
         # Since bambu doesn't tell us a print duration, we need to figure out when it ends ourselves.
         # This is different from the state changes above, because if we are ever not printing for any reason,
-        # We want to finalize any current print.
-        if bambuState.IsPrinting(True) is False:
+        # We want to finalize any current print. The print info can only change when the state or the print changes.
+        if (isFirstFullSyncResponse or changedFields.isdisjoint(BambuStateTranslator.c_PrintStateFields) is False) and bambuState.IsPrinting(True) is False:
             # See if there's a print info for the last print.
             pi = PrintInfoManager.Get().GetPrintInfo(bambuState.GetPrintCookie())
             if pi is not None:
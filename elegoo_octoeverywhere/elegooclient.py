@@ -8,6 +8,7 @@ import octowebsocket
 
 from octoeverywhere.compat import Compat
 from octoeverywhere.sentry import Sentry
+from octoeverywhere.jsoncodec import JsonCodec
 from octoeverywhere.websocketimpl import Client
 from octoeverywhere.octohttprequest import OctoHttpRequest
 
@@ -229,8 +230,8 @@ class ElegooClient:
                 }
             }
 
-            # Try to send. default=str makes the json dump use the str function if it fails to serialize something.
-            jsonStr = json.dumps(obj, default=str)
+            # Try to send. The codec uses the str function if it fails to serialize something.
+            jsonStr = JsonCodec.Dumps(obj)
             if ElegooClient.WebSocketMessageDebugging and self.Logger.isEnabledFor(logging.DEBUG):
                 self.Logger.debug("Elegoo WS Msg Request - %s : %s : %s", str(requestId), str(cmdId), jsonStr)
             if self._WebSocketSend(jsonStr) is False:
@@ -279,7 +280,8 @@ class ElegooClient:
 
     # Sends a string to the connected websocket.
     # forceSend is used to send the initial messages before the system is ready.
-    def _WebSocketSend(self, jsonStr:str) -> bool:
+    # The json can be a string or the already encoded utf-8 bytes.
+    def _WebSocketSend(self, jsonStr) -> bool:
         # Ensure the websocket is connected and ready.
         if self.WebSocketConnected is False:
             self.Logger.info("Elegoo client - tired to send a websocket message when the socket wasn't open.")
@@ -298,7 +300,9 @@ class ElegooClient:
         try:
             # Since we must encode the data, which will create a copy, we might as well just send the buffer as normal,
             # without adding the extra space for the header. We can add the header here or in the WS lib, it's the same amount of work.
-            localWs.Send(jsonStr.encode("utf-8"), isData=False)
+            if isinstance(jsonStr, str):
+                jsonStr = jsonStr.encode("utf-8")
+            localWs.Send(jsonStr, isData=False)
         except Exception as e:
             Sentry.Exception("Elegoo client exception in websocket send.", e)
             return False
@@ -412,11 +416,11 @@ class ElegooClient:
             Sentry.Exception("Elegoo printer websocket error.", e)
 
 
-    # Fired when the websocket is closed.
+    # Fired when the websocket has a new message.
     def _OnWsData(self, ws:Client, buffer:bytearray, msgType):
         try:
             # Try to deserialize the message.
-            msg = json.loads(buffer.decode("utf-8"))
+            msg = JsonCodec.Loads(buffer)
             if msg is None:
                 raise Exception("Parsed json message returned None")
 
@@ -661,8 +665,8 @@ class ElegooClient:
         }
 
         # Serialize and send to all of the active mux sockets.
-        # Try to send. default=str makes the json dump use the str function if it fails to serialize something.
-        jsonStr = json.dumps(obj, default=str).encode("utf-8")
+        # Try to send. The codec uses the str function if it fails to serialize something.
+        jsonStr = JsonCodec.Dumps(obj).encode("utf-8")
         self.WebsocketMux.OnIncomingMessage(None, jsonStr, octowebsocket.ABNF.OPCODE_TEXT)
 
 
@@ -687,26 +691,25 @@ class ElegooClient:
             if needsToTrim:
                 buffer = buffer[startTrim:endTrim]
 
-            # For us to be able to map messages back, we need to be able to read the request id if there is one.
-            # So if this fails, we can't handle the message.
-            msgStr = buffer.decode("utf-8")
-            msg = json.loads(msgStr)
-
-            # Try to get the data object and the request id.
-            # If it doesn't, we will just send it.
-            data = msg.get("Data", None)
-            if data is not None:
-                requestId = data.get("RequestID", None)
-                if requestId is not None:
-                    # We have a request id, validate it.
-                    if len(requestId) < 20:
-                        raise Exception(f"Invalid request id length: {len(requestId)}")
-                    # Add it to the pending list.
-                    with self.RequestLock:
-                        self.RequestPendingContexts[requestId] = MsgWaitingContext(requestId, wsId)
+            # Since the message isn't fully parsed, do a cheap check to make sure it's a complete json object, so we don't pass along something that's clearly broken.
+            rawMsg = ElegooRawMessage(buffer)
+            if rawMsg.LooksLikeJsonObject() is False:
+                raise Exception("The message isn't a json object.")
 
-            # Send the message.
-            return self._WebSocketSend(msgStr)
+            # For us to be able to map messages back, we need to be able to read the request id if there is one.
+            # We only need the request id, so we scan for it rather than parsing the message. If the scan can't find it, it will fall back to a full parse.
+            # If it doesn't have one, we will just send it.
+            requestId = rawMsg.GetRequestId()
+            if requestId is not None:
+                # We have a request id, validate it.
+                if len(requestId) < 20:
+                    raise Exception(f"Invalid request id length: {len(requestId)}")
+                # Add it to the pending list.
+                with self.RequestLock:
+                    self.RequestPendingContexts[requestId] = MsgWaitingContext(requestId, wsId)
+
+            # Send the message, as the raw bytes we got.
+            return self._WebSocketSend(buffer)
 
         except Exception as e:
             Sentry.Exception("Elegoo client exception in MuxSendMessage.", e)
@@ -731,6 +734,50 @@ class ElegooClient:
                 del self.RequestPendingContexts[k]
 
 
+# Holds a raw json message from the frontend, and only parses it if something needs the parsed message.
+# The request id can usually be found with a targeted scan of the raw bytes, so messages that are only passed along to the printer are never parsed.
+class ElegooRawMessage:
+
+    def __init__(self, buffer) -> None:
+        self.Buffer = buffer
+        self.Msg:dict = None
+
+
+    # Returns the parsed message, parsing it on the first call. This will throw if the json is invalid.
+    def GetMsg(self) -> dict:
+        if self.Msg is None:
+            msg = JsonCodec.Loads(self.Buffer)
+            if msg is None:
+                raise Exception("Parsed json message returned None")
+            self.Msg = msg
+        return self.Msg
+
+
+    # Returns True if the message starts and ends like a json object.
+    # This doesn't validate the json, but it's cheap and catches non json and truncated messages.
+    def LooksLikeJsonObject(self) -> bool:
+        buffer = self.Buffer.strip()
+        if len(buffer) < 2:
+            return False
+        if isinstance(buffer, str):
+            return buffer[0] == "{" and buffer[-1] == "}"
+        return buffer[0] == ord("{") and buffer[-1] == ord("}")
+
+
+    # Returns the request id from the Data object, or None if there isn't one.
+    def GetRequestId(self) -> str:
+        # If the key isn't in the message at all, we know there's no request id without parsing.
+        if JsonCodec.MightContainKey(self.Buffer, "RequestID") is False:
+            return None
+        requestId = JsonCodec.FindUniqueStringValue(self.Buffer, "RequestID")
+        if requestId is not None:
+            return requestId
+        data = self.GetMsg().get("Data", None)
+        if data is None:
+            return None
+        return data.get("RequestID", None)
+
+
 # A helper class used for waiting msg requests
 class MsgWaitingContext:
 
@@ -1,7 +1,7 @@
 import logging
 import threading
 
-from typing import List
+from typing import Dict, List, Set
 
 from octoeverywhere.sentry import Sentry
 
@@ -23,7 +23,8 @@ class FileInfo:
         else:
             logger.warning(f"Failed to remove the folder from {self.FileNameWithPath}")
             self.FileName = self.FileNameWithPath
-        self.FileNameLower = self.FileName.lower()
+        # The key used to index the file by name, so lookups are case insensitive.
+        self.FileNameKey = self.FileName.casefold()
 
         self.CreateTimeSec:int = fileDirInfo.get("CreateTime", None)
         self.TotalLayers:int = fileDirInfo.get("TotalLayers", None)
@@ -39,6 +40,14 @@ class FileInfo:
         # These come from the extra file info.
         self.EstPrintTimeSec:int = None
         self.EstFilamentWeightMg:int = None
+        # Set when we have asked the printer for the extra file info, so we only ask once per file.
+        self.ExtraFileInfoRequested = False
+
+
+    # Returns true if the other file info is for the same file, with the same contents.
+    # If the file was re-uploaded, the create time or size will be different.
+    def IsSameFile(self, other:"FileInfo") -> bool:
+        return self.FileNameWithPath == other.FileNameWithPath and self.CreateTimeSec == other.CreateTimeSec and self.FileSizeKb == other.FileSizeKb
 
 
     # Returns true if we have all of the file info.
@@ -55,6 +64,11 @@ class FileInfo:
 
 
 # The file manager and cache class for the Elegoo printer.
+#
+# The files are indexed by path and by the case folded file name, so lookups don't need to scan the file list.
+# Files with the same name can be in different folders, so the name index holds a list of files.
+# Each sync diffs the printer's file list against what we have, so files that didn't change keep their cached extra info.
+# The extra file info needs a request per file, so it's only fetched for files someone asks about, and only once per file.
 class ElegooFileManager:
 
     _Instance = None
@@ -72,18 +86,25 @@ class ElegooFileManager:
     def __init__(self, logger:logging.Logger) -> None:
         self.Logger = logger
 
-        self.Files:List[FileInfo] = []
+        # The files, indexed by the full path and by the case folded file name.
+        self.FilesByPath:Dict[str, FileInfo] = {}
+        self.FilesByNameKey:Dict[str, List[FileInfo]] = {}
         self.Lock = threading.Lock()
         self.SyncThread:threading.Thread = None
+        # Set when the file list needs to be synced.
+        self.IsFileListSyncPending = False
+        # The file names or paths we need to get the extra file info for.
+        self.ExtraFileInfoWantedNames:Set[str] = set()
 
 
     # Kicks off an async sync of the file manager.
-    def Sync(self):
-        # If there's no sync thread, start one now.
+    # If a file name is given, the extra file info for that file will also be fetched, if we don't have it already.
+    def Sync(self, fileName:str = None):
         with self.Lock:
-            if self.SyncThread is None:
-                self.SyncThread = threading.Thread(target=self._SyncThread, name="ElegooFileManagerSyncThread")
-                self.SyncThread.start()
+            self.IsFileListSyncPending = True
+            if fileName is not None and len(fileName) > 0:
+                self.ExtraFileInfoWantedNames.add(fileName)
+            self._EnsureSyncThread()
 
 
     # Returns the file info for the current print.
@@ -95,42 +116,68 @@ class ElegooFileManager:
 
 
     # Given a file name, get the file info.
+    # If we don't have the extra file info for the file yet, it's fetched in the background, and the file info object will be updated when it's ready.
     def GetFileInfo(self, fileName:str) -> FileInfo:
         # Ensure there's a name.
         if fileName is None or len(fileName) == 0:
             return None
 
-        # Try to find it using the lower case search.
-        fileNameLower = fileName.lower()
         with self.Lock:
-            for f in self.Files:
-                if f.FileNameLower == fileNameLower:
-                    return f
-        return None
+            f = self._FindFile(fileName)
+            if f is not None and f.ExtraFileInfoRequested is False and f.HasExtraFileInfo() is False:
+                self.ExtraFileInfoWantedNames.add(f.FileNameWithPath)
+                self._EnsureSyncThread()
+            return f
+
+
+    # Must be called under the lock.
+    # Finds the file by the full path, or if it's only a name, by the case folded name.
+    # If there are files with the same name in different folders, the most recently created one is used, since it's most likely the one being printed.
+    def _FindFile(self, fileNameOrPath:str) -> FileInfo:
+        f = self.FilesByPath.get(fileNameOrPath, None)
+        if f is not None:
+            return f
+        files = self.FilesByNameKey.get(fileNameOrPath.casefold(), None)
+        if files is None:
+            return None
+        if len(files) == 1:
+            return files[0]
+        return max(files, key=lambda i: i.CreateTimeSec if i.CreateTimeSec is not None else 0)
+
+
+    # Must be called under the lock.
+    def _EnsureSyncThread(self):
+        # If there's no sync thread, start one now. If there is, it will pick up the pending work before it exits.
+        if self.SyncThread is None:
+            self.SyncThread = threading.Thread(target=self._SyncThread, name="ElegooFileManagerSyncThread")
+            self.SyncThread.daemon = True
+            self.SyncThread.start()
 
 
     def _SyncThread(self):
         try:
             self.Logger.debug("Starting file manager sync.")
-            currentFileCount = 0
-            with self.Lock:
-                currentFileCount = len(self.Files)
-
-            # First, sync the current file list.
-            self._DoFileSystemSync()
-
-            # Now, sync the file details for any file that needs it.
-            self._SyncExtraFileInfo()
-
-            with self.Lock:
-                self.Logger.debug(f"File manager sync complete. {len(self.Files)-currentFileCount} files added.")
+            while True:
+                # Under lock, take the pending work.
+                with self.Lock:
+                    isFileListSyncPending = self.IsFileListSyncPending
+                    self.IsFileListSyncPending = False
+                    if isFileListSyncPending is False and len(self.ExtraFileInfoWantedNames) == 0:
+                        # There's no more work, so clear the thread under the same lock, so no work is missed.
+                        self.SyncThread = None
+                        break
+
+                # First, sync the current file list.
+                if isFileListSyncPending:
+                    self._DoFileSystemSync()
+
+                # Now, sync the file details for any file that was asked for.
+                self._SyncExtraFileInfo()
         except Exception as e:
             Sentry.Exception("Exception in ElegooFileManager.", e)
-        finally:
-            # When the sync thread is done, set it to None.
             with self.Lock:
                 self.SyncThread = None
-            self.Logger.debug("File manager sync thread complete.")
+        self.Logger.debug("File manager sync thread complete.")
 
 
     def _DoFileSystemSync(self):
@@ -156,48 +203,63 @@ class ElegooFileManager:
                 self.Logger.error("ElegooFileManager file list cmd is missing the FileList.")
                 return
 
-            # Build a local file list.
-            files:List[FileInfo] = []
-            for f in fileList:
-                fileInfo = FileInfo(self.Logger, f)
-                files.append(fileInfo)
-
-            # Merge this list with anything we currently have.
+            # Diff the new list against what we have.
+            # Files that didn't change keep the existing object, so they keep the extra file info we already have.
+            added = 0
+            changed = 0
             with self.Lock:
-                # For each new file...
-                for f in files:
-                    found = False
-                    for s in self.Files:
-                        # Match the names
-                        if s.FileNameWithPath == f.FileNameWithPath:
-                            # The file seems to exist, but we want to make sure it wasn't re-uploaded or something.
-                            if s.FileNameWithPath != f.FileNameWithPath :
-                                # Delete the current file and replace it with the new one.
-                                self.Files.remove(s)
-                                self.Files.append(f)
-                            # Set the found flag since we are good.
-                            found = True
-                            break
-                    # If we didn't find the file, add it.
-                    if found is False:
-                        self.Files.append(f)
+                filesByPath:Dict[str, FileInfo] = {}
+                for f in fileList:
+                    fileInfo = FileInfo(self.Logger, f)
+                    existing = self.FilesByPath.get(fileInfo.FileNameWithPath, None)
+                    if existing is None:
+                        added += 1
+                    elif existing.IsSameFile(fileInfo):
+                        fileInfo = existing
+                    else:
+                        # The file was re-uploaded, so the extra info we have is stale.
+                        changed += 1
+                    filesByPath[fileInfo.FileNameWithPath] = fileInfo
+                removed = len(self.FilesByPath) - (len(filesByPath) - added)
+                self.FilesByPath = filesByPath
+                filesByNameKey:Dict[str, List[FileInfo]] = {}
+                for f in filesByPath.values():
+                    filesByNameKey.setdefault(f.FileNameKey, []).append(f)
+                self.FilesByNameKey = filesByNameKey
+            self.Logger.debug(f"File manager file list synced. {len(filesByPath)} files, {added} added, {changed} changed, {removed} removed.")
         except Exception as e:
             Sentry.Exception("_DoFileSystemSync", e)
 
 
     def _SyncExtraFileInfo(self):
         # Under lock, get any files we need to get info for.
-        fileNamsAndPathsToSync = []
+        fileNamesAndPathsToSync = []
         with self.Lock:
-            for f in self.Files:
-                if f.HasExtraFileInfo() is False:
-                    fileNamsAndPathsToSync.append(f.FileNameWithPath)
+            for name in list(self.ExtraFileInfoWantedNames):
+                f = self._FindFile(name)
+                if f is None:
+                    # If there's no file list sync pending, the file isn't on the printer, so stop looking for it.
+                    if self.IsFileListSyncPending is False:
+                        self.ExtraFileInfoWantedNames.discard(name)
+                    continue
+                self.ExtraFileInfoWantedNames.discard(name)
+                if f.ExtraFileInfoRequested is False and f.HasExtraFileInfo() is False:
+                    f.ExtraFileInfoRequested = True
+                    fileNamesAndPathsToSync.append(f.FileNameWithPath)
 
         try:
-            for fileNameAndPath in fileNamsAndPathsToSync:
+            for fileNameAndPath in fileNamesAndPathsToSync:
                 # This command gets the file info just for this file.
                 result = ElegooClient.Get().SendRequest(260, {"Url": fileNameAndPath})
-                if result is None or result.HasError():
+                if result is None or result.IsErrorCodeOeError():
+                    # We didn't get a response from the printer, so allow the next lookup to try again.
+                    self.Logger.error(f"Failed to get file info for {fileNameAndPath}, no response from the printer.")
+                    with self.Lock:
+                        f = self.FilesByPath.get(fileNameAndPath, None)
+                        if f is not None:
+                            f.ExtraFileInfoRequested = False
+                    continue
+                if result.HasError():
                     self.Logger.error(f"Failed to get file info for {fileNameAndPath}")
                     continue
 
@@ -216,11 +278,10 @@ class ElegooFileManager:
                     self.Logger.error(f"Failed to get file info for {fileNameAndPath}")
                     continue
 
-                # Update the file info.
+                # Update the file info, if the file is still the same one.
                 with self.Lock:
-                    for f in self.Files:
-                        if f.FileNameWithPath == fileNameAndPath:
-                            f.UpdateExtraFileInfo(fileInfo)
-                            break
+                    f = self.FilesByPath.get(fileNameAndPath, None)
+                    if f is not None:
+                        f.UpdateExtraFileInfo(fileInfo)
         except Exception as e:
             Sentry.Exception("Error in _SyncFileInfo", e)
@@ -7,6 +7,7 @@ from octoeverywhere.deviceid import DeviceId
 from octoeverywhere.telemetry import Telemetry
 from octoeverywhere.hostcommon import HostCommon
 from octoeverywhere.compression import Compression
+from octoeverywhere.jsoncodec import JsonCodec
 from octoeverywhere.printinfo import PrintInfoManager
 from octoeverywhere.httpsessions import HttpSessions
 from octoeverywhere.Webcam.webcamhelper import WebcamHelper
@@ -108,6 +109,9 @@ class ElegooHost:
             # Init compression
             Compression.Init(self.Logger, localStorageDir)
 
+            # Setup the json codec used by the printer client, this must be done before the client is created.
+            JsonCodec.Init(self.Logger)
+
             # Init the mdns client
             MDns.Init(self.Logger, localStorageDir)
 
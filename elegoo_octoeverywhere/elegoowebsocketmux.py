@@ -1,8 +1,10 @@
 import queue
 import logging
 import threading
+from collections import deque
 import octowebsocket
 
+from octoeverywhere.sentry import Sentry
 from octoeverywhere.Proto import HttpInitialContext
 from octoeverywhere.Proto.PathTypes import PathTypes
 
@@ -16,6 +18,8 @@ class ElegooWebsocketMux:
         self.Lock = threading.Lock()
         self.NextId = 0
         self.ConnectedWebsockets = {}
+        # All of the proxy callbacks are fired from this shared dispatcher, so we don't need threads for each proxy.
+        self.Dispatcher = ElegooWebsocketDispatcher(logger)
 
 
     # !! Interface Function !!
@@ -41,17 +45,20 @@ class ElegooWebsocketMux:
         return ElegooWebsocketClientProxy(self, wsId, self.Logger, onWsOpen, onWsMsg, onWsData, onWsClose, onWsError, headers, subProtocolList)
 
 
-    # Called before a ElegooWebsocketClientProxy fires the open event.
+    # Called before a ElegooWebsocketClientProxy opens.
     # Return true to allow the websocket to open, false to prevent it, fire an error and close.
-    def ProxyOpen(self, ws:"ElegooWebsocketClientProxy") -> bool:
+    def CanProxyOpen(self) -> bool:
         # If we have a connection to the printer, return it's ok to open.
-        wsId = ws.GetId()
-        result = ElegooClient.Get().IsWebsocketConnected()
-        if result is True:
-            # If successful, add the websocket to the connected list.
-            with self.Lock:
-                self.ConnectedWebsockets[wsId] = ws
-        return result
+        return ElegooClient.Get().IsWebsocketConnected()
+
+
+    # Called when a ElegooWebsocketClientProxy has moved to the open state and has queued the open event.
+    # This adds the websocket to the connected list, so it starts getting messages.
+    def ProxyOpen(self, ws:"ElegooWebsocketClientProxy"):
+        with self.Lock:
+            # If the websocket was closed before we got the lock, don't add it, since ProxyClose might have already been called.
+            if ws.IsOpen():
+                self.ConnectedWebsockets[ws.GetId()] = ws
 
 
     # Called after the ElegooWebsocketClientProxy is fully open and is ready to send messages.
@@ -84,7 +91,7 @@ class ElegooWebsocketMux:
     # If wsId is set, this message is for a specific websocket.
     # If wsId is None, this message is for all websockets.
     def OnIncomingMessage(self, wsId:int, buffer:bytearray, optCode):
-        # OnIncomingMessage pushes the message to a receive queue for each websocket.
+        # OnIncomingMessage pushes the message to the dispatcher queue for each websocket.
         # So its ok to call this synchronously.
         with self.Lock:
             # If wsId is None, send to all websockets.
@@ -98,6 +105,111 @@ class ElegooWebsocketMux:
                     ws.OnIncomingMessage(buffer, optCode)
 
 
+# Fires the callbacks for all of the ElegooWebsocketClientProxy objects from a small shared set of threads.
+#
+# Each proxy has its own ordered event queue. When a proxy has events, it's put in the ready queue and a worker will fire its events in order.
+# A proxy is only ever handled by one worker at a time, so the events for each proxy are always fired in order, but different proxies can run in parallel.
+# Workers only fire so many events for a proxy before moving on to the next, so one busy proxy can't starve the others.
+#
+# If a proxy is ready and all of the workers are busy, like when a callback is slow, another worker is started so the other proxies aren't stalled.
+# The extra workers exit after they have been idle for a while.
+class ElegooWebsocketDispatcher:
+
+    # The number of worker threads that are always kept running.
+    c_MinWorkerThreadCount = 2
+
+    # The max number of worker threads, so a lot of slow callbacks can't create a lot of threads.
+    c_MaxWorkerThreadCount = 8
+
+    # How long a worker above the min count can be idle before it exits.
+    c_WorkerIdleTimeoutSec = 30.0
+
+    # The max number of events fired for one proxy before the worker moves on to the next proxy.
+    c_MaxEventsPerTurn = 20
+
+    def __init__(self, logger:logging.Logger):
+        self.Logger = logger
+        self.ReadyQueue = queue.Queue()
+        # All protected by the worker lock.
+        # IdleWorkerCount is the number of waiting workers that no ready proxy has been handed to yet.
+        # UnclaimedReadyCount is the number of ready proxies that no worker has been handed yet, which only happens when we are at the max workers.
+        self.WorkerLock = threading.Lock()
+        self.WorkerCount = 0
+        self.IdleWorkerCount = 0
+        self.UnclaimedReadyCount = 0
+        self.NextWorkerId = 0
+
+
+    # Queues an event for the proxy. The events for each proxy are fired in the order they are queued.
+    def QueueEvent(self, proxy:"ElegooWebsocketClientProxy", event:"ProxyEvent"):
+        with proxy.EventLock:
+            proxy.PendingEvents.append(event)
+            # If the proxy is already in the ready queue or being handled, the worker will get this event.
+            if proxy.IsScheduled:
+                return
+            proxy.IsScheduled = True
+        self._AddReadyProxy(proxy)
+
+
+    # Puts the proxy in the ready queue and makes sure there's a worker to handle it.
+    def _AddReadyProxy(self, proxy:"ElegooWebsocketClientProxy"):
+        self.ReadyQueue.put(proxy)
+        with self.WorkerLock:
+            # If there's an idle worker, it will get this proxy.
+            if self.IdleWorkerCount > 0:
+                self.IdleWorkerCount -= 1
+                return
+            # If we can't start another worker, the next worker that's done will get it.
+            if self.WorkerCount >= ElegooWebsocketDispatcher.c_MaxWorkerThreadCount:
+                self.UnclaimedReadyCount += 1
+                return
+            # Start a new worker, which will get this proxy.
+            self.WorkerCount += 1
+            self.NextWorkerId += 1
+            workerId = self.NextWorkerId
+        t = threading.Thread(target=self._Worker, name=f"ElegooWebsocketDispatcher-{workerId}")
+        t.daemon = True
+        t.start()
+
+
+    def _Worker(self):
+        while True:
+            try:
+                proxy:ElegooWebsocketClientProxy = self.ReadyQueue.get(timeout=ElegooWebsocketDispatcher.c_WorkerIdleTimeoutSec)
+            except queue.Empty:
+                with self.WorkerLock:
+                    # Only exit if we are above the min count and no ready proxy has been handed to the idle workers.
+                    if self.IdleWorkerCount > 0 and self.WorkerCount > ElegooWebsocketDispatcher.c_MinWorkerThreadCount:
+                        self.IdleWorkerCount -= 1
+                        self.WorkerCount -= 1
+                        return
+                continue
+            try:
+                isDrained = False
+                for _ in range(ElegooWebsocketDispatcher.c_MaxEventsPerTurn):
+                    with proxy.EventLock:
+                        if len(proxy.PendingEvents) == 0:
+                            proxy.IsScheduled = False
+                            isDrained = True
+                            break
+                        event = proxy.PendingEvents.popleft()
+                    proxy.HandleEvent(event)
+                # If there are still events, put the proxy at the back of the line, so the other proxies get a turn.
+                if isDrained is False:
+                    self._AddReadyProxy(proxy)
+            except Exception as e:
+                Sentry.Exception("ElegooWebsocketDispatcher worker exception.", e)
+                # Make sure the proxy isn't stuck as scheduled.
+                with proxy.EventLock:
+                    proxy.IsScheduled = False
+            # We are done, so either take a proxy that's waiting for a worker or go idle.
+            with self.WorkerLock:
+                if self.UnclaimedReadyCount > 0:
+                    self.UnclaimedReadyCount -= 1
+                else:
+                    self.IdleWorkerCount += 1
+
+
 # The proxy websocket states, to prevent double opening or closing.
 # This will only be progressed through once.
 class ProxyState:
@@ -106,7 +218,27 @@ class ProxyState:
     Closed = 2
 
 
+# The types of events the dispatcher fires for a proxy.
+class ProxyEventType:
+    Open = 0
+    Message = 1
+    Error = 2
+    Close = 3
+
+
+class ProxyEvent:
+    def __init__(self, eventType:int, buffer:bytearray = None, optCode = None, errorMsg:str = None, exception:Exception = None):
+        self.Type = eventType
+        self.Buffer = buffer
+        self.OptCode = optCode
+        self.ErrorMsg = errorMsg
+        self.Exception = exception
+
+
 # This class is a standin for the websocket client, so it must have matching public functions.
+#
+# The open and close state changes are done synchronously when they are called, but the callbacks are always fired from the mux's dispatcher,
+# in the same order as a real websocket would fire them. The callers can hold locks when they call open or close, so we can't call back into them directly.
 class ElegooWebsocketClientProxy():
 
     def __init__(self, mux:ElegooWebsocketMux, wsId:int, logger:logging.Logger, onWsOpen = None, onWsMsg = None, onWsData = None, onWsClose = None, onWsError = None, headers:dict = None, subProtocolList:list = None):
@@ -115,7 +247,11 @@ class ElegooWebsocketClientProxy():
         self.Logger = logger
         self.StateLock = threading.Lock()
         self.State:ProxyState = ProxyState.UnOpened
-        self.ReceiveQueue = queue.Queue()
+
+        # The events waiting to be fired by the dispatcher, protected by the event lock.
+        self.EventLock = threading.Lock()
+        self.PendingEvents = deque()
+        self.IsScheduled = False
 
         self.OnWsOpen = onWsOpen
         self.OnWsMsg = onWsMsg
@@ -137,63 +273,49 @@ class ElegooWebsocketClientProxy():
 
     # Runs the websocket async.
     def RunAsync(self):
-        def openThread():
-            try:
-                # Check if we can open or if we need to send a close.
-                if not self.Mux.ProxyOpen(self):
-                    self._DebugLog("Open blocked, the printer isn't connected.")
-                    self._fireErrorAndCloseAsync("Printer not connected.")
-                    return
-
-                # Check and update the state.
-                with self.StateLock:
-                    if self.State != ProxyState.UnOpened:
-                        raise Exception("Websocket already opened.")
-                    self.State = ProxyState.Open
+        # Check if we can open or if we need to send a close.
+        if not self.Mux.CanProxyOpen():
+            self._DebugLog("Open blocked, the printer isn't connected.")
+            self._FireErrorAndClose("Printer not connected.")
+            return
 
-                # Start the receive thread
-                self._startReceiveThread()
+        # Check and update the state.
+        with self.StateLock:
+            if self.State != ProxyState.UnOpened:
+                self._DebugLog("Open blocked, the websocket was already opened or closed.")
+                return
+            self.State = ProxyState.Open
 
-                # Fire the open callback.
-                self._DebugLog("Opening websocket.")
-                if self.OnWsOpen is not None:
-                    self.OnWsOpen(self)
-
-                # Tell the mux we are fully opened now.
-                self.Mux.ProxyOpened(self)
-            except Exception as e:
-                self._fireErrorAndCloseAsync("Exception in OnWsOpen callback.", e)
-        threading.Thread(target=openThread, name="ElegooWebsocketClientProxy-OpenThread").start()
+        # Queue the open event before we are added to the mux, so it's always fired before any messages.
+        self._DebugLog("Opening websocket.")
+        self.Mux.Dispatcher.QueueEvent(self, ProxyEvent(ProxyEventType.Open))
+        self.Mux.ProxyOpen(self)
 
 
     # Closes the websocket.
     def Close(self):
-        def closeThread():
-            # Check and update the state.
-            with self.StateLock:
-                # Check for closed, so all other states can close.
-                if self.State == ProxyState.Closed:
-                    self._DebugLog("Close blocked, the websocket is already closed.")
-                    return
-                self.State = ProxyState.Closed
+        self._Close(True)
 
-            # Close the receive queue
-            self.ReceiveQueue.put(ReceiveQueueContext(None, None, True))
 
-            self._DebugLog("Closing websocket.")
-            # First close the mux, so we don't get any more messages.
-            try:
-                self.Mux.ProxyClose(self)
-            except Exception as e:
-                self.Logger.error(f"ElegooWebsocketClientProxy failed to call ProxyClose. {e}")
+    # Closes the websocket, the close callback is only fired if fireCloseCallback is set.
+    def _Close(self, fireCloseCallback:bool):
+        # Check and update the state.
+        with self.StateLock:
+            # Check for closed, so all other states can close.
+            if self.State == ProxyState.Closed:
+                return
+            self.State = ProxyState.Closed
 
-            # Then call the close callback.
-            try:
-                if self.OnWsClose is not None:
-                    self.OnWsClose(self)
-            except Exception as e:
-                self.Logger.error(f"ElegooWebsocketClientProxy failed to call OnWsClose. {e}")
-        threading.Thread(target=closeThread, name="ElegooWebsocketClientProxy-CloseThread").start()
+        self._DebugLog("Closing websocket.")
+        # First close the mux, so we don't get any more messages.
+        try:
+            self.Mux.ProxyClose(self)
+        except Exception as e:
+            self.Logger.error(f"ElegooWebsocketClientProxy failed to call ProxyClose. {e}")
+
+        # Then fire the close callback.
+        if fireCloseCallback:
+            self.Mux.Dispatcher.QueueEvent(self, ProxyEvent(ProxyEventType.Close))
 
 
     def Send(self, buffer:bytearray, msgStartOffsetBytes:int = None, msgSize:int = None, isData:bool = True):
@@ -216,7 +338,7 @@ class ElegooWebsocketClientProxy():
         result = self.Mux.ProxySend(self, buffer, msgStartOffsetBytes, msgSize, optCode)
         if result is False:
             # If it fails, close the websocket.
-            self._fireErrorAndCloseAsync("Failed to send websocket message.")
+            self._FireErrorAndClose("Failed to send websocket message.")
 
 
     # Support using with:
@@ -232,10 +354,11 @@ class ElegooWebsocketClientProxy():
             pass
 
 
-    # When the object is deleted, make sure the threads are cleaned up.
+    # When the object is deleted, make sure the mux is cleaned up.
+    # No events are queued from here, since the finalizer can run on any thread at any time and there's no one left to get the callback.
     def __del__(self):
         try:
-            self.Close()
+            self._Close(False)
         except Exception:
             pass
 
@@ -249,65 +372,72 @@ class ElegooWebsocketClientProxy():
         return self.Id
 
 
+    # Returns True if the websocket is in the open state.
+    def IsOpen(self) -> bool:
+        return self.State == ProxyState.Open
+
+
     # Called by the ElegooWebsocketMux when a message is received.
     def OnIncomingMessage(self, buffer:bytearray, optCode = octowebsocket.ABNF.OPCODE_BINARY):
-        self.ReceiveQueue.put(ReceiveQueueContext(buffer, optCode))
-
+        self.Mux.Dispatcher.QueueEvent(self, ProxyEvent(ProxyEventType.Message, buffer, optCode))
 
-    # To emulate the websocket client, we send messages on a thread in the order they are received.
-    def _startReceiveThread(self):
-        def receiveThread():
-            try:
-                while self.State == ProxyState.Open:
-                    # Get the next context, blocking until we have one.
-                    context:ReceiveQueueContext = self.ReceiveQueue.get()
-                    if context is None:
-                        raise Exception("ReceiveQueueContext is None.")
-                    if context.IsClose:
-                        return
 
-                     # Do a unlocked state check, to ensure we are open.
-                    if self.State != ProxyState.Open:
-                        self._DebugLog("Message receive blocked, the websocket is not open.")
-                        return
+    # Called by the dispatcher to fire the callbacks for an event.
+    # This is only ever called by one dispatcher thread at a time for each proxy, in the order the events were queued.
+    def HandleEvent(self, event:ProxyEvent):
+        try:
+            if event.Type == ProxyEventType.Message:
+                # Do a unlocked state check, to ensure we are open.
+                if self.State != ProxyState.Open:
+                    self._DebugLog("Message receive blocked, the websocket is not open.")
+                    return
+                self._DebugLog("Received message.")
+                # Just like in the WS logic, fire date first then msg
+                if self.OnWsData is not None:
+                    self.OnWsData(self, event.Buffer, event.OptCode)
+                # First message first, with just the buffer.
+                if self.OnWsMsg is not None:
+                    self.OnWsMsg(self, event.Buffer)
+
+            elif event.Type == ProxyEventType.Open:
+                # If we were closed before the open was fired, the close event will be fired next.
+                if self.State != ProxyState.Open:
+                    return
+                if self.OnWsOpen is not None:
+                    self.OnWsOpen(self)
+                # Tell the mux we are fully opened now.
+                self.Mux.ProxyOpened(self)
 
-                    self._DebugLog("Received message.")
-                    # Just like in the WS logic, fire date first then msg
-                    if self.OnWsData is not None:
-                        self.OnWsData(self, context.Buffer, context.OptCode)
+            elif event.Type == ProxyEventType.Error:
+                try:
+                    self._DebugLog(f"Error: {event.ErrorMsg}")
+                    if self.OnWsError is not None:
+                        self.OnWsError(self, Exception(event.ErrorMsg, event.Exception))
+                except Exception as e:
+                    self.Logger.error(f"ElegooWebsocketClientProxy failed to call OnWsError. {e}")
 
-                    # First message first, with just the buffer.
-                    if self.OnWsMsg is not None:
-                        self.OnWsMsg(self, context.Buffer)
+            elif event.Type == ProxyEventType.Close:
+                try:
+                    if self.OnWsClose is not None:
+                        self.OnWsClose(self)
+                except Exception as e:
+                    self.Logger.error(f"ElegooWebsocketClientProxy failed to call OnWsClose. {e}")
 
-            except Exception as e:
-                self._fireErrorAndCloseAsync("Exception in ReceiveThread.", e)
-        threading.Thread(target=receiveThread, name="ElegooWebsocketClientProxy-ReceiveThread").start()
+        except Exception as e:
+            self._FireErrorAndClose(f"Exception in event {event.Type} callback.", e)
 
 
     # A helper to handle all errors and make sure we are closed.
-    def _fireErrorAndCloseAsync(self, msg:str, exception:Exception = None):
-        def errorThread():
-            # First the error callback.
-            try:
-                self._DebugLog(f"Error: {msg}")
-                if self.OnWsError is not None:
-                    self.OnWsError(self, Exception(msg, exception))
-            except Exception as e:
-                self.Logger.error(f"ElegooWebsocketClientProxy failed to call OnWsError. {e}")
-
-            # First next close.
-            self.Close()
-        threading.Thread(target=errorThread, name="ElegooWebsocketClientProxy-ErrorThread").start()
+    # The error callback will always be fired before the close callback.
+    def _FireErrorAndClose(self, msg:str, exception:Exception = None):
+        # If we are already closed, the close callback has already been queued, so don't fire an error after it.
+        if self.State == ProxyState.Closed:
+            self._DebugLog(f"Error after close: {msg}")
+            return
+        self.Mux.Dispatcher.QueueEvent(self, ProxyEvent(ProxyEventType.Error, errorMsg=msg, exception=exception))
+        self.Close()
 
 
     # Logging helper.
     def _DebugLog(self, msg:str):
         self.Logger.debug("MuxSock [%d] - %s", self.Id, msg)
-
-
-class ReceiveQueueContext:
-    def __init__(self, buffer:bytearray, optCode, isClose = False):
-        self.Buffer = buffer
-        self.OptCode = optCode
-        self.IsClose = isClose
@@ -2,10 +2,12 @@ import os
 import ssl
 import time
 import json
+import errno
 import random
 import string
 import socket
 import logging
+import selectors
 import threading
 from typing import List
 
@@ -64,6 +66,10 @@ class NetworkSearch:
     # The default port the elegoo WebSocket & http server runs on.
     c_ElegooDefaultPortStr = "3030"
 
+    # How long we wait for the TCP connects of the port scan, which is the first phase of the scan.
+    # This is a local LAN, so anything that's there will accept the connection well before this.
+    c_PortScanTimeoutSec = 1.5
+
 
     # Scans the local IP LAN subset for Bambu servers that successfully authorize given the access code and printer sn.
     # Thread count and delay can be used to control how aggressive the scan is.
@@ -72,7 +78,9 @@ class NetworkSearch:
         def callback(ip:str):
             return NetworkSearch.ValidateConnection_Bambu(logger, ip, accessCode, printerSn, portStr, timeoutSec=5)
         # We want to return if any one IP is found, since there can only be one printer that will match the printer 100% correct.
-        return NetworkSearch._ScanForInstances(logger, callback, returnAfterNumberFound=1, threadCount=threadCount, perThreadDelaySec=delaySec)
+        if portStr is None:
+            portStr = NetworkSearch.c_BambuDefaultPortStr
+        return NetworkSearch._ScanForInstances(logger, callback, int(portStr), returnAfterNumberFound=1, threadCount=threadCount, perThreadDelaySec=delaySec)
 
 
     # Scans the local IP LAN subset for Elegoo 3D printers.
@@ -93,7 +101,9 @@ class NetworkSearch:
         returnAfterNumberFound = 0
         if mainboardId is not None:
             returnAfterNumberFound = 1
-        NetworkSearch._ScanForInstances(logger, callback, returnAfterNumberFound=returnAfterNumberFound, threadCount=threadCount, perThreadDelaySec=delaySec)
+        if portStr is None:
+            portStr = NetworkSearch.c_ElegooDefaultPortStr
+        NetworkSearch._ScanForInstances(logger, callback, int(portStr), returnAfterNumberFound=returnAfterNumberFound, threadCount=threadCount, perThreadDelaySec=delaySec)
 
         # See if we found anything.
         if len(foundPrinters) == 0:
@@ -367,10 +377,12 @@ class NetworkSearch:
 
 
     # Scans the IP subset for server instances.
+    # The scan is done in two phases. First we try a TCP connect to the port on every IP at once, which quickly finds the few IPs that have something listening.
+    # Then the full protocol test is only done on those IPs, so we don't spend our time and threads waiting on connect timeouts for IPs with nothing there.
     # testConFunction must be a function func(ip:str) -> NetworkValidationResult
     # Returns a list of IPs that reported Success() == True
     @staticmethod
-    def _ScanForInstances(logger:logging.Logger, testConFunction, returnAfterNumberFound:int=0, threadCount:int=None, perThreadDelaySec:float=0.0) -> List[str]:
+    def _ScanForInstances(logger:logging.Logger, testConFunction, port:int, returnAfterNumberFound:int=0, threadCount:int=None, perThreadDelaySec:float=0.0) -> List[str]:
         foundIps = []
         try:
             localIp = NetworkSearch._TryToGetLocalIp()
@@ -401,12 +413,25 @@ class NetworkSearch:
                 logger.debug("Low resource device detected, limiting threads to 30.")
                 totalThreads = 30
 
-            outstandingIpsToCheck = []
+            allIps = []
             counter = 0
             while counter < 255:
                 # The first IP will be 1, the last 255
                 counter += 1
-                outstandingIpsToCheck.append(ipPrefix + str(counter))
+                allIps.append(ipPrefix + str(counter))
+
+            # Do the port scan to find which IPs we need to test.
+            # The IPs are popped off the end of the list, so keep them in the same order as before.
+            outstandingIpsToCheck = NetworkSearch._FindIpsWithOpenPort(logger, allIps, port, NetworkSearch.c_PortScanTimeoutSec)
+            if outstandingIpsToCheck is None:
+                # If the port scan failed, fallback to testing all of the IPs.
+                outstandingIpsToCheck = allIps
+            logger.debug(f"Port scan found {len(outstandingIpsToCheck)} IPs with port {port} open.")
+            if len(outstandingIpsToCheck) == 0:
+                return foundIps
+
+            # There's no reason to start more threads than there are IPs to test.
+            totalThreads = min(totalThreads, len(outstandingIpsToCheck))
 
             # Start the threads
             # We must use arrays so they get captured by ref in the threads.
@@ -482,6 +507,54 @@ class NetworkSearch:
         return foundIps
 
 
+    # Starts a non-blocking TCP connect to the port on all of the IPs at once, and waits up to the timeout for them to connect.
+    # Returns the IPs that accepted the connection, in the same order they were passed.
+    # Returns None if the port scan failed, so the caller can fallback to testing all of the IPs.
+    @staticmethod
+    def _FindIpsWithOpenPort(logger:logging.Logger, ips:List[str], port:int, timeoutSec:float) -> List[str]:
+        openIps = set()
+        pendingSockets = []
+        sel = None
+        try:
+            sel = selectors.DefaultSelector()
+            for ip in ips:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                pendingSockets.append(s)
+                s.setblocking(False)
+                err = s.connect_ex((ip, port))
+                if err == 0:
+                    openIps.add(ip)
+                elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                    sel.register(s, selectors.EVENT_WRITE, ip)
+                # Anything else means the connect failed right away, like the host is unreachable.
+
+            # Wait for the connects to finish. When the socket is writable, the connect is done, but it might have failed.
+            deadline = time.time() + timeoutSec
+            pendingCount = len(sel.get_map())
+            while pendingCount > 0:
+                remainingSec = deadline - time.time()
+                if remainingSec <= 0:
+                    break
+                for key, _ in sel.select(remainingSec):
+                    sel.unregister(key.fileobj)
+                    pendingCount -= 1
+                    if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                        openIps.add(key.data)
+            return [ip for ip in ips if ip in openIps]
+        except Exception as e:
+            logger.debug(f"Port scan failed, all IPs will be tested. {e}")
+            return None
+        finally:
+            # Ensure we always close all of the sockets, since there are a lot of them.
+            for s in pendingSockets:
+                try:
+                    s.close()
+                except Exception:
+                    pass
+            if sel is not None:
+                sel.close()
+
+
     @staticmethod
     def _TryToGetLocalIp() -> str:
         # Find the local IP. Works on Windows and Linux. Always gets the correct routable IP.
@@ -1,13 +1,40 @@
+import os
+import json
 import logging
+import threading
+from collections import OrderedDict
+
+from octoeverywhere.sentry import Sentry
 
 # A helper class that caches known file metadata info, so we don't have to pull it often.
+#
+# The cache holds the metadata for the most recently used files, and it's saved to disk so it survives restarts.
+# Each entry is keyed by the file name, modified time, and size, so an entry can only be used for the exact file it was made from.
+# We keep the modified time and size of all of the files from Moonraker's file list, which is pulled when the websocket connects and
+# kept up to date with `notify_filelist_changed`. That's all we need to tell if an entry is still valid, so entries are never revalidated
+# with a metadata RPC. Until the file list is pulled, entries loaded from disk are trusted, and any that are stale are dropped once it is.
 class FileMetadataCache:
 
+    # The max number of files we will keep metadata for.
+    c_MaxEntries = 50
+
+    # The file name the cache is persisted to in the local storage folder.
+    c_CacheFileName = "FileMetadataCache.json"
+
+    # Json keys for each entry.
+    c_EstimatedPrintTimeSecKey = "EstimatedPrintTimeSec"
+    c_EstimatedFilamentUsageMmKey = "EstimatedFilamentUsageMm"
+    c_FileSizeKBytesKey = "FileSizeKBytes"
+    c_LayerCountKey = "LayerCount"
+    c_FirstLayerHeightKey = "FirstLayerHeight"
+    c_LayerHeightKey = "LayerHeight"
+    c_ObjectHeightKey = "ObjectHeight"
+
     _Instance = None
 
     @staticmethod
-    def Init(logger:logging.Logger, moonrakerClient):
-        FileMetadataCache._Instance = FileMetadataCache(logger, moonrakerClient)
+    def Init(logger:logging.Logger, moonrakerClient, localStorageDir:str):
+        FileMetadataCache._Instance = FileMetadataCache(logger, moonrakerClient, localStorageDir)
 
 
     @staticmethod
@@ -15,105 +42,176 @@ class FileMetadataCache:
         return FileMetadataCache._Instance
 
 
-    def __init__(self, logger:logging.Logger, moonrakerClient) -> None:
+    def __init__(self, logger:logging.Logger, moonrakerClient, localStorageDir:str) -> None:
         self.Logger = logger
         self.MoonrakerClient = moonrakerClient
-        self.FileName:str = None
-        self.EstimatedPrintTimeSec:float = -1.0
-        self.EstimatedFilamentUsageMm:int = -1
-        self.FileSizeKBytes:int = -1
-        self.LayerCount:float = -1.0
-        self.FirstLayerHeight:float = -1.0
-        self.LayerHeight:float = -1.0
-        self.ObjectHeight:float = -1.0
-        self.ResetCache()
-
-
-    # Clears the cache from all current values.
-    def ResetCache(self):
-        self.FileName = None
-        self.EstimatedPrintTimeSec = -1.0
-        self.EstimatedFilamentUsageMm = -1
-        self.FileSizeKBytes = -1
-        self.LayerCount = -1.0
-        self.FirstLayerHeight = -1.0
-        self.LayerHeight = -1.0
-        self.ObjectHeight = -1.0
+        self.CacheFilePath = os.path.join(localStorageDir, FileMetadataCache.c_CacheFileName)
+        self.Lock = threading.Lock()
+        # Maps the (file name, modified, size) key to the metadata entry dict, in least recently used order.
+        self.Entries:OrderedDict = OrderedDict()
+        # Maps the file name to the (modified, size) from the Moonraker file list.
+        # This is None until we have pulled the file list, which means we can't validate entries yet.
+        self.FileStats:dict = None
+        # Serializes writes to the cache file.
+        self.SaveLock = threading.Lock()
+        self._LoadFromDisk()
+
+
+    # Called when the Moonraker websocket connects. Since we might have missed file change notifications while
+    # we were disconnected, pull the file list again and drop any entries that don't match it.
+    def OnMoonrakerWsOpened(self):
+        try:
+            self._SyncFileList()
+        except Exception as e:
+            Sentry.Exception("FileMetadataCache OnMoonrakerWsOpened exception.", e)
+
+
+    # Called by the MoonrakerClient when it gets a `notify_filelist_changed` message.
+    # The file stats are updated from the message, which makes any entry for an old version of the file unusable.
+    def OnFileListChanged(self, msg:dict):
+        try:
+            params = msg.get("params", None)
+            if params is None or len(params) == 0:
+                return
+            change = params[0]
+            action = change.get("action", "")
+            # If a directory changed or the root was updated, we don't know which files changed, so pull the file list again.
+            # This is called from the websocket thread, so we can't wait on the RPC here.
+            if action.endswith("_dir") or action == "root_update":
+                t = threading.Thread(target=self.OnMoonrakerWsOpened, name="FileMetadataCacheSync")
+                t.daemon = True
+                t.start()
+                return
+            removed = False
+            with self.Lock:
+                # The source item is the old path of a moved file, it's removed.
+                source = change.get("source_item", None)
+                if source is not None and source.get("root", "gcodes") == "gcodes":
+                    removed = self._RemoveFile(source.get("path", None)) or removed
+                item = change.get("item", None)
+                if item is not None and item.get("root", "gcodes") == "gcodes":
+                    path = item.get("path", None)
+                    if action == "delete_file":
+                        removed = self._RemoveFile(path) or removed
+                    elif path is not None:
+                        stats = (item.get("modified", None), item.get("size", None))
+                        if self.FileStats is not None:
+                            self.FileStats[path] = stats
+                        removed = self._RemoveStaleEntries(path, stats) or removed
+            if removed:
+                self._SaveToDisk()
+        except Exception as e:
+            Sentry.Exception("FileMetadataCache OnFileListChanged exception.", e)
 
 
     # If the estimated time for the print can be gotten from the file metadata, this will return it.
     # It it's not known, returns -1.0
     def GetEstimatedPrintTimeSec(self, filename:str) -> float:
-        # Check to see if we have checked for this file before.
-        if self.FileName is not None:
-            # Check if it's the same file, case sensitive.
-            if self.FileName == filename:
-                # Return the last result, this maybe valid or not.
-                return self.EstimatedPrintTimeSec
-
-        # The filename changed or we don't have one at all, do a refresh now.
-        self._RefreshFileMetaDataCache(filename)
-
-        # Return the value, which could still be -1 if it failed.
-        return self.EstimatedPrintTimeSec
+        return self._GetEntry(filename).get(FileMetadataCache.c_EstimatedPrintTimeSecKey, -1.0)
 
 
     # If the filament usage can be gotten from the file metadata, this will return it.
     # It it's not known, returns -1
     def GetEstimatedFilamentUsageMm(self, filename:str) -> int:
-        # Check to see if we have checked for this file before.
-        if self.FileName is not None:
-            # Check if it's the same file, case sensitive.
-            if self.FileName == filename:
-                # Return the last result, this maybe valid or not.
-                return self.EstimatedFilamentUsageMm
-
-        # The filename changed or we don't have one at all, do a refresh now.
-        self._RefreshFileMetaDataCache(filename)
-
-        # Return the value, which could still be -1 if it failed.
-        return self.EstimatedFilamentUsageMm
+        return self._GetEntry(filename).get(FileMetadataCache.c_EstimatedFilamentUsageMmKey, -1)
 
 
     # If the file size can be gotten from the file metadata, this will return it.
     # It it's not known, returns -1
     def GetFileSizeKBytes(self, filename:str) -> int:
-        # Check to see if we have checked for this file before.
-        if self.FileName is not None:
-            # Check if it's the same file, case sensitive.
-            if self.FileName == filename:
-                # Return the last result, this maybe valid or not.
-                return self.FileSizeKBytes
-
-        # The filename changed or we don't have one at all, do a refresh now.
-        self._RefreshFileMetaDataCache(filename)
-
-        # Return the value, which could still be -1 if it failed.
-        return self.FileSizeKBytes
+        return self._GetEntry(filename).get(FileMetadataCache.c_FileSizeKBytesKey, -1)
 
 
     # If the file size can be gotten from the file metadata, this will return it.
     # Any of the values will return -1 if they are unknown.
     def GetLayerInfo(self, filename:str):
-        # Check to see if we have checked for this file before.
-        if self.FileName is not None:
-            # Check if it's the same file, case sensitive.
-            if self.FileName == filename:
-                # Return the last result, this maybe valid or not.
-                return (self.LayerCount, self.LayerHeight, self.FirstLayerHeight, self.ObjectHeight)
-
-        # The filename changed or we don't have one at all, do a refresh now.
-        self._RefreshFileMetaDataCache(filename)
-
-        # Return the value, which could still be -1 if it failed.
-        return (self.LayerCount, self.LayerHeight, self.FirstLayerHeight, self.ObjectHeight)
+        entry = self._GetEntry(filename)
+        return (entry.get(FileMetadataCache.c_LayerCountKey, -1.0), entry.get(FileMetadataCache.c_LayerHeightKey, -1.0),
+                entry.get(FileMetadataCache.c_FirstLayerHeightKey, -1.0), entry.get(FileMetadataCache.c_ObjectHeightKey, -1.0))
+
+
+    # Returns the entry for the file name, this will always return a dict, but it might be empty if the metadata couldn't be found.
+    # If we have an entry for the current version of the file, it's returned right away, otherwise this will block on the metadata RPC.
+    def _GetEntry(self, filename:str) -> dict:
+        if filename is None:
+            return {}
+        with self.Lock:
+            key = self._FindEntryKey(filename)
+            if key is not None:
+                self.Entries.move_to_end(key)
+                return self.Entries[key]
+
+        # We don't have metadata for this version of the file, so we need to get it now.
+        entry = self._RefreshFileMetaDataCache(filename)
+        if entry is None:
+            return {}
+        return entry
+
+
+    # Pulls the Moonraker file list and drops any entries that don't match the current files.
+    def _SyncFileList(self) -> None:
+        result = self.MoonrakerClient.SendJsonRpcRequest("server.files.list",
+        {
+            "root": "gcodes"
+        })
+        if result.HasError():
+            self.Logger.error("FileMetadataCache failed to get the file list. "+result.GetLoggingErrorStr())
+            return
+        fileStats = {}
+        for f in result.GetResult():
+            path = f.get("path", None)
+            if path is not None:
+                fileStats[path] = (f.get("modified", None), f.get("size", None))
+        with self.Lock:
+            self.FileStats = fileStats
+            staleKeys = [k for k in self.Entries if fileStats.get(k[0], None) != (k[1], k[2])]
+            for k in staleKeys:
+                del self.Entries[k]
+        if len(staleKeys) > 0:
+            self.Logger.debug(f"FileMetadataCache dropped {len(staleKeys)} entries for files that changed or were removed.")
+            self._SaveToDisk()
+
+
+    # Returns the entry key for the current version of the file, or None if there isn't one. Must be called with the lock held.
+    # If we don't have the file list yet, the most recently used entry for the file name is trusted.
+    def _FindEntryKey(self, filename:str):
+        if self.FileStats is not None:
+            stats = self.FileStats.get(filename, None)
+            if stats is None:
+                return None
+            key = (filename, stats[0], stats[1])
+            return key if key in self.Entries else None
+        for key in reversed(self.Entries):
+            if key[0] == filename:
+                return key
+        return None
+
+
+    # Removes the file from the file stats and drops any entries for it. Must be called with the lock held.
+    # Returns True if any entries were removed.
+    def _RemoveFile(self, filename:str) -> bool:
+        if filename is None:
+            return False
+        if self.FileStats is not None:
+            self.FileStats.pop(filename, None)
+        keys = [k for k in self.Entries if k[0] == filename]
+        for k in keys:
+            del self.Entries[k]
+        return len(keys) > 0
+
+
+    # Drops any entries for the file name that don't match the given (modified, size) stats. Must be called with the lock held.
+    # Returns True if any entries were removed.
+    def _RemoveStaleEntries(self, filename:str, stats:tuple) -> bool:
+        keys = [k for k in self.Entries if k[0] == filename and (k[1], k[2]) != stats]
+        for k in keys:
+            del self.Entries[k]
+        return len(keys) > 0
 
 
     # Does a refresh of the file name metadata cache.
-    def _RefreshFileMetaDataCache(self, filename:str) -> None:
-
-        # Reset everything.
-        self.ResetCache()
+    # Returns the new entry or None on failure.
+    def _RefreshFileMetaDataCache(self, filename:str) -> dict:
 
         # Make the call.
         result = self.MoonrakerClient.SendJsonRpcRequest("server.files.metadata",
@@ -124,41 +222,96 @@ class FileMetadataCache:
         # If we fail this call, just return, which will keep the cache invalid.
         if result.HasError():
             self.Logger.error("_RefreshFileMetaDataCache failed to get file meta. "+result.GetLoggingErrorStr())
-            return
+            return None
 
         # If we got here, we know we got a good result.
         # Set the cached vars so we don't call again, even though we might not be able to get them, meaning the file doesn't have them.
-        self.FileName = filename
+        entry = {
+            FileMetadataCache.c_EstimatedPrintTimeSecKey: -1.0,
+            FileMetadataCache.c_EstimatedFilamentUsageMmKey: -1,
+            FileMetadataCache.c_FileSizeKBytesKey: -1,
+            FileMetadataCache.c_LayerCountKey: -1.0,
+            FileMetadataCache.c_FirstLayerHeightKey: -1.0,
+            FileMetadataCache.c_LayerHeightKey: -1.0,
+            FileMetadataCache.c_ObjectHeightKey: -1.0,
+        }
 
         # Get the value, if it exists and it's valid.
         res = result.GetResult()
         if "estimated_time" in res:
             value = float(res["estimated_time"])
             if value > 0.001:
-                self.EstimatedPrintTimeSec = value
+                entry[FileMetadataCache.c_EstimatedPrintTimeSecKey] = value
         if "size" in res:
             value = int(res["size"])
             if value > 0:
-                self.FileSizeKBytes = int(value / 1024)
+                entry[FileMetadataCache.c_FileSizeKBytesKey] = int(value / 1024)
         if "filament_total" in res:
             value = int(res["filament_total"])
             if value > 0:
-                self.EstimatedFilamentUsageMm = value
+                entry[FileMetadataCache.c_EstimatedFilamentUsageMmKey] = value
         if "layer_count" in res and res["layer_count"] is not None:
             value = float(res["layer_count"])
             if value > 0:
-                self.LayerCount = value
+                entry[FileMetadataCache.c_LayerCountKey] = value
         if "first_layer_height" in res and res["first_layer_height"] is not None:
             value = float(res["first_layer_height"])
             if value > 0:
-                self.FirstLayerHeight = value
+                entry[FileMetadataCache.c_FirstLayerHeightKey] = value
         if "layer_height" in res and res["layer_height"] is not None:
             value = float(res["layer_height"])
             if value > 0:
-                self.LayerHeight = value
+                entry[FileMetadataCache.c_LayerHeightKey] = value
         if "object_height" in res and res["object_height"] is not None:
             value = float(res["object_height"])
             if value > 0:
-                self.ObjectHeight = value
-
-        self.Logger.info(f"FileMetadataCache updated for file [{filename}]; est time: {str(self.EstimatedPrintTimeSec)}, size: {str(self.FileSizeKBytes)}, filament usage: {str(self.EstimatedFilamentUsageMm)}")
+                entry[FileMetadataCache.c_ObjectHeightKey] = value
+
+        # Add the entry and trim the cache if needed.
+        # The metadata has the modified time and size of the file, so it's keyed to the version of the file we got it from.
+        # Since that's the newest version we know of, also update the file stats and drop any entries for older versions.
+        key = (filename, res.get("modified", None), res.get("size", None))
+        with self.Lock:
+            changed = self.Entries.get(key, None) != entry
+            if self.FileStats is not None:
+                self.FileStats[filename] = (key[1], key[2])
+            changed = self._RemoveStaleEntries(filename, (key[1], key[2])) or changed
+            self.Entries[key] = entry
+            self.Entries.move_to_end(key)
+            while len(self.Entries) > FileMetadataCache.c_MaxEntries:
+                self.Entries.popitem(last=False)
+        if changed:
+            self._SaveToDisk()
+            self.Logger.info(f"FileMetadataCache updated for file [{filename}]; est time: {str(entry[FileMetadataCache.c_EstimatedPrintTimeSecKey])}, size: {str(entry[FileMetadataCache.c_FileSizeKBytesKey])}, filament usage: {str(entry[FileMetadataCache.c_EstimatedFilamentUsageMmKey])}")
+        return entry
+
+
+    # Loads the cache from disk, if there is one.
+    def _LoadFromDisk(self) -> None:
+        try:
+            if os.path.exists(self.CacheFilePath) is False:
+                return
+            with open(self.CacheFilePath, encoding="utf-8") as f:
+                data = json.load(f)
+            # The entries are saved as a list in LRU order.
+            with self.Lock:
+                for item in data.get("Entries", []):
+                    fileName = item.get("FileName", None)
+                    entry = item.get("Entry", None)
+                    if fileName is not None and isinstance(entry, dict):
+                        self.Entries[(fileName, item.get("Modified", None), item.get("Size", None))] = entry
+            self.Logger.debug(f"FileMetadataCache loaded {len(self.Entries)} entries from disk.")
+        except Exception as e:
+            self.Logger.warning(f"FileMetadataCache failed to load from disk. {e}")
+
+
+    # Saves the current cache to disk.
+    def _SaveToDisk(self) -> None:
+        try:
+            with self.Lock:
+                entries = [{ "FileName": key[0], "Modified": key[1], "Size": key[2], "Entry": entry } for key, entry in self.Entries.items()]
+            with self.SaveLock:
+                with open(self.CacheFilePath, encoding="utf-8", mode="w") as f:
+                    f.write(json.dumps({ "Entries": entries }))
+        except Exception as e:
+            self.Logger.warning(f"FileMetadataCache failed to save to disk. {e}")
@@ -11,6 +11,7 @@ import octowebsocket
 
 from octoeverywhere.compat import Compat
 from octoeverywhere.sentry import Sentry
+from octoeverywhere.jsoncodec import JsonCodec
 from octoeverywhere.websocketimpl import Client
 from octoeverywhere.notificationshandler import NotificationsHandler
 from octoeverywhere.exceptions import NoSentryReportException
@@ -75,6 +76,18 @@ class MoonrakerClient:
     # If enabled, this prints all of the websocket messages sent and received.
     WebSocketMessageDebugging = False
 
+    # The notification methods we handle, any other notification is dropped without being fully parsed.
+    # Some notifications, like notify_proc_stat_update, are sent every second and we never use them.
+    # If a new notification is handled in _onWsMsg or _OnWsNonResponseMessage, it must be added here!
+    c_HandledNotificationMethods = frozenset([
+        "notify_klippy_disconnected",
+        "notify_klippy_shutdown",
+        "notify_history_changed",
+        "notify_status_update",
+        "notify_webcams_changed",
+        "notify_filelist_changed",
+    ])
+
     @staticmethod
     def Init(logger, config, moonrakerConfigFilePath:str, printerId:str, connectionStatusHandler, pluginVersionStr:str):
         MoonrakerClient._Instance = MoonrakerClient(logger, config, moonrakerConfigFilePath, printerId, connectionStatusHandler, pluginVersionStr)
@@ -260,72 +273,100 @@ class MoonrakerClient:
     # https://moonraker.readthedocs.io/en/latest/web_api/#websocket-setup
     #
     def SendJsonRpcRequest(self, method:str, paramsDict = None) -> JsonRpcResponse:
-        msgId = 0
-        waitContext = None
-        with self.JsonRpcIdLock:
-            # Get our unique ID
-            msgId = self.JsonRpcIdCounter
-            self.JsonRpcIdCounter += 1
+        return self.SendJsonRpcRequestBatch([(method, paramsDict)])[0]
 
-            # Add our waiting context.
-            waitContext = JsonRpcWaitingContext(msgId)
-            self.JsonRpcWaitingContexts[msgId] = waitContext
 
-        # From now on, we need to always make sure to clean up the wait context, even in error.
+    # Sends a list of rpc requests via the connected websocket and blocks until all of the responses are received or the requests time out.
+    # requests must be a list of (method:str, paramsDict) tuples, the params can be None.
+    # This will not throw, it will always return a list of JsonRpcResponse objects in the same order as the requests.
+    #
+    # All of the requests are written to the websocket back to back before we wait on any of them, so the whole batch only costs
+    # about one round trip. We don't use JSON-RPC batch arrays, so we don't depend on the connected Moonraker version supporting them.
+    def SendJsonRpcRequestBatch(self, requests:list) -> list:
+        waitContexts = []
+        with self.JsonRpcIdLock:
+            for _ in requests:
+                # Get our unique ID
+                msgId = self.JsonRpcIdCounter
+                self.JsonRpcIdCounter += 1
+
+                # Add our waiting context.
+                waitContext = JsonRpcWaitingContext(msgId)
+                self.JsonRpcWaitingContexts[msgId] = waitContext
+                waitContexts.append(waitContext)
+
+        # From now on, we need to always make sure to clean up the wait contexts, even in error.
+        responses = [None] * len(requests)
         try:
-            # Create the request object
-            obj = {
-                "jsonrpc": "2.0",
-                "method": method,
-                "id": msgId
-            }
-            # Add the params, if there are any.
-            if paramsDict is not None:
-                obj["params"] = paramsDict
-
-            # Try to send. default=str makes the json dump use the str function if it fails to serialize something.
-            jsonStr = json.dumps(obj, default=str)
-            if self._WebSocketSend(jsonStr) is False:
-                self.Logger.info("Moonraker client failed to send JsonRPC request "+method)
-                return JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_WS_NOT_CONNECTED)
-
-            # Wait for a response
-            waitContext.GetEvent().wait(MoonrakerClient.RequestTimeoutSec)
-
-            # Check if we got a result.
-            result = waitContext.GetResult()
-            if result is None:
-                self.Logger.info("Moonraker client timeout while waiting for request. "+str(id)+" "+method)
-                return JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_TIMEOUT)
-
-            # Check for an error if found, return the error state.
-            if "error" in result:
-                # Get the error parts
-                errorCode = JsonRpcResponse.OE_ERROR_EXCEPTION
-                errorStr = "Unknown"
-                if "code" in result["error"]:
-                    errorCode = result["error"]["code"]
-                if "message" in result["error"]:
-                    errorStr = result["error"]["message"]
-                return JsonRpcResponse(None, errorCode, errorStr)
-
-            # If there's a result, return the entire response
-            if "result" in result:
-                return JsonRpcResponse(result["result"])
-
-            # Finally, both are missing?
-            self.Logger.error("Moonraker client json rpc got a response that didn't have an error or result object? "+json.dumps(result))
-            return JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_EXCEPTION, "No result or error object")
+            # Send all of the requests before waiting on any of them.
+            for i, (method, paramsDict) in enumerate(requests):
+                try:
+                    # Create the request object
+                    obj = {
+                        "jsonrpc": "2.0",
+                        "method": method,
+                        "id": waitContexts[i].Id
+                    }
+                    # Add the params, if there are any.
+                    if paramsDict is not None:
+                        obj["params"] = paramsDict
+
+                    # Try to send. The codec uses the str function if it fails to serialize something.
+                    jsonStr = JsonCodec.Dumps(obj)
+                    if self._WebSocketSend(jsonStr) is False:
+                        self.Logger.info("Moonraker client failed to send JsonRPC request "+method)
+                        responses[i] = JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_WS_NOT_CONNECTED)
+                except Exception as e:
+                    Sentry.Exception("Moonraker client json rpc request failed to send.", e)
+                    responses[i] = JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_EXCEPTION, str(e))
+
+            # Wait for the responses, all of the requests share the same timeout.
+            deadlineSec = time.time() + MoonrakerClient.RequestTimeoutSec
+            for i, (method, _) in enumerate(requests):
+                if responses[i] is not None:
+                    continue
+                waitContexts[i].GetEvent().wait(max(0.0, deadlineSec - time.time()))
+                responses[i] = self._GetJsonRpcResponse(waitContexts[i], method)
+            return responses
 
         except Exception as e:
-            Sentry.Exception("Moonraker client json rpc request failed to send.", e)
-            return JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_EXCEPTION, str(e))
+            Sentry.Exception("Moonraker client json rpc batch request failed.", e)
+            return [r if r is not None else JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_EXCEPTION, str(e)) for r in responses]
 
         finally:
             # Before leaving, always clean up any waiting contexts.
             with self.JsonRpcIdLock:
-                if msgId in self.JsonRpcWaitingContexts:
-                    del self.JsonRpcWaitingContexts[msgId]
+                for waitContext in waitContexts:
+                    if waitContext.Id in self.JsonRpcWaitingContexts:
+                        del self.JsonRpcWaitingContexts[waitContext.Id]
+
+
+    # Converts the result of a waiting context into a JsonRpcResponse.
+    def _GetJsonRpcResponse(self, waitContext, method:str) -> JsonRpcResponse:
+        # Check if we got a result.
+        result = waitContext.GetResult()
+        if result is None:
+            self.Logger.info("Moonraker client timeout while waiting for request. "+str(waitContext.Id)+" "+method)
+            return JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_TIMEOUT)
+
+        # Check for an error if found, return the error state.
+        if "error" in result:
+            # Get the error parts
+            errorCode = JsonRpcResponse.OE_ERROR_EXCEPTION
+            errorStr = "Unknown"
+            if "code" in result["error"]:
+                errorCode = result["error"]["code"]
+            if "message" in result["error"]:
+                errorStr = result["error"]["message"]
+            return JsonRpcResponse(None, errorCode, errorStr)
+
+        # If there's a result, return the entire response
+        if "result" in result:
+            return JsonRpcResponse(result["result"])
+
+        # Finally, both are missing?
+        self.Logger.error("Moonraker client json rpc got a response that didn't have an error or result object? "+json.dumps(result))
+        return JsonRpcResponse(None, JsonRpcResponse.OE_ERROR_EXCEPTION, "No result or error object")
 
 
     # Sends a string to the connected websocket.
@@ -472,6 +513,10 @@ class MoonrakerClient:
         if method == "notify_webcams_changed":
             self.ConnectionStatusHandler.OnWebcamSettingsChanged()
 
+        # When files change, drop any file metadata we have cached for them.
+        if method == "notify_filelist_changed":
+            FileMetadataCache.Get().OnFileListChanged(msg)
+
 
     # If the message has a progress contained in the virtual_sdcard, this returns it. The progress is a float from 0.0->1.0
     # Otherwise None
@@ -670,8 +715,15 @@ class MoonrakerClient:
 
     def _onWsMsg(self, ws, msgBytes: bytes):
         try:
+            # Notifications have the method at the start of the message, so we can check if we care about it before parsing the whole thing.
+            # RPC responses don't have a method, so they are always parsed.
+            if MoonrakerClient.WebSocketMessageDebugging is False:
+                peekMethod = JsonCodec.PeekRootStringValue(msgBytes, "method")
+                if peekMethod is not None and peekMethod.lower() not in MoonrakerClient.c_HandledNotificationMethods:
+                    return
+
             # Parse the incoming message.
-            msgObj = json.loads(msgBytes)
+            msgObj = JsonCodec.Loads(msgBytes)
 
             # Get the method if there is one.
             method_CanBeNone = None
@@ -888,11 +940,8 @@ class MoonrakerCompat:
         if self.IsReadyToProcessNotifications is False:
             return
 
-        # Since this is a new print, reset the cache. The file name might be the same as the last, but have
-        # different props, so we will always reset. We know when we are printing the same file name will have the same props.
-        FileMetadataCache.Get().ResetCache()
-
         # Try to get the starting file info if we can.
+        # If the file was changed since we last cached it, Moonraker will have told us and the cache entry will have been dropped.
         filamentUsageMm = FileMetadataCache.Get().GetEstimatedFilamentUsageMm(fileName)
         fileSizeKBytes = FileMetadataCache.Get().GetFileSizeKBytes(fileName)
 
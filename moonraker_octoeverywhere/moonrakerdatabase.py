@@ -48,11 +48,8 @@ class MoonrakerDatabase:
                 self.Logger.error("_Debug_EnumerateDataBase failed to list. "+result.GetLoggingErrorStr())
                 return
             nsList = result.GetResult()["namespaces"]
-            for n in nsList:
-                result = MoonrakerClient.Get().SendJsonRpcRequest("server.database.get_item",
-                    {
-                        "namespace": n
-                    })
+            results = MoonrakerClient.Get().SendJsonRpcRequestBatch([("server.database.get_item", { "namespace": n }) for n in nsList])
+            for n, result in zip(nsList, results):
                 if result.HasError():
                     self.Logger.error("_Debug_EnumerateDataBase failed to get items for "+n+". "+result.GetLoggingErrorStr())
                     return
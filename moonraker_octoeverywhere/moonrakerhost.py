@@ -7,6 +7,7 @@ from octoeverywhere.deviceid import DeviceId
 from octoeverywhere.telemetry import Telemetry
 from octoeverywhere.hostcommon import HostCommon
 from octoeverywhere.compression import Compression
+from octoeverywhere.jsoncodec import JsonCodec
 from octoeverywhere.octopingpong import OctoPingPong
 from octoeverywhere.httpsessions import HttpSessions
 from octoeverywhere.Webcam.webcamhelper import WebcamHelper
@@ -35,6 +36,7 @@ from .moonrakerapirouter import MoonrakerApiRouter
 from .moonrakercredentailmanager import MoonrakerCredentialManager
 from .filemetadatacache import FileMetadataCache
 from .uiinjector import UiInjector
+from .slipstream import Slipstream
 
 # This file is the main host for the moonraker service.
 class MoonrakerHost:
@@ -129,14 +131,20 @@ class MoonrakerHost:
             # Init compression
             Compression.Init(self.Logger, localStorageDir)
 
+            # Setup the json codec used by the printer client, this must be done before the client is created.
+            JsonCodec.Init(self.Logger)
+
             # Init the mdns client
             MDns.Init(self.Logger, localStorageDir)
 
             # Init device id
             DeviceId.Init(self.Logger)
 
+            # Setup the frontend bundle cache, this must be done before the UI injector since it will invalidate it.
+            Slipstream.Init(self.Logger, localStorageDir, pluginVersionStr)
+
             # Allow the UI injector to run and do it's thing.
-            UiInjector.Init(self.Logger, repoRoot)
+            UiInjector.Init(self.Logger, repoRoot, localStorageDir)
 
             # Setup the print info manager
             PrintInfoManager.Init(self.Logger, localStorageDir)
@@ -185,7 +193,7 @@ class MoonrakerHost:
             MoonrakerClient.Init(self.Logger, self.Config, moonrakerConfigFilePath, printerId, self, pluginVersionStr)
 
             # Init our file meta data cache helper
-            FileMetadataCache.Init(self.Logger, MoonrakerClient.Get())
+            FileMetadataCache.Init(self.Logger, MoonrakerClient.Get(), localStorageDir)
 
             # Setup the command handler
             CommandHandler.Init(self.Logger, MoonrakerClient.Get().GetNotificationHandler(), MoonrakerCommandHandler(self.Logger), self)
@@ -347,6 +355,9 @@ class MoonrakerHost:
         # Also allow the database logic to ensure our public keys exist and are updated.
         self.MoonrakerDatabase.EnsureOctoEverywhereDatabaseEntry()
 
+        # We might have missed file change notifications while the websocket was disconnected, so sync the file metadata cache with the file list.
+        FileMetadataCache.Get().OnMoonrakerWsOpened()
+
     #
     # MoonrakerClient ConnectionStatusHandler Interface - Called by the MoonrakerClient when it gets a message that the webcam settings have changed.
     #
@@ -179,6 +179,9 @@ class MoonrakerWebcamHelper():
                     self.AutoSettingsWorkerEvent.clear()
                     self.AutoSettingsWorkerEvent.wait(delayTimeSec)
 
+                    # Capture the current settings, so we know if this pass changes anything.
+                    settingsStateBefore = self._GetSettingsState()
+
                     # Force a config reload, so if the user changed this setting, we respect it.
                     self.Config.ReloadFromFile()
                     newAutoSettings = self.Config.GetBool(Config.WebcamSection, Config.WebcamAutoSettings, MoonrakerWebcamHelper.c_DefaultAutoSettings)
@@ -195,6 +198,13 @@ class MoonrakerWebcamHelper():
                         # Otherwise, update our in memory values with what's in the config.
                         self._ReadManuallySetValues()
 
+                    # If the settings changed, let the webcam helper know, so it drops its cached webcam config.
+                    # GetWebcamConfig is only called when the cached config is rebuilt, so this is how new values get picked up.
+                    if settingsStateBefore != self._GetSettingsState():
+                        webcamHelper = WebcamHelper.Get()
+                        if webcamHelper is not None:
+                            webcamHelper.OnWebcamSettingsChanged()
+
                     # Report the profile time if needed.
                     profiler.ReportIfNeeded()
 
@@ -202,6 +212,13 @@ class MoonrakerWebcamHelper():
                     Sentry.Exception("Webcam helper - _WebcamSettingsUpdateWorker exception. ", e)
 
 
+    # Returns a value that holds everything GetWebcamConfig returns, so it can be compared to tell if the settings changed.
+    def _GetSettingsState(self):
+        with self.ResultsLock:
+            return (self.EnableAutoSettings, self.StreamUrl, self.SnapshotUrl, self.FlipH, self.FlipV, self.Rotation,
+                    [i.Serialize() for i in self.AutoSettingsResults])
+
+
     # Reads the values currently set in the config and sets them into our local settings.
     def _ReadManuallySetValues(self):
         # Read these under lock, so we don't get conflicts with them changing while being queried.
@@ -223,24 +240,31 @@ class MoonrakerWebcamHelper():
         try:
             self.Logger.debug("Starting auto webcam settings update...")
 
+            # We query all of the places the webcam config can be in one batch, so the fallbacks don't each cost a round trip.
+            apiResult, moonrakerDbResult, fluiddDbResult = MoonrakerClient.Get().SendJsonRpcRequestBatch([
+                ("server.webcams.list", None),
+                ("server.database.get_item", { "namespace": "webcams" }),
+                ("server.database.get_item", { "namespace": "fluidd", "key": "cameras" }),
+            ])
+
             # First, try to use the newer webcam API.
             # It seems that even if the frontend still uses the older DB based entry, it will still showup in this new API.
             # So we do this first, since it's the most correct if it exists.
-            if self._TryToFindWebcamFromApi():
+            if self._TryToFindWebcamFromApi(apiResult):
                 # On success, we found the webcam we want, so we are done.
                 return
 
             # Fallback to try the old common Moonraker DB webcams
             # Note we must keep this around, because some printers are stuck on older version of Moonraker / frontends
             # that use these APIs, and they can't be updated.
-            if self._TryToFindWebcamFromMoonrakerDb():
+            if self._TryToFindWebcamFromMoonrakerDb(moonrakerDbResult):
                 # On success, we found the webcam we want, so we are done.
                 return
 
             # Finally fallback to the old way Fluidd stored webcams, in it's own custom db namespace.
             # Note we must keep this around, because some printers are stuck on older version of Moonraker / frontends
             # that use these APIs, and they can't be updated.
-            if self._TryToFindWebcamFromFluiddCustomDb():
+            if self._TryToFindWebcamFromFluiddCustomDb(fluiddDbResult):
                 # On success, we found the webcam we want, so we are done.
                 return
 
@@ -254,10 +278,9 @@ class MoonrakerWebcamHelper():
 
 
     # Tries to find the webcam config using the new Moonraker webcam APIs.
-    def _TryToFindWebcamFromApi(self) -> bool:
+    # result is the response from the server.webcams.list call.
+    def _TryToFindWebcamFromApi(self, result:JsonRpcResponse) -> bool:
         # It seems that even if the frontend still uses the older DB based entry, it will still showup in this new API.
-        result = MoonrakerClient.Get().SendJsonRpcRequest("server.webcams.list")
-
         # If we failed don't do anything.
         if result.HasError():
             # If the error is that there's no websocket connected, we don't want to auto logic to continue, so it doesn't
@@ -341,14 +364,8 @@ class MoonrakerWebcamHelper():
 
 
     # Tries to find the webcam config using the older Moonraker common db entry.
-    def _TryToFindWebcamFromMoonrakerDb(self) -> bool:
-        # Query the common moonraker webcam database namespace.
-        result = MoonrakerClient.Get().SendJsonRpcRequest("server.database.get_item",
-            {
-                "namespace": "webcams",
-            }
-        )
-
+    # result is the response from the server.database.get_item call for the common moonraker webcam database namespace.
+    def _TryToFindWebcamFromMoonrakerDb(self, result:JsonRpcResponse) -> bool:
         # If we failed don't do anything.
         if result.HasError():
             # If the error was due to some issue talking to moonraker, we don't want to rest the webcam config to the defaults, SO WE RETURN True.
@@ -446,17 +463,12 @@ class MoonrakerWebcamHelper():
 
 
     # Tries to find the webcam config using the older Fluidd common namespace db entry.
-    def _TryToFindWebcamFromFluiddCustomDb(self) -> bool:
+    # result is the response from the server.database.get_item call for the fluidd cameras key.
+    def _TryToFindWebcamFromFluiddCustomDb(self, result:JsonRpcResponse) -> bool:
         # Older versions of Fluidd had their own DB entries in a custom namespace.
         # The format is something like this:
         # https://github.com/fluidd-core/fluidd/blob/8f091c2c75c6646cd29ab288863a379b7ca6c63e/src/store/webcams/actions.ts#L34
         self.Logger.debug("Webcam helper is trying to get webcam settings from the custom fluidd namespace...")
-        result = MoonrakerClient.Get().SendJsonRpcRequest("server.database.get_item",
-            {
-                "namespace": "fluidd",
-                "key": "cameras"
-            }
-        )
 
         # If we failed don't do anything.
         if result.HasError():
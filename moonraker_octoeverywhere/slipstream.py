@@ -0,0 +1,263 @@
+import re
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+
+from octoeverywhere.sentry import Sentry
+from octoeverywhere.compat import Compat
+from octoeverywhere.octohttprequest import OctoHttpRequest
+from octoeverywhere.octohttprequest import PathTypes
+from octoeverywhere.WebStream.octoheaderimpl import HeaderHelper
+from octoeverywhere.WebStream.octoheaderimpl import BaseProtocol
+from octoeverywhere.octostreammsgbuilder import OctoStreamMsgBuilder
+from octoeverywhere.compression import Compression, CompressionContext
+from octoeverywhere.slipstreamdiskcache import SlipstreamDiskCache
+
+# This class caches the large static bundles of the Mainsail and Fluidd frontends, already compressed and ready to send.
+#
+# Unlike OctoPrint, the Klipper frontends are static sites built with content hashes in the bundle file names, so the bundles never change
+# for a given path. Instead of pre-fetching from the index, the first time a bundle is requested it's returned as normal and then cached in the background.
+# After that, it's served from memory without a local http request or compressing it again. The entries are also saved to disk, so they survive restarts.
+# When the cache is full, the least recently used entries are dropped to make room.
+#
+# When the UiInjector sees a frontend's index change, which happens when the frontend is updated, the whole cache is dropped.
+class Slipstream:
+
+    # Only bundles in these folders with these extensions and a hash in the name are cached.
+    # The hash must be right before the extension, and it must be either a hex hash of at least 8 chars (webpack) or an 8 char
+    # base64url hash (vite) that has a digit, an uppercase letter after the first char, or a - or _, so names like app.settings.js don't match.
+    # Ex: /assets/index-BxK3dL9a.js, /assets/Dashboard.3f2a1b7c.css, /js/app.1e4b8f2a.js
+    c_CacheablePathRegex = re.compile(r"^/(assets|js|css|fonts)/[^/?#]+[.-]([0-9a-f]{8,}|[A-Za-z0-9_-](?=[A-Za-z0-9_-]{0,6}[0-9A-Z_-])[A-Za-z0-9_-]{7})\.(js|css|woff2|woff|ttf)$")
+
+    # Limits so we don't use too much memory or disk on small devices.
+    c_MaxFileSizeBytes = 20 * 1024 * 1024
+    c_MaxCacheSizeBytes = 50 * 1024 * 1024
+
+    # Helpful for debugging slipstream.
+    DebugLog = False
+
+    # Logic for a static singleton
+    _Instance = None
+
+
+    @staticmethod
+    def Init(logger:logging.Logger, localStorageDir:str, pluginVersion:str):
+        Slipstream._Instance = Slipstream(logger, localStorageDir, pluginVersion)
+        Compat.SetSlipstream(Slipstream._Instance)
+
+
+    @staticmethod
+    def Get():
+        return Slipstream._Instance
+
+
+    def __init__(self, logger:logging.Logger, localStorageDir:str, pluginVersion:str):
+        self.Logger = logger
+        self.DiskCache = SlipstreamDiskCache(logger, localStorageDir, pluginVersion)
+
+        # Maps the path to the ready to go OctoHttpResult, in least to most recently used order.
+        # Load anything we have saved from the last run.
+        self.Lock = threading.Lock()
+        self.Cache:OrderedDict = OrderedDict(self.DiskCache.Load())
+        self.CacheSizeBytes = sum(len(r.FullBodyBuffer) for r in self.Cache.values())
+        # The paths that are queued or being cached right now.
+        self.PendingPaths = set()
+
+        # All of the caching work is done by one background worker, so we never add work to a request.
+        self.WorkQueue = queue.Queue()
+        self.WorkerThread = threading.Thread(target=self._Worker, name="SlipstreamWorker")
+        self.WorkerThread.daemon = True
+        self.WorkerThread.start()
+
+
+    # !!! Interface Function For Slipstream in Compat Layer !!!
+    # If available for the given URL, this will returned the cached and ready to go OctoHttpResult.
+    # Otherwise returns None
+    def GetCachedOctoHttpResult(self, httpInitialContext):
+        # Note that all of our URL caching logic is case sensitive! (because URLs are)
+
+        # Get the path.
+        # If the path is empty, it's a protocol error. The upstream will handle it.
+        path = OctoStreamMsgBuilder.BytesToString(httpInitialContext.Path())
+        if path is None:
+            return None
+
+        # For now, only handle relative requests.
+        if httpInitialContext.PathType() != PathTypes.Relative:
+            return None
+
+        # The cached results are full GET responses, so they can't be used for any other method.
+        if OctoStreamMsgBuilder.BytesToString(httpInitialContext.Method()) != "GET":
+            return None
+
+        # Only handle hashed frontend bundles.
+        if Slipstream.c_CacheablePathRegex.match(path) is None:
+            return None
+
+        # If the browser already has a copy, let the request go through as normal so it can get a 304 back.
+        if self._HasConditionalRequestHeader(httpInitialContext):
+            return None
+
+        with self.Lock:
+            result = self.Cache.get(path, None)
+            if result is not None:
+                self.Cache.move_to_end(path)
+                self._DebugLog("Slipstream returning cached content for "+path)
+                return result
+            # On a miss, cache it in the background for next time.
+            if path in self.PendingPaths:
+                return None
+            self.PendingPaths.add(path)
+        self.WorkQueue.put(path)
+        return None
+
+
+    # !!! Interface Function For Slipstream in Compat Layer !!!
+    # Unlike other platforms, nothing is pre-fetched, so there's nothing to update.
+    def UpdateCache(self, delayMs=1000):
+        pass
+
+
+    # Called by the UiInjector when a frontend's files changed, this drops the entire cache.
+    def OnFrontendChanged(self):
+        with self.Lock:
+            if len(self.Cache) == 0:
+                return
+            self.Logger.info(f"Slipstream frontend changed, dropping {len(self.Cache)} cached files.")
+            self.Cache = OrderedDict()
+            self.CacheSizeBytes = 0
+        self.WorkQueue.put(None)
+
+
+    def _Worker(self):
+        while True:
+            try:
+                # A None path means we just need to save.
+                path = self.WorkQueue.get()
+                if path is not None:
+                    try:
+                        self._CachePath(path)
+                    finally:
+                        with self.Lock:
+                            self.PendingPaths.discard(path)
+                # Once the current burst of work is done, save the cache.
+                if self.WorkQueue.empty():
+                    with self.Lock:
+                        cache = dict(self.Cache)
+                    self.DiskCache.Save(cache)
+            except Exception as e:
+                Sentry.Exception("Slipstream worker exception.", e)
+
+
+    def _CachePath(self, path:str):
+        result = self._GetCacheReadyOctoHttpResult(path)
+        if result is None:
+            return
+        size = len(result.FullBodyBuffer)
+        with self.Lock:
+            # Drop the least recently used entries until the new one fits.
+            while len(self.Cache) > 0 and self.CacheSizeBytes + size > Slipstream.c_MaxCacheSizeBytes:
+                evictedPath, evicted = self.Cache.popitem(last=False)
+                self.CacheSizeBytes -= len(evicted.FullBodyBuffer)
+                self._DebugLog(f"Slipstream cache is full, dropping {evictedPath}")
+            self.Cache[path] = result
+            self.CacheSizeBytes += size
+
+
+    # On success returns the fully ready OctoHttpResult object.
+    # On failure, returns None
+    def _GetCacheReadyOctoHttpResult(self, url) -> OctoHttpRequest.Result:
+        try:
+            # Take the starting time.
+            start = time.time()
+
+            # Build the headers using the header helper, which will set the common required headers.
+            headers = HeaderHelper.GatherRequestHeaders(self.Logger, None, BaseProtocol.Http)
+
+            # Make the call using our helper.
+            octoHttpResult = OctoHttpRequest.MakeHttpCall(self.Logger, url, PathTypes.Relative, "GET", headers)
+
+            # Check for success
+            if octoHttpResult is None or octoHttpResult.StatusCode != 200:
+                self._DebugLog("Slipstream failed to make the http request for "+url)
+                return None
+
+            with octoHttpResult:
+                # Find the content length and remove any headers we don't want.
+                setCookieKey = None
+                contentLength = None
+                headers = octoHttpResult.Headers
+                for key in headers:
+                    keyLower = key.lower()
+                    if keyLower == "content-length":
+                        contentLength = int(headers[key])
+                    elif keyLower == "set-cookie":
+                        setCookieKey = key
+
+                # We need to find this to make sure the body read is the correct length.
+                if contentLength is None or contentLength > Slipstream.c_MaxFileSizeBytes:
+                    self._DebugLog(f"Slipstream not caching {url}, the content length is missing or too large. {contentLength}")
+                    return None
+
+                # We remove Set-Cookie so no session gets applied from this cached item.
+                if setCookieKey is not None:
+                    del octoHttpResult.Headers[setCookieKey]
+
+                # Set the cache header
+                octoHttpResult.Headers["x-oe-slipstream-plugin"] = "1"
+
+                # Read the entire body, so we can store it.
+                octoHttpResult.ReadAllContentFromStreamResponse(self.Logger)
+                buffer = octoHttpResult.FullBodyBuffer
+
+            # Since we are using the FullBodyBuffer, the content length header must exactly match the actual buffer size before compression.
+            if buffer is None or len(buffer) != contentLength:
+                self.Logger.error("Slipstream read a a body of different size then the content length. url:"+url)
+                return None
+
+            # Do the compression.
+            ogSize = len(buffer)
+            compressStart = time.time()
+            compressResult = None
+            with CompressionContext(self.Logger) as compressionContext:
+                # It's important to set the full compression size, because the compression system will use
+                # it to better optimize the compression and know that we will be sending the full data.
+                compressionContext.SetTotalCompressedSizeOfData(len(buffer))
+                compressResult = Compression.Get().Compress(compressionContext, buffer)
+                buffer = compressResult.Bytes
+
+            # Build a new result that's not tied to the http response, so it's ready to go.
+            result = OctoHttpRequest.Result(200, dict(octoHttpResult.Headers), url, False)
+            result.SetFullBodyBuffer(buffer, compressResult.CompressionType, ogSize)
+
+            requestDuration = compressStart - start
+            compressDuration = time.time() - compressStart
+            self._DebugLog("Slipstream Cached [request:"+str(format(requestDuration, '.3f'))+", compression:"+str(format(compressDuration, '.3f'))+"] ["+str(ogSize)+"->"+str(len(buffer))+" "+format(((len(buffer)/ogSize)*100), '.3f')+"%] "+url)
+            return result
+
+        except Exception as e:
+            self.Logger.error("Slipstream failed to cache url. url:"+url+" error:"+str(e))
+        return None
+
+
+    # Returns True if the request has a header that shows the browser already has a cached copy.
+    def _HasConditionalRequestHeader(self, httpInitialContext) -> bool:
+        headersLen = httpInitialContext.HeadersLength()
+        i = 0
+        while i < headersLen:
+            header = httpInitialContext.Headers(i)
+            i += 1
+            name = OctoStreamMsgBuilder.BytesToString(header.Key())
+            if name is None:
+                continue
+            nameLower = name.lower()
+            if nameLower == "if-none-match" or nameLower == "if-modified-since":
+                return True
+        return False
+
+
+    def _DebugLog(self, msg:str):
+        if Slipstream.DebugLog:
+            self.Logger.debug(msg)
@@ -1,4 +1,5 @@
 import os
+import json
 import logging
 import threading
 import hashlib
@@ -11,21 +12,29 @@ from octoeverywhere.debugprofiler import DebugProfiler, DebugProfilerFeatures
 
 from octoeverywhere.Proto import OsType
 
+from .slipstream import Slipstream
+
 # A class to handle getting our UI into common front ends.
 class UiInjector():
 
     # This is how often we will check the state of things.
     # Since our checks are light weight, there's no harm in doing this somewhat frequently.
     # We don't have any other way of detecting file changes right now, so this is our only way.
+    # Each check only stats the files, they are only read and hashed if the manifest shows they changed.
     c_UpdateCheckIntervalSec = 60
 
+    # The file name the manifest is persisted to in the local storage folder.
+    # The manifest holds the size and mtime of each file we have processed and the static file hash it was processed with,
+    # so if nothing has changed, we don't need to read or hash anything, even after a restart.
+    c_ManifestFileName = "UiInjectorManifest.json"
+
     _Instance = None
     _Debug = False
 
 
     @staticmethod
-    def Init(logger:logging.Logger, repoRoot:str):
-        UiInjector._Instance = UiInjector(logger, repoRoot)
+    def Init(logger:logging.Logger, repoRoot:str, localStorageDir:str):
+        UiInjector._Instance = UiInjector(logger, repoRoot, localStorageDir)
 
 
     @staticmethod
@@ -33,12 +42,17 @@ class UiInjector():
         return UiInjector._Instance
 
 
-    def __init__(self, logger:logging.Logger, oeRepoRoot:str):
+    def __init__(self, logger:logging.Logger, oeRepoRoot:str, localStorageDir:str):
         self.Logger = logger
         self.OeRepoRoot = oeRepoRoot
         self.StaticUiJsFilePath = None
         self.StaticUiCssFilePath = None
         self.StaticFileHash = None
+        # Maps a file path to a dict with the Size, MtimeNs, and Hash of the file when we last processed it.
+        # This is only used by the worker thread, so it doesn't need a lock.
+        self.ManifestFilePath = os.path.join(localStorageDir, UiInjector.c_ManifestFileName)
+        self.Manifest = self._LoadManifest()
+        self.ManifestChanged = False
         self.WorkerEvent = threading.Event()
         self.WorkerThread = threading.Thread(target=self._Worker)
         self.WorkerThread.start()
@@ -93,10 +107,30 @@ class UiInjector():
                     htmlStaticRoot = os.path.join(d, frontEnd)
                     # See if it exists.
                     if os.path.exists(htmlStaticRoot):
+                        # If the index hasn't changed since we last injected it with the current static files, there's nothing to do to it.
+                        indexFilePath = os.path.join(htmlStaticRoot, "index.html")
+                        if self._IsUnchangedSinceProcessed(indexFilePath, self.StaticFileHash):
+                            self._UpdateStaticFilesIntoRootIfNeeded(htmlStaticRoot)
+                            continue
                         # If so, try to find the html file and inject it if needed.
                         if self._DoInject(htmlStaticRoot):
                             # If successful, make sure our latest js and css files are also there.
                             self._UpdateStaticFilesIntoRootIfNeeded(htmlStaticRoot)
+                            # Record the index state after the inject, so we skip it until it changes.
+                            # We also record a hash of the index that doesn't change when only our static files change,
+                            # so we can tell if the frontend itself was updated.
+                            lastEntry = self.Manifest.get(indexFilePath, None)
+                            lastFrontendHash = None if lastEntry is None else lastEntry.get("FrontendHash", None)
+                            frontendHash = self._GetFrontendHash(indexFilePath)
+                            self._SetProcessed(indexFilePath, self.StaticFileHash, frontendHash)
+                            # If the frontend was updated, any bundles we have cached might be stale.
+                            # If we don't have a hash from before, there's nothing to compare to, so we keep the cache.
+                            if lastFrontendHash is not None and frontendHash is not None and lastFrontendHash != frontendHash and Slipstream.Get() is not None:
+                                Slipstream.Get().OnFrontendChanged()
+
+            # If anything changed, save the manifest.
+            if self.ManifestChanged:
+                self._SaveManifest()
         except Exception as e:
             Sentry.Exception("UiInjector _ExecuteInjectAndUpdate.", e)
 
@@ -110,6 +144,13 @@ class UiInjector():
             raise Exception("Failed to find static js ui file "+self.StaticUiJsFilePath)
         if os.path.exists(self.StaticUiCssFilePath) is False:
             raise Exception("Failed to find static css ui file "+self.StaticUiCssFilePath)
+        # If neither file has changed since we last hashed them, use the hash we already have.
+        manifestEntry = self.Manifest.get(self.StaticUiJsFilePath, None)
+        if manifestEntry is not None:
+            knownHash = manifestEntry.get("Hash", None)
+            if knownHash is not None and self._IsUnchangedSinceProcessed(self.StaticUiJsFilePath, knownHash) and self._IsUnchangedSinceProcessed(self.StaticUiCssFilePath, knownHash):
+                self.StaticFileHash = knownHash
+                return
         # Hash them
         bufferSize = 65536 # 64kb
         sha1 = hashlib.sha1()
@@ -129,6 +170,8 @@ class UiInjector():
         self.StaticFileHash = "{0}".format(sha1.hexdigest())
         self.StaticFileHash = self.StaticFileHash[:10]
         self.Logger.debug("Static UI Files Hash: "+self.StaticFileHash)
+        self._SetProcessed(self.StaticUiJsFilePath, self.StaticFileHash)
+        self._SetProcessed(self.StaticUiCssFilePath, self.StaticFileHash)
 
 
     # Given a known static path, try to inject our UI files.
@@ -409,6 +452,76 @@ class UiInjector():
             Sentry.Exception("_UpdateStaticFilesIntoRootIfNeeded failed for "+staticHtmlRootPath, e)
 
 
+    # Returns True if the file's size and mtime match the manifest and it was processed with the given hash.
+    def _IsUnchangedSinceProcessed(self, filePath:str, fileHash:str) -> bool:
+        entry = self.Manifest.get(filePath, None)
+        if entry is None or entry.get("Hash", None) != fileHash:
+            return False
+        try:
+            st = os.stat(filePath)
+        except Exception:
+            return False
+        return entry.get("Size", None) == st.st_size and entry.get("MtimeNs", None) == st.st_mtime_ns
+
+
+    # Returns a hash of the index file with our static file hash removed, so it only changes when the frontend changes.
+    # Returns None on failure.
+    def _GetFrontendHash(self, indexFilePath:str) -> str:
+        try:
+            with open(indexFilePath, 'rb') as f:
+                data = f.read()
+            return hashlib.sha1(data.replace(self.StaticFileHash.encode("utf-8"), b"")).hexdigest()
+        except Exception as e:
+            self.Logger.debug(f"UiInjector failed to hash {indexFilePath}. {e}")
+        return None
+
+
+    # Records the file's current size and mtime in the manifest, along with the hash it was processed with.
+    # If a frontend hash is given, it's also stored.
+    def _SetProcessed(self, filePath:str, fileHash:str, frontendHash:str=None) -> None:
+        try:
+            st = os.stat(filePath)
+        except Exception as e:
+            self.Logger.debug(f"UiInjector failed to stat {filePath}. {e}")
+            self.Manifest.pop(filePath, None)
+            self.ManifestChanged = True
+            return
+        entry = {
+            "Size": st.st_size,
+            "MtimeNs": st.st_mtime_ns,
+            "Hash": fileHash,
+        }
+        if frontendHash is not None:
+            entry["FrontendHash"] = frontendHash
+        if self.Manifest.get(filePath, None) != entry:
+            self.Manifest[filePath] = entry
+            self.ManifestChanged = True
+
+
+    # Loads the manifest from disk, if there is one.
+    def _LoadManifest(self) -> dict:
+        try:
+            if os.path.exists(self.ManifestFilePath) is False:
+                return {}
+            with open(self.ManifestFilePath, encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return data
+        except Exception as e:
+            self.Logger.warn(f"UiInjector failed to load the manifest. {e}")
+        return {}
+
+
+    # Saves the manifest to disk.
+    def _SaveManifest(self) -> None:
+        try:
+            with open(self.ManifestFilePath, encoding="utf-8", mode="w") as f:
+                f.write(json.dumps(self.Manifest))
+            self.ManifestChanged = False
+        except Exception as e:
+            self.Logger.warn(f"UiInjector failed to save the manifest. {e}")
+
+
     # Returns the parent directory of the passed directory or file path.
     def GetParentDirectory(self, path):
         return os.path.abspath(os.path.join(path, os.pardir))
@@ -21,6 +21,86 @@ from ..Proto import WebSocketDataTypes
 from ..Proto import PathTypes
 from ..Proto import DataCompression
 
+#
+# Remembers which connection target last worked for each kind of websocket path, so new websockets for the same kind of path try it first.
+#
+# Relative paths have a few local addresses to try, and absolute paths might have a locally resolved url to try.
+# Without this, every new websocket would walk the targets from the top, repeating the same failed connects every time.
+# If the remembered target fails, it's forgotten and the rest of the targets are tried in the normal order.
+#
+class WsConnectTargetCache:
+
+    # How often the stats are logged, in websocket opens.
+    c_StatsReportIntervalOpens = 100
+
+    # The max number of path templates we remember.
+    c_MaxEntries = 200
+
+    _Lock = threading.Lock()
+    _Targets = {}
+
+    # Stats
+    _OpenCount = 0
+    _FirstAttemptOpenCount = 0
+    _InvalidatedCount = 0
+    _TotalOpenSec = 0.0
+
+
+    # Returns the key we remember the target for.
+    # For relative paths, this is the first path segment, since some paths have unique ids in them, like sockjs.
+    # For absolute paths, it's the protocol, host, and port.
+    @staticmethod
+    def GetPathTemplate(pathType, path:str) -> str:
+        if pathType is PathTypes.PathTypes.Absolute:
+            hostStart = path.find("://")
+            hostStart = 0 if hostStart == -1 else hostStart + 3
+            pathStart = path.find("/", hostStart)
+            return "a:" + (path if pathStart == -1 else path[:pathStart])
+        queryStart = path.find("?")
+        if queryStart != -1:
+            path = path[:queryStart]
+        segmentEnd = path.find("/", 1)
+        return "r:" + (path if segmentEnd == -1 else path[:segmentEnd])
+
+
+    # Returns the list of targets in the order they should be tried.
+    @staticmethod
+    def GetAttemptOrder(pathTemplate:str, targetCount:int) -> list:
+        order = list(range(targetCount))
+        with WsConnectTargetCache._Lock:
+            target = WsConnectTargetCache._Targets.get(pathTemplate, None)
+        if target is not None and target < targetCount:
+            order.remove(target)
+            order.insert(0, target)
+        return order
+
+
+    # Called when a target failed to connect.
+    @staticmethod
+    def OnTargetFailed(pathTemplate:str, target:int) -> None:
+        with WsConnectTargetCache._Lock:
+            if WsConnectTargetCache._Targets.get(pathTemplate, None) == target:
+                del WsConnectTargetCache._Targets[pathTemplate]
+                WsConnectTargetCache._InvalidatedCount += 1
+
+
+    # Called when a target connected.
+    @staticmethod
+    def OnTargetOpened(logger, pathTemplate:str, target:int, attempts:int, openSec:float) -> None:
+        with WsConnectTargetCache._Lock:
+            if len(WsConnectTargetCache._Targets) >= WsConnectTargetCache.c_MaxEntries and pathTemplate not in WsConnectTargetCache._Targets:
+                WsConnectTargetCache._Targets.clear()
+            WsConnectTargetCache._Targets[pathTemplate] = target
+            WsConnectTargetCache._OpenCount += 1
+            if attempts == 1:
+                WsConnectTargetCache._FirstAttemptOpenCount += 1
+            WsConnectTargetCache._TotalOpenSec += openSec
+            if WsConnectTargetCache._OpenCount % WsConnectTargetCache.c_StatsReportIntervalOpens != 0:
+                return
+            msg = f"Ws connect target stats: opens {WsConnectTargetCache._OpenCount}, first attempt opens {WsConnectTargetCache._FirstAttemptOpenCount}, invalidated {WsConnectTargetCache._InvalidatedCount}, avg open {format((WsConnectTargetCache._TotalOpenSec / WsConnectTargetCache._OpenCount) * 1000.0, '.1f')}ms"
+        logger.info(msg)
+
+
 #
 # A helper object that handles websocket request for the web stream system.
 #
@@ -29,6 +109,16 @@ from ..Proto import DataCompression
 #
 class OctoWebStreamWsHelper:
 
+    # The number of connection targets we try for relative and absolute paths.
+    c_RelativeTargetCount = 4
+    c_AbsoluteTargetCount = 2
+
+    # The max number of messages we will hold for the local websocket while it's connecting.
+    c_MaxPendingMsgs = 500
+
+    # The max amount of time we will hold messages for the local websocket while it's connecting, before we give up and close the stream.
+    c_MaxPendingMsgWaitSec = 30.0
+
     # Called by the main socket thread so this should be quick!
     # Throwing from here will shutdown the entire connection.
     def __init__(self, streamId, logger, webStream, webStreamOpenMsg, openedTime):
@@ -51,6 +141,12 @@ class OctoWebStreamWsHelper:
         self.IsWsObjOpened = False
         self.IsWsObjClosed = False
 
+        # Messages from the server that arrive before the local websocket is open are held here, and sent when it opens.
+        # Each entry is a tuple of the buffer and the send opt code. The lock also protects setting IsWsObjOpened, so messages are always sent in order.
+        self.PendingMsgLock = threading.Lock()
+        self.PendingMsgs = []
+        self.PendingMsgTimer:threading.Timer = None
+
         # Capture the initial http context
         self.HttpInitialContext = webStreamOpenMsg.HttpInitialContext()
         if self.HttpInitialContext is None:
@@ -69,6 +165,10 @@ class OctoWebStreamWsHelper:
         # It might take multiple attempts depending on the network setup of the client.
         # This value keeps track of them.
         self.ConnectionAttempt = 0
+        # The order the connection targets will be tried in, the path template used to remember the target that worked, and the current target.
+        self.AttemptOrder = None
+        self.PathTemplate = None
+        self.AttemptTarget = None
         # This boolean tracks if a connection attempt was ever successful or not.
         self.SuccessfullyOpenedSocket = False
 
@@ -107,89 +207,39 @@ class OctoWebStreamWsHelper:
         if path is None:
             raise Exception("Web stream ws helper got a open message with no path")
 
-        # Depending on the connection attempt, build the URI
-        uri = None
+        # Figure out the order we will try the connection targets in.
+        # The target that last worked for this kind of path is tried first, so most of the time we only need one local connect.
         pathType = self.HttpInitialContext.PathType()
-        if pathType is PathTypes.PathTypes.Relative:
-            # If the path is relative, we will make a few attempts to connect.
-            # Note these attempts are very closely related to the logic in the OctoHttpRequest class and should stay in sync.
-            if self.ConnectionAttempt == 0:
-                # If we have an API handler, see if it wants to overwrite the URL.
-                # We have to do this first, because the generated URL might work, but not be the right one.
-                # Right now this is only used for moonraker. MapRelativePathToAbsolutePathIfNeeded will return None if there's nothing to do.
-                if Compat.HasApiRouterHandler():
-                    uri = Compat.GetApiRouterHandler().MapRelativePathToAbsolutePathIfNeeded(path, "ws://")
-                if uri is None:
-                    # Try to connect using the main URL, this is what we expect to work.
-                    uri = "ws://" + str(OctoHttpRequest.GetLocalhostAddress()) + ":" + str(OctoHttpRequest.GetLocalOctoPrintPort()) + path
-            elif self.ConnectionAttempt == 1:
-                # Attempt 2 is to where we think the http proxy port is.
-                # For this address, we need set the protocol correctly depending if the client detected https or not.
-                protocol = "ws://"
-                if OctoHttpRequest.GetLocalHttpProxyIsHttps():
-                    protocol = "wss://"
-                uri = protocol + str(OctoHttpRequest.GetLocalhostAddress()) + ":" +str(OctoHttpRequest.GetLocalHttpProxyPort()) + path
-            elif self.ConnectionAttempt == 2:
-                # Attempt 3 will be to try to connect with the device IP.
-                # This is needed if the server isn't bound to localhost, but only the public IP. Try the http proxy port.
-                # Since we are using the public IP, it's more likely that the http proxy port will be bound and not firewalled, since the OctoPrint port is usually internal only.
-                protocol = "ws://"
-                if OctoHttpRequest.GetLocalHttpProxyIsHttps():
-                    protocol = "wss://"
-                uri = protocol + LocalIpHelper.TryToGetLocalIp() + ":" + str(OctoHttpRequest.GetLocalHttpProxyPort()) + path
-            elif self.ConnectionAttempt == 3:
-                # Attempt 4 will be to try to connect with the device IP.
-                # This is needed if the server isn't bound to localhost, but only the public IP. Try the OctoPrint local port as a last attempt.
-                uri = "ws://" + LocalIpHelper.TryToGetLocalIp() + ":" + str(OctoHttpRequest.GetLocalOctoPrintPort()) + path
+        if self.AttemptOrder is None:
+            if pathType is PathTypes.PathTypes.Relative:
+                targetCount = OctoWebStreamWsHelper.c_RelativeTargetCount
+            elif pathType is PathTypes.PathTypes.Absolute:
+                targetCount = OctoWebStreamWsHelper.c_AbsoluteTargetCount
             else:
+                raise Exception("Web stream ws helper got a open message with an unknown path type "+str(pathType))
+            self.PathTemplate = WsConnectTargetCache.GetPathTemplate(pathType, path)
+            self.AttemptOrder = WsConnectTargetCache.GetAttemptOrder(self.PathTemplate, targetCount)
+        elif self.AttemptTarget is not None:
+            # If we are here, the last target failed to connect, so make sure it's not remembered.
+            WsConnectTargetCache.OnTargetFailed(self.PathTemplate, self.AttemptTarget)
+
+        # Get the URI for the next target, skipping any targets that can't be used.
+        uri = None
+        while uri is None:
+            if self.ConnectionAttempt >= len(self.AttemptOrder):
                 # Report the issue and return False to indicate we aren't trying to connect.
-                self.Logger.info(self.getLogMsgPrefix()+" failed to connect to relative path and has nothing else to try.")
-                return False
-        elif pathType is PathTypes.PathTypes.Absolute:
-            # If this is an absolute path, there are two options:
-            #   1) If the path is a local hostname, we will try to manually resolve the hostname and then try that connection directly.
-            #      This is to mitigate mDNS problems, which are described in octohttprequest, in the PathTypes.Absolute handling logic.
-            #      Basically, mDNS is flakey and it's not supported on some OSes, so doing it ourselves fixes some of that.
-            #        - If this is the case, we will try our manually resolved url first, and the OG second.
-            #   2) If the url isn't a local hostname or it fails to resolve manually, we just use the absolute URL directly.
-
-            # Try to see if this is a local hostname, if we don't already have a result.
-            if self.ResolvedLocalHostnameUrl is None:
-                # This returns None if the URL doesn't contain a local hostname or it fails to resolve.
-                self.ResolvedLocalHostnameUrl = MDns.Get().TryToResolveIfLocalHostnameFound(path)
-
-            if self.ResolvedLocalHostnameUrl is None:
-                # If self.ResolvedLocalHostnameUrl is None, there's no local hostname or it failed to resolve.
-                # Thus we will just try the absolute URL and nothing else.
-                if self.ConnectionAttempt != 0:
-                    # Report the issue and return False to indicate we aren't trying to connect.
+                if pathType is PathTypes.PathTypes.Relative:
+                    self.Logger.info(self.getLogMsgPrefix()+" failed to connect to relative path and has nothing else to try.")
+                else:
                     self.Logger.info(self.getLogMsgPrefix()+" failed to connect to absolute path and has nothing else to try.")
-                    return False
-
-                # Use the raw absolute path.
-                uri = path
+                return False
+            self.AttemptTarget = self.AttemptOrder[self.ConnectionAttempt]
+            # Increment the connection attempt.
+            self.ConnectionAttempt += 1
+            if pathType is PathTypes.PathTypes.Relative:
+                uri = self._GetRelativeTargetUri(self.AttemptTarget, path)
             else:
-                # We have a local hostname url resolved in our string.
-                if self.ConnectionAttempt == 0:
-                    # For the first attempt, try using our manually resolved URL. Since it's already resolved and might be from a cache, it's going to be faster.
-                    uri = self.ResolvedLocalHostnameUrl
-                elif self.ConnectionAttempt == 1:
-                    # For the second attempt, it means the manually resolved URL failed, so we just try the original path with no modification.
-                    self.Logger.info(self.getLogMsgPrefix()+" failed to connect with the locally resoled hostname ("+self.ResolvedLocalHostnameUrl+"), trying the raw URL. " + path)
-                    uri = path
-                else:
-                    # We tired both, neither worked. Give up.
-                    self.Logger.info(self.getLogMsgPrefix()+" failed to connect to manually resolved local hostname and the absolute path.")
-                    return False
-        else:
-            raise Exception("Web stream ws helper got a open message with an unknown path type "+str(pathType))
-
-        # Validate a URI was set
-        if uri is None:
-            raise Exception(self.getLogMsgPrefix()+" AttemptConnection failed to create a URI")
-
-        # Increment the connection attempt.
-        self.ConnectionAttempt += 1
+                uri = self._GetAbsoluteTargetUri(self.AttemptTarget, path)
 
         # Make the websocket object and start it running.
         self.Logger.debug(self.getLogMsgPrefix()+"opening websocket to "+str(uri) + " attempt "+ str(self.ConnectionAttempt))
@@ -224,6 +274,61 @@ class OctoWebStreamWsHelper:
         return True
 
 
+    # Returns the URI to connect to for the relative path target.
+    def _GetRelativeTargetUri(self, target:int, path:str) -> str:
+        # If the path is relative, we will make a few attempts to connect.
+        # Note these attempts are very closely related to the logic in the OctoHttpRequest class and should stay in sync.
+        if target == 0:
+            # If we have an API handler, see if it wants to overwrite the URL.
+            # We have to do this first, because the generated URL might work, but not be the right one.
+            # Right now this is only used for moonraker. MapRelativePathToAbsolutePathIfNeeded will return None if there's nothing to do.
+            uri = None
+            if Compat.HasApiRouterHandler():
+                uri = Compat.GetApiRouterHandler().MapRelativePathToAbsolutePathIfNeeded(path, "ws://")
+            if uri is None:
+                # Try to connect using the main URL, this is what we expect to work.
+                uri = "ws://" + str(OctoHttpRequest.GetLocalhostAddress()) + ":" + str(OctoHttpRequest.GetLocalOctoPrintPort()) + path
+            return uri
+        if target == 1:
+            # Attempt 2 is to where we think the http proxy port is.
+            # For this address, we need set the protocol correctly depending if the client detected https or not.
+            protocol = "ws://"
+            if OctoHttpRequest.GetLocalHttpProxyIsHttps():
+                protocol = "wss://"
+            return protocol + str(OctoHttpRequest.GetLocalhostAddress()) + ":" +str(OctoHttpRequest.GetLocalHttpProxyPort()) + path
+        if target == 2:
+            # Attempt 3 will be to try to connect with the device IP.
+            # This is needed if the server isn't bound to localhost, but only the public IP. Try the http proxy port.
+            # Since we are using the public IP, it's more likely that the http proxy port will be bound and not firewalled, since the OctoPrint port is usually internal only.
+            protocol = "ws://"
+            if OctoHttpRequest.GetLocalHttpProxyIsHttps():
+                protocol = "wss://"
+            return protocol + LocalIpHelper.TryToGetLocalIp() + ":" + str(OctoHttpRequest.GetLocalHttpProxyPort()) + path
+        # Attempt 4 will be to try to connect with the device IP.
+        # This is needed if the server isn't bound to localhost, but only the public IP. Try the OctoPrint local port as a last attempt.
+        return "ws://" + LocalIpHelper.TryToGetLocalIp() + ":" + str(OctoHttpRequest.GetLocalOctoPrintPort()) + path
+
+
+    # Returns the URI to connect to for the absolute path target, or None if the target can't be used for this path.
+    def _GetAbsoluteTargetUri(self, target:int, path:str) -> str:
+        # If this is an absolute path, there are two options:
+        #   1) If the path is a local hostname, we will try to manually resolve the hostname and then try that connection directly.
+        #      This is to mitigate mDNS problems, which are described in octohttprequest, in the PathTypes.Absolute handling logic.
+        #      Basically, mDNS is flakey and it's not supported on some OSes, so doing it ourselves fixes some of that.
+        #   2) The absolute URL directly.
+        # Normally the manually resolved url is tried first, since it's already resolved and might be from a cache, it's going to be faster.
+        if target == 0:
+            # Try to see if this is a local hostname, if we don't already have a result.
+            if self.ResolvedLocalHostnameUrl is None:
+                # This returns None if the URL doesn't contain a local hostname or it fails to resolve.
+                self.ResolvedLocalHostnameUrl = MDns.Get().TryToResolveIfLocalHostnameFound(path)
+            # If this is None, there's no local hostname or it failed to resolve, so this target is skipped.
+            return self.ResolvedLocalHostnameUrl
+        if self.ResolvedLocalHostnameUrl is not None and self.ConnectionAttempt > 1:
+            self.Logger.info(self.getLogMsgPrefix()+" failed to connect with the locally resoled hostname ("+self.ResolvedLocalHostnameUrl+"), trying the raw URL. " + path)
+        return path
+
+
     # When close is called, all http operations should be shutdown.
     # Called by the main socket thread so this should be quick!
     def Close(self):
@@ -251,6 +356,13 @@ class OctoWebStreamWsHelper:
             except Exception as _ :
                 pass
 
+        # Drop any messages that were waiting for the local websocket to open.
+        with self.PendingMsgLock:
+            if self.PendingMsgTimer is not None:
+                self.PendingMsgTimer.cancel()
+                self.PendingMsgTimer = None
+            self.PendingMsgs.clear()
+
         # Ensure the compressor is cleaned up
         try:
             self.CompressionContext.__exit__(None, None, None)
@@ -265,18 +377,48 @@ class OctoWebStreamWsHelper:
     # as long as it gets cleaned up when the socket closes.
     def IncomingServerMessage(self, webStreamMsg:WebStreamMsg.WebStreamMsg):
 
+        # Check if the webstream has closed or the socket object is now reporting closed.
+        if self.IsWsObjClosed is True or self.IsClosed:
+            return True
+
+        # Decode the message now, even if we can't send it yet, so the messages are always decompressed in order.
+        buffer, sendType = self._GetBufferAndSendType(webStreamMsg)
+
         # We can get messages from this web stream before the actual websocket has opened and is ready for messages.
         # If this happens, when we try to send the message on the socket and we will get an error saying "the socket is closed" (which is incorrect, it's not open yet).
-        # So we need to delay until we know the socket is ready or the webstream is shutdown.
-        while self.IsWsObjOpened is False:
-            # Check if the webstream has closed or the socket object is now reporting closed.
-            if self.IsWsObjClosed is True or self.IsClosed:
-                return True
+        # So we hold the message until the socket opens, and it's sent from the open callback.
+        if self.IsWsObjOpened is False:
+            with self.PendingMsgLock:
+                # Check again under lock, since the socket might have just opened.
+                if self.IsWsObjOpened is False:
+                    if len(self.PendingMsgs) >= OctoWebStreamWsHelper.c_MaxPendingMsgs:
+                        self.Logger.warn(self.getLogMsgPrefix()+" has too many messages waiting for the local websocket to open, closing.")
+                        return True
+                    self.PendingMsgs.append((buffer, sendType))
+                    # Start the timer on the first pending message, so we don't wait forever for a socket that will never open.
+                    if self.PendingMsgTimer is None:
+                        self.PendingMsgTimer = threading.Timer(OctoWebStreamWsHelper.c_MaxPendingMsgWaitSec, self._OnPendingMsgTimeout)
+                        self.PendingMsgTimer.daemon = True
+                        self.PendingMsgTimer.start()
+                    return False
+
+        # Before we send, make sure we have a local websocket still and it's not closed.
+        # If the websocket object is closed ignore this message. It will throw if the socket is closed
+        # which will take down the entire OctoStream. But since it's closed the web stream is already cleaning up.
+        # This can happen if the socket closes locally and we sent the message to clean up to the service, but there
+        # were already inbound messages on the way.
+        localWs = self.Ws
+        if self.IsWsObjClosed or self.IsClosed or localWs is None:
+            return True
+        # Send using the known non-null local ws object.
+        self._SendToLocal(localWs, buffer, sendType)
 
-            # Sleep for a bit to wait for the socket open. The socket will open super quickly (5-10ms), so don't delay long.
-            # Sleep for 5ms.
-            time.sleep(0.005)
+        # Always return false, to keep the socket alive.
+        return False
 
+
+    # Returns the buffer and the send opt code for the message.
+    def _GetBufferAndSendType(self, webStreamMsg:WebStreamMsg.WebStreamMsg):
         # Note it's ok for this to be empty. Since DataAsByteArray returns 0 if it doesn't
         # exist, we need to check for it.
         buffer = webStreamMsg.DataAsByteArray()
@@ -299,16 +441,10 @@ class OctoWebStreamWsHelper:
             sendType = octowebsocket.ABNF.OPCODE_CLOSE
         else:
             raise Exception("Web stream ws was sent a data type that's unknown. "+str(msgType))
+        return (buffer, sendType)
 
-        # Before we send, make sure we have a local websocket still and it's not closed.
-        # If the websocket object is closed ignore this message. It will throw if the socket is closed
-        # which will take down the entire OctoStream. But since it's closed the web stream is already cleaning up.
-        # This can happen if the socket closes locally and we sent the message to clean up to the service, but there
-        # were already inbound messages on the way.
-        localWs = self.Ws
-        if self.IsWsObjClosed or self.IsClosed or localWs is None:
-            return True
-        # Send using the known non-null local ws object.
+
+    def _SendToLocal(self, localWs, buffer, sendType) -> None:
         localWs.SendWithOptCode(buffer, optCode=sendType)
 
         # Log for perf tracking
@@ -316,8 +452,27 @@ class OctoWebStreamWsHelper:
             self.Logger.info(self.getLogMsgPrefix()+"first message sent to local server after " +str(time.time() - self.OpenedTime) + " seconds")
             self.FirstWsMessageSentToLocal = True
 
-        # Always return false, to keep the socket alive.
-        return False
+
+    # Fired if the local websocket didn't open in time to send the pending messages.
+    def _OnPendingMsgTimeout(self):
+        with self.PendingMsgLock:
+            if self.IsWsObjOpened or len(self.PendingMsgs) == 0:
+                return
+            self.PendingMsgs.clear()
+        self.Logger.warn(self.getLogMsgPrefix()+" the local websocket didn't open in time to send the pending messages, closing.")
+        self.WebStream.Close()
+
+
+    # Sends any pending messages and marks the websocket as opened, so new messages are sent directly.
+    def _FlushPendingMsgsAndSetOpened(self, localWs) -> None:
+        with self.PendingMsgLock:
+            if self.PendingMsgTimer is not None:
+                self.PendingMsgTimer.cancel()
+                self.PendingMsgTimer = None
+            for buffer, sendType in self.PendingMsgs:
+                self._SendToLocal(localWs, buffer, sendType)
+            self.PendingMsgs.clear()
+            self.IsWsObjOpened = True
 
 
     def onWsData(self, ws, buffer:bytes, msgType):
@@ -468,11 +623,16 @@ class OctoWebStreamWsHelper:
         if self.Ws is not None and self.Ws != ws:
             return
 
-        # Update the state to indicate we are ready to take messages.
+        # Update the state to indicate we are ready to take messages, and send any messages that came in while we were connecting.
         self.IsWsObjClosed = False
-        self.IsWsObjOpened = True
         self.SuccessfullyOpenedSocket = True
-        self.Logger.info(self.getLogMsgPrefix()+"opened, attempt "+str(self.ConnectionAttempt) + " after " +str(time.time() - self.OpenedTime) + " seconds")
+        self._FlushPendingMsgsAndSetOpened(ws)
+        openSec = time.time() - self.OpenedTime
+        self.Logger.info(self.getLogMsgPrefix()+"opened, attempt "+str(self.ConnectionAttempt) + " after " +str(openSec) + " seconds")
+
+        # Remember the target that worked, so it's tried first next time.
+        if self.AttemptTarget is not None:
+            WsConnectTargetCache.OnTargetOpened(self.Logger, self.PathTemplate, self.AttemptTarget, self.ConnectionAttempt, openSec)
 
 
     def getLogMsgPrefix(self):
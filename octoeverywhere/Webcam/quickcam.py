@@ -158,6 +158,10 @@ class QuickCam:
     # How often the stall out monitor will check for a stall.
     c_StallMonitorThreadCheckIntervalSec = 5
 
+    # After the last stream viewer leaves, how long we will keep the capture running at the full stream rate before switching to the snapshot only rate.
+    # This prevents us from restarting the capture over and over when a viewer reloads the page or the stream reconnects.
+    c_FullRateHoldAfterLastViewerSec = 15
+
 
     def __init__(self, logger:logging.Logger, url:str, webcamPlatformHelperInterface) -> None:
         self.Logger = logger
@@ -168,10 +172,15 @@ class QuickCam:
         self.ImageReady = threading.Event()
         self.IsCaptureThreadRunning = False
         self.CurrentImage:bytearray = None
-        self.ImageCounter = 0 # Used to monitor stalls
+        self.ImageCounter = 0 # Used to monitor stalls, only the capture thread writes this.
         self.LastImageRequestTimeSec:float = 0.0
-        self.ImageStreamCallbacks = []
-        self.ImageStreamCallbackLock = threading.Lock()
+        # The latest frame slot, this is a tuple of (frameNumber, imageBuffer) or None.
+        # It's swapped as a single reference by the capture thread, so stream subscribers can read it without a lock.
+        self.LatestFrame:tuple = None
+        # This is a copy-on-write tuple of stream subscribers. It's only replaced under the lock, so the capture thread can iterate it without taking the lock.
+        self.StreamSubscribers = ()
+        self.StreamSubscribersLock = threading.Lock()
+        self.LastStreamSubscriberTimeSec:float = 0.0
 
 
     # Given a URL, this function returns the quick cam type that will be used and if it's supported.
@@ -221,38 +230,60 @@ class QuickCam:
         return self.CurrentImage
 
 
-    # Used to attach a new stream handler to receive callbacks when an image is ready.
+    # Returns the latest frame as a tuple of (frameNumber, imageBuffer), or None if there's no image.
+    # The frame number always increases, so stream subscribers can use it to tell if they missed any frames.
+    def GetLatestFrame(self) -> tuple:
+        return self.LatestFrame
+
+
+    # Used to attach a new stream subscriber that will be woken up when a new frame is ready.
+    # The subscriber must implement OnNewFrameReady(), which is called on the capture thread and must never block.
+    # The subscriber should then read the frame with GetLatestFrame() on its own thread.
     # Note a call to detach must be called as well!
-    def AttachImageStreamCallback(self, callback):
-        # Add our callback to the list.
-        with self.ImageStreamCallbackLock:
-            self.ImageStreamCallbacks.append(callback)
+    def AttachStreamSubscriber(self, subscriber):
+        # Add our subscriber to the list.
+        with self.StreamSubscribersLock:
+            self.StreamSubscribers = self.StreamSubscribers + (subscriber,)
+            self.LastStreamSubscriberTimeSec = time.time()
 
         # Ensure that the capture thread is running.
         self._ensureCaptureThreadRunning()
 
 
-    # Used to detach a new stream handler to receive callbacks when an image is ready.
-    def DetachImageStreamCallback(self, callback):
-        # Remove our callback.
-        with self.ImageStreamCallbackLock:
-            self.ImageStreamCallbacks.remove(callback)
+    # Used to detach a stream subscriber.
+    def DetachStreamSubscriber(self, subscriber):
+        # Remove our subscriber.
+        with self.StreamSubscribersLock:
+            self.StreamSubscribers = tuple(s for s in self.StreamSubscribers if s is not subscriber)
+            self.LastStreamSubscriberTimeSec = time.time()
+
+
+    # Returns True if the capture can run in the snapshot only mode, which is a low frame rate and scaled down output.
+    # This is true when there are no stream viewers, and there haven't been any for a little bit.
+    # When there are no viewers, the only consumers are things like Gadget and notifications which only need an image every so often.
+    def _CanUseSnapshotOnlyMode(self) -> bool:
+        if len(self.StreamSubscribers) > 0:
+            return False
+        return time.time() - self.LastStreamSubscriberTimeSec > QuickCam.c_FullRateHoldAfterLastViewerSec
 
 
     # Called when there's a new image from the capture thread.
+    # This only publishes the frame and wakes the subscribers, it never waits on them.
     def _SetNewImage(self, img:bytearray) -> None:
         # Set the new image.
         self.CurrentImage = img
         self.ImageCounter += 1
+        self.LatestFrame = (self.ImageCounter, img)
         # Release anyone waiting on it.
         self.ImageReady.set()
-        # Fire the callbacks, if there are any.
-        with self.ImageStreamCallbackLock:
-            if len(self.ImageStreamCallbacks) > 0:
-                # Update the last image request time to ensure the stream keeps going.
-                self.LastImageRequestTimeSec = time.time()
-                for callback in self.ImageStreamCallbacks:
-                    callback(self.CurrentImage)
+        # Wake any stream subscribers. Grab the tuple once, since it can be swapped while we are iterating.
+        subscribers = self.StreamSubscribers
+        if len(subscribers) > 0:
+            # Update the last image request time to ensure the stream keeps going.
+            self.LastImageRequestTimeSec = time.time()
+            self.LastStreamSubscriberTimeSec = self.LastImageRequestTimeSec
+            for subscriber in subscribers:
+                subscriber.OnNewFrameReady()
 
 
     # Call to make sure the capture thread is running.
@@ -278,6 +309,8 @@ class QuickCam:
             # We allow a few attempts, so if there are any connection issues or errors we buffer them out.
             # This is really helpful for ffmpeg and for the Elegoo OS webcam server, which can be flaky.
             attempts = 0
+            # When the capture mode changes, the new capture is started here while the current one keeps serving images.
+            warmUp:QuickCamWarmUp = None
             while attempts < 5:
                 attempts += 1
 
@@ -286,11 +319,26 @@ class QuickCam:
                 # But we will auto reconnect, so any clients streaming won't even know, beyond a small delay in the image stream.
                 maxSingleStreamTimeSec = None
 
-                # Create the camera implementation we need for this device.
+                # Some capture types can adapt how much work they do based on if there are stream viewers or not.
+                # If this is set, we will check if the mode needs to change as viewers come and go, and reconnect if so.
+                snapshotOnlyMode = None
+
+                # If a new capture was started for a mode change, use it if it's producing images.
                 camImpl = None
-                if self.Type == QuickCamStreamTypes.RTSP:
-                    self.Logger.debug(f"QuickCam capture thread started for RTSP. {self.Url}")
-                    camImpl = QuickCam_RTSP(self.Logger)
+                firstImg = None
+                if warmUp is not None:
+                    camImpl, firstImg = warmUp.Finish()
+                    warmUp = None
+
+                # Create the camera implementation we need for this device.
+                if camImpl is not None:
+                    snapshotOnlyMode = camImpl.SnapshotOnlyMode
+                    self.Logger.debug(f"QuickCam capture switched to the new RTSP capture. Snapshot only mode: {snapshotOnlyMode} {self.Url}")
+                elif self.Type == QuickCamStreamTypes.RTSP:
+                    # ffmpeg transcoding is expensive, so when no one is watching the stream we drop the frame rate and output size.
+                    snapshotOnlyMode = self._CanUseSnapshotOnlyMode()
+                    self.Logger.debug(f"QuickCam capture thread started for RTSP. Snapshot only mode: {snapshotOnlyMode} {self.Url}")
+                    camImpl = QuickCam_RTSP(self.Logger, snapshotOnlyMode)
                 elif self.Type == QuickCamStreamTypes.WebSocket:
                     self.Logger.debug(f"QuickCam capture thread started for Websocket. {self.Url}")
                     camImpl = QuickCam_WebSocket(self.Logger)
@@ -310,9 +358,12 @@ class QuickCam:
                         # Tell the platform we are starting the stream.
                         self.WebcamPlatformHelperInterface.OnQuickCamStreamStart(self.Url)
 
-                        # Connect to the server.
+                        # Connect to the server, unless the new capture is already connected and has given us its first image.
                         connectionStartSec = time.time()
-                        camImpl.Connect(self.Url)
+                        if firstImg is None:
+                            camImpl.Connect(self.Url)
+                        else:
+                            self._SetNewImage(firstImg)
 
                         # Begin the capture loop.
                         while True:
@@ -340,6 +391,18 @@ class QuickCam:
                                 self.Logger.debug("QuickCam capture thread hit the max single stream time. Ending this connect to start a new one...")
                                 break
 
+                            # Check if viewers have joined or left and the capture mode needs to change.
+                            # The new capture is started in the background, and this one keeps serving images until the new one has its first image.
+                            # If the new capture fails to start, we fall back to closing this one and connecting again, which leaves a short gap in the images.
+                            if snapshotOnlyMode is not None:
+                                if warmUp is None:
+                                    if snapshotOnlyMode != self._CanUseSnapshotOnlyMode():
+                                        self.Logger.info(f"QuickCam capture switching snapshot only mode to {not snapshotOnlyMode}. Stream viewers: {len(self.StreamSubscribers)}")
+                                        warmUp = QuickCamWarmUp(self.Logger, QuickCam_RTSP(self.Logger, not snapshotOnlyMode), self.Url)
+                                elif warmUp.IsDone():
+                                    attempts = 0
+                                    break
+
                     except Exception as e:
                         # We have seen times where random errors are returned, like on boot or if the stream is opened too soon after closing.
                         # This exception block is designed to eat any connection or buffer parsing errors, eat them, and try again.
@@ -350,6 +413,9 @@ class QuickCam:
         finally:
             # Before exit the thread...
             # Note that order is important here!
+            # If there's a new capture starting, make sure it's cleaned up.
+            if warmUp is not None:
+                warmUp.Abandon()
             # Ensure we clear the image ready event.
             self.ImageReady.clear()
             # Clear the flag that we are running.
@@ -357,6 +423,7 @@ class QuickCam:
                 self.IsCaptureThreadRunning = False
             # And ensure that the current image is cleaned up, so clients don't get a stale image.
             self.CurrentImage = None
+            self.LatestFrame = None
             self.Logger.info("QuickCam capture thread exit.")
 
 
@@ -368,7 +435,7 @@ class QuickCam:
                 # Set the last counter here so if something throws we still get current values.
                 lastImageCounter = self.ImageCounter
                 while self.IsCaptureThreadRunning:
-                    # Sleep for a bit until we want to check for a stall.quic
+                    # Sleep for a bit until we want to check for a stall.
                     time.sleep(QuickCam.c_StallMonitorThreadCheckIntervalSec)
 
                     # Ensure we are still running.
@@ -381,8 +448,9 @@ class QuickCam:
                         # Report the stall.
                         self.WebcamPlatformHelperInterface.OnQuickCamStreamStall(self.Url)
 
-                    # Update the counter.
-                    self.ImageCounter = lastImageCounter
+                    # Remember the current count for the next check.
+                    # Only the capture thread writes ImageCounter, so this must never write it back, or frame ids would repeat.
+                    lastImageCounter = self.ImageCounter
             except Exception as e:
                 Sentry.Exception("Exception in QuickCam stall monitor thread. ", e)
 
@@ -600,6 +668,70 @@ class QuickCam_Jmpeg:
             pass
 
 
+# Connects a new capture implementation and reads its first image on a background thread.
+# This is used when the capture mode changes, so the current capture can keep serving images while the new one starts.
+class QuickCamWarmUp:
+
+    def __init__(self, logger:logging.Logger, camImpl, url:str) -> None:
+        self.Logger = logger
+        self.CamImpl = camImpl
+        self.Url = url
+        self.FirstImage:bytearray = None
+        self.Error:Exception = None
+        self.Lock = threading.Lock()
+        self.IsAbandoned = False
+        self.DoneEvent = threading.Event()
+        t = threading.Thread(target=self._Run, name="QuickCamWarmUpThread")
+        t.daemon = True
+        t.start()
+
+
+    # Returns True when the new capture has its first image or it failed.
+    def IsDone(self) -> bool:
+        return self.DoneEvent.is_set()
+
+
+    # Waits for the warm up to finish.
+    # On success, returns the connected capture implementation and its first image, the caller now owns the implementation.
+    # On failure, the implementation is cleaned up and None, None is returned.
+    def Finish(self):
+        self.DoneEvent.wait()
+        if self.Error is None and self.FirstImage is not None:
+            return self.CamImpl, self.FirstImage
+        self.Logger.warning(f"QuickCam failed to start the new capture for the mode change. {self.Error}")
+        self._Close()
+        return None, None
+
+
+    # Called if the capture thread exits before it takes the new capture, it will be cleaned up when it's done.
+    def Abandon(self) -> None:
+        with self.Lock:
+            self.IsAbandoned = True
+            if self.DoneEvent.is_set() is False:
+                return
+        self._Close()
+
+
+    def _Run(self):
+        try:
+            self.CamImpl.Connect(self.Url)
+            # GetImage will throw if it times out, so this can't spin forever.
+            while self.FirstImage is None:
+                self.FirstImage = self.CamImpl.GetImage()
+        except Exception as e:
+            self.Error = e
+        finally:
+            with self.Lock:
+                self.DoneEvent.set()
+                isAbandoned = self.IsAbandoned
+            if isAbandoned:
+                self._Close()
+
+
+    def _Close(self):
+        self.CamImpl.__exit__(None, None, None)
+
+
 # Implements the websocket camera version for the X1 series printers.
 class QuickCam_RTSP:
 
@@ -609,9 +741,15 @@ class QuickCam_RTSP:
     # Adds a ton of logging useful for debugging.
     c_DebugLogging = False
 
+    # When no one is watching the stream, the images are only used for things like Gadget and notifications.
+    # In this mode we only transcode a few frames and cap the output width, which greatly reduces the CPU ffmpeg uses.
+    c_SnapshotOnlyFps = 1
+    c_SnapshotOnlyMaxWidth = 1280
 
-    def __init__(self, logger:logging.Logger):
+
+    def __init__(self, logger:logging.Logger, snapshotOnlyMode:bool = False):
         self.Logger = logger
+        self.SnapshotOnlyMode = snapshotOnlyMode
         self.Process:subprocess.Popen = None
 
         # Image getting stuff
@@ -645,6 +783,12 @@ class QuickCam_RTSP:
         fps = 10
         if url.find("bblp:") != -1:
             fps = 15
+        videoFilter = f"fps={fps}"
+
+        # If no one is watching the stream, use a low frame rate and scale the output down if it's large.
+        # The -2 keeps the aspect ratio while making sure the height is divisible by 2.
+        if self.SnapshotOnlyMode:
+            videoFilter = f"fps={QuickCam_RTSP.c_SnapshotOnlyFps},scale='min({QuickCam_RTSP.c_SnapshotOnlyMaxWidth},iw)':-2"
 
         # For auth, if there's a username and password it will already be in the URL in the http:// basic auth style,
         # So there's nothing else we need to do.
@@ -659,7 +803,7 @@ class QuickCam_RTSP:
                     "-rtsp_transport", "0", # Use a value of 0, so both TCP and UDP can be used.
                     "-use_wallclock_as_timestamps", "1",
                     "-i", url,
-                    "-filter:v", f"fps={fps}",
+                    "-filter:v", videoFilter,
                     "-movflags", "+faststart",
                     "-f", "image2pipe", "-"
                     ],
@@ -1,6 +1,8 @@
 import logging
 import os
 import json
+import time
+import threading
 from typing import List
 
 from ..sentry import Sentry
@@ -9,6 +11,21 @@ from .quickcam import QuickCamManager
 from ..octohttprequest import OctoHttpRequest
 from .webcamsettingitem import WebcamSettingItem
 
+
+# An immutable snapshot of the current webcam config.
+# Once created, this object and the lists in it are never modified, so it can be read from any thread without a lock.
+# When the webcam settings change, a new snapshot is built and the reference on the WebcamHelper is swapped.
+class WebcamConfigSnapshot:
+
+    def __init__(self, version:int, items:List[WebcamSettingItem], defaultIndex:int) -> None:
+        # The invalidation version this snapshot was built for.
+        self.Version = version
+        # The full ordered list of webcams, platform webcams first, then any enabled plugin local webcams.
+        self.Items = tuple(items)
+        # The index of the default webcam in Items, this is always a valid index if there are items.
+        self.DefaultIndex = defaultIndex
+        self.CreatedSec = time.time()
+
 # The point of this class is to abstract the logic that needs to be done to reliably get a webcam snapshot and stream from many types of
 # printer setups. The main entry point is GetSnapshot() which will try a number of ways to get a snapshot from whatever camera system is
 # setup. This includes USB based cameras, external IP based cameras, and OctoPrint instances that don't have a snapshot URL defined.
@@ -27,6 +44,10 @@ class WebcamHelper:
     # A header we apply to all snapshot and webcam streams so the client can get the correct transforms the user has setup.
     c_OeWebcamTransformHeaderKey = "x-oe-webcam-transform"
 
+    # The max amount of time a webcam config snapshot will be used before we query the platform again.
+    # Platforms should push changes with OnWebcamSettingsChanged, so this is only a safety net for any settings change we don't get notified about.
+    c_WebcamConfigSnapshotMaxAgeSec = 30.0
+
     # Logic for a static singleton
     _Instance = None
 
@@ -46,6 +67,12 @@ class WebcamHelper:
         self.Logger = logger
         self.WebcamPlatformHelperInterface = webcamPlatformHelperInterface
 
+        # The current webcam config snapshot and the version it must match to be valid.
+        # Reading the snapshot is just a reference read, we only take the lock when we need to build a new one.
+        self.WebcamConfigSnapshotLock = threading.Lock()
+        self.WebcamConfigSnapshot:WebcamConfigSnapshot = None
+        self.WebcamConfigVersion = 0
+
         # Init local webcam settings stuffs.
         self.SettingsFilePath = os.path.join(pluginDataFolderPath, "webcam-settings.json")
         self.DefaultCameraName:str = None
@@ -234,17 +261,18 @@ class WebcamHelper:
     # If there are no webcams, this will return None
     def _GetWebcamSettingObj(self, cameraIndex:int = None):
         try:
-            # Get the current list of webcam settings.
-            webcamItems = self.ListWebcams()
-            if webcamItems is None or len(webcamItems) == 0:
+            # Get the current webcam config.
+            snapshot = self.GetWebcamConfigSnapshot()
+            webcamItems = snapshot.Items
+            if len(webcamItems) == 0:
                 return None
 
-            # If a camera index wasn't passed, get the default index.
+            # If a camera index wasn't passed, use the default index.
             if cameraIndex is None:
-                cameraIndex = self.GetDefaultCameraIndex(webcamItems)
+                cameraIndex = snapshot.DefaultIndex
 
-            # We will always get a default index back from the above function.
-            if cameraIndex is not None and cameraIndex >= 0 and cameraIndex < len(webcamItems):
+            # We will always get a default index back from the snapshot.
+            if cameraIndex >= 0 and cameraIndex < len(webcamItems):
                 return webcamItems[cameraIndex]
 
             self.Logger.warn(f"_GetWebcamSettingObj asked for {cameraIndex} but it was out of bounds. Max: {len(webcamItems)}")
@@ -259,26 +287,66 @@ class WebcamHelper:
     # The default is usually the index 0.
     def ListWebcams(self) -> List[WebcamSettingItem]:
         try:
-            # Get the webcams from the platform.
-            ret = self.WebcamPlatformHelperInterface.GetWebcamConfig()
-
-            # Check if there are any plugin local items to return.
-            # Note the cameras returned from ListWebcams() must always be first - the bambu logic depends on this! (see GetSnapshot_Override)
-            pluginLocalWebcamItems = self.GetPluginLocalWebcamList()
-            if pluginLocalWebcamItems is not None and len(pluginLocalWebcamItems) > 0:
-                if ret is None:
-                    ret = []
-                ret.extend(pluginLocalWebcamItems)
-
+            items = self.GetWebcamConfigSnapshot().Items
             # Ensure we got something
-            if ret is None or len(ret) == 0:
+            if len(items) == 0:
                 return None
-            return ret
+            # Return a copy of the list, so the caller can't modify the snapshot.
+            return list(items)
         except Exception as e:
             Sentry.Exception("WebcamHelper ListWebcams exception.", e)
         return None
 
 
+    # Returns the current webcam config snapshot. This will never return None.
+    # The returned object is immutable, it must not be modified by the caller.
+    # In the common case, this is just a reference read. The snapshot is only rebuilt if it was invalidated or it's too old.
+    def GetWebcamConfigSnapshot(self) -> WebcamConfigSnapshot:
+        snapshot = self.WebcamConfigSnapshot
+        if snapshot is not None and snapshot.Version == self.WebcamConfigVersion and time.time() - snapshot.CreatedSec < WebcamHelper.c_WebcamConfigSnapshotMaxAgeSec:
+            return snapshot
+        return self._BuildWebcamConfigSnapshot()
+
+
+    # Called by the platforms or the plugin local settings logic when the webcam settings have changed.
+    # This invalidates the current snapshot, so the next webcam request will get the new config from the platform.
+    def OnWebcamSettingsChanged(self) -> None:
+        with self.WebcamConfigSnapshotLock:
+            self.WebcamConfigVersion += 1
+        self.Logger.debug(f"Webcam config snapshot invalidated. New version: {self.WebcamConfigVersion}")
+
+
+    # Builds a new webcam config snapshot from the platform and sets it as the current snapshot.
+    def _BuildWebcamConfigSnapshot(self) -> WebcamConfigSnapshot:
+        # Only allow one thread to build the snapshot at a time, so if many requests come in at once we only query the platform once.
+        with self.WebcamConfigSnapshotLock:
+            # Check if another thread built the snapshot while we were waiting for the lock.
+            snapshot = self.WebcamConfigSnapshot
+            version = self.WebcamConfigVersion
+            if snapshot is not None and snapshot.Version == version and time.time() - snapshot.CreatedSec < WebcamHelper.c_WebcamConfigSnapshotMaxAgeSec:
+                return snapshot
+
+            items = []
+            try:
+                # Get the webcams from the platform.
+                platformItems = self.WebcamPlatformHelperInterface.GetWebcamConfig()
+                if platformItems is not None:
+                    items.extend(platformItems)
+            except Exception as e:
+                Sentry.Exception("WebcamHelper failed to get the webcam config from the platform.", e)
+
+            # Check if there are any plugin local items to return.
+            # Note the cameras returned from the platform must always be first - the bambu logic depends on this! (see GetSnapshot_Override)
+            pluginLocalWebcamItems = self.GetPluginLocalWebcamList()
+            if pluginLocalWebcamItems is not None and len(pluginLocalWebcamItems) > 0:
+                items.extend(pluginLocalWebcamItems)
+
+            # Set the new snapshot. If the settings are invalidated while we were building, the version won't match and the next call will build again.
+            snapshot = WebcamConfigSnapshot(version, items, self.GetDefaultCameraIndex(items))
+            self.WebcamConfigSnapshot = snapshot
+            return snapshot
+
+
     # Checks if the result was success and if so adds the common header.
     # Returns the octoHttpResult, so the function is chainable
     def _AddOeWebcamTransformHeader(self, octoHttpResult, cameraIndex:int):
@@ -290,6 +358,8 @@ class WebcamHelper:
 
         # If there are any settings build a string with them all contaminated.
         settings = self._GetWebcamSettingObj(cameraIndex)
+        if settings is None:
+            return octoHttpResult
         if settings.FlipH or settings.FlipV or settings.Rotation != 0:
             transformStr = ""
             if settings.FlipH:
@@ -416,6 +486,7 @@ class WebcamHelper:
         name = name.lower()
         self.DefaultCameraName = name
         self._SavePluginWebcamSettings()
+        self.OnWebcamSettingsChanged()
 
 
     # Returns the default camera index. This will always return an int.
@@ -460,6 +531,7 @@ class WebcamHelper:
 
         # Set the new list.
         self.LocalPluginWebcamSettingsObjects = newList
+        self.OnWebcamSettingsChanged()
 
         # Save the settings
         return self._SavePluginWebcamSettings()
@@ -17,23 +17,31 @@ class WebcamStreamInstance:
         self.IsFirstSend = True
         self.StreamOpenTimeSec = time.time()
         self.ImageReadyEvent = threading.Event()
-        self.AwaitingImage:bytearray = None
+        # The frame number of the last image we sent, used to detect new and dropped frames.
+        self.LastSentFrameNumber = 0
+        # Stats for this viewer. Frames are dropped when QuickCam publishes new frames faster than we can send them.
+        self.FramesSent = 0
+        self.FramesDropped = 0
 
 
     # This will attempt to start a stream of the webcam.
     # On success, it will return an OctoHttpRequest.Result object with a data callback setup.
     # On failure, it will return None.
     def StartWebRequest(self) -> OctoHttpRequest.Result:
-        # First, try to get a snapshot. This will determine if we are able to get a stream or not.
+        # Attach before we get the first image, so QuickCam knows there's a viewer and starts the capture at the full stream rate.
+        # Otherwise a cold start would launch the snapshot only capture and then have to switch right away.
+        # Note! We must be sure to call DetachStreamSubscriber to remove this stream subscriber!
+        # Set the event so the first read will send the current image without waiting.
+        self.ImageReadyEvent.set()
+        self.QuickCam.AttachStreamSubscriber(self)
+
+        # Next, try to get a snapshot. This will determine if we are able to get a stream or not.
         # If we can't start the stream, then we don't return success.
         # We will also use this first image to start the stream, to get it going ASAP.
-        self.AwaitingImage = self.QuickCam.GetCurrentImage()
-        if self.AwaitingImage is None:
+        if self.QuickCam.GetCurrentImage() is None:
+            self.QuickCam.DetachStreamSubscriber(self)
             return None
 
-        # Note! We must be sure to call DetachImageStreamCallback to remove this stream callback!
-        self.QuickCam.AttachImageStreamCallback(self._NewImageCallback)
-
         # We must set the content type so that the web browser knows what kind of stream to expect.
         headers = {
             "content-type": f"multipart/x-mixed-replace; boundary={WebcamStreamInstance.c_OeStreamBoundaryString}",
@@ -43,21 +51,28 @@ class WebcamStreamInstance:
         return OctoHttpRequest.Result(200, headers, WebcamStreamInstance.c_OeStreamBoundaryString, False, customBodyStreamCallback=self._CustomBodyStreamRead, customBodyStreamClosedCallback=self._CustomBodyStreamClosed)
 
 
-    # Define the callback we will get from QuickCam when there's a new image ready for us to send.
-    def _NewImageCallback(self, imgBuffer:bytearray):
-        self.AwaitingImage = imgBuffer
+    # QuickCam stream subscriber interface - Called on the QuickCam capture thread when there's a new frame ready.
+    # This must never block, it only wakes up our stream thread, which will read the latest frame itself.
+    def OnNewFrameReady(self) -> None:
         self.ImageReadyEvent.set()
 
 
     # Define a callback for our http body reading system to call when it needs data.
     def _CustomBodyStreamRead(self) -> bytearray:
         while True:
+            # Clear the event before we read the frame slot, so we can't miss a wake up for a frame that's published after we read it.
+            self.ImageReadyEvent.clear()
+
             # See if we can capture an image. There might already be a new image we don't even have to wait for.
-            capturedImage = self.AwaitingImage
-            if capturedImage is not None:
-                # If so, clear the awaiting image and reset the event.
-                self.AwaitingImage = None
-                self.ImageReadyEvent.clear()
+            frame = self.QuickCam.GetLatestFrame()
+            if frame is not None and frame[0] != self.LastSentFrameNumber:
+                frameNumber, capturedImage = frame
+
+                # If there were frames published between the last frame we sent and this one, this viewer couldn't keep up and they were dropped.
+                if self.LastSentFrameNumber != 0 and frameNumber > self.LastSentFrameNumber + 1:
+                    self.FramesDropped += frameNumber - self.LastSentFrameNumber - 1
+                self.LastSentFrameNumber = frameNumber
+                self.FramesSent += 1
 
                 # Build the buffer to send
                 header = f"--{WebcamStreamInstance.c_OeStreamBoundaryString}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(capturedImage)}\r\n\r\n"
@@ -78,4 +93,5 @@ class WebcamStreamInstance:
     # Define a callback for when the http stream is closed.
     def _CustomBodyStreamClosed(self) -> None:
         # It's important this is called so the stream will be detached!
-        self.QuickCam.DetachImageStreamCallback(self._NewImageCallback)
+        self.QuickCam.DetachStreamSubscriber(self)
+        self.Logger.debug(f"QuickCam stream closed. Open for {round(time.time()-self.StreamOpenTimeSec, 1)}s, frames sent: {self.FramesSent}, frames dropped: {self.FramesDropped}")
@@ -180,18 +180,16 @@ class CommandHandler:
     # Must return a CommandResponse
     def ListWebcams(self, includeUrls = True):
         # Get all of the known webcams
-        webcamSettingsItems = WebcamHelper.Get().ListWebcams()
-        if webcamSettingsItems is None:
-            webcamSettingsItems = []
+        webcamConfigSnapshot = WebcamHelper.Get().GetWebcamConfigSnapshot()
         # We need to convert the objects into a dic to serialize.
         # Note this format is also used for GetStatus!
         webcams = []
-        for i in webcamSettingsItems:
+        for i in webcamConfigSnapshot.Items:
             webcams.append(i.Serialize(includeUrls))
 
         # We always use the default index, which is a reflection of the current camera list.
         # We don't use the name, we only use that internally to keep track of the current index.
-        defaultIndex = WebcamHelper.Get().GetDefaultCameraIndex(webcamSettingsItems)
+        defaultIndex = webcamConfigSnapshot.DefaultIndex
         responseObj = {
             "Webcams" : webcams,
             "DefaultIndex" : defaultIndex
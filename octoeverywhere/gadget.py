@@ -3,6 +3,7 @@ import threading
 import time
 import json
 import logging
+from collections import deque
 
 from .sentry import Sentry
 from .snapshotresizeparams import SnapshotResizeParams
@@ -10,6 +11,9 @@ from .repeattimer import RepeatTimer
 from .debugprofiler import DebugProfiler, DebugProfilerFeatures
 from .httpsessions import HttpSessions
 
+# Gadget inspections are pipelined. The timer thread captures and preprocesses the snapshot, and then hands it off to
+# the upload thread, which sends it to the server and handles the response. The timer runs at a fixed rate from the start of
+# each capture, so a slow upload doesn't delay the next capture or push out the inspection interval.
 class Gadget:
 
     # The default amount of time we will use for the first interval callback.
@@ -33,6 +37,15 @@ class Gadget:
         self.Lock = threading.Lock()
         self.Timer = None
         self.Profiler = None
+
+        # The upload pipeline state. There's at most one inspection waiting to be uploaded, if a new capture is ready before
+        # the pending one is uploaded, the older one is replaced, since the newest image is the most useful.
+        # The generation is incremented each time we start or stop watching, so any inspection still in flight from the last
+        # session is ignored when it completes.
+        self.UploadCondition = threading.Condition()
+        self.PendingUpload:dict = None
+        self.UploadThread:threading.Thread = None
+        self.WatchGeneration = 0
         self.DefaultProtocolAndDomain = "https://gadget-v1-oeapi.octoeverywhere.com"
         self.FailedConnectionAttempts = 0
 
@@ -45,7 +58,8 @@ class Gadget:
         # The most recent Gadget score sent back and the time it was received at.
         self.MostRecentGadgetScore = 0.0
         self.MostRecentGadgetScoreUpdateTimeSec = 0
-        self.ScoreHistory = []
+        # A fixed size ring buffer of scores, the most recent score is first.
+        self.ScoreHistory = deque(maxlen=Gadget.c_maxScoreHistoryItems)
         self.MostRecentIntervalSec = Gadget.c_defaultIntervalSec
         # These default to None, to indicate they haven't been done.
         self.MostRecentWarningTimeSec = None
@@ -77,8 +91,17 @@ class Gadget:
 
             self.Logger.info("Gadget is now watching!")
 
+            # Start the upload thread for this session.
+            with self.UploadCondition:
+                self.WatchGeneration += 1
+                self.PendingUpload = None
+                self.UploadThread = threading.Thread(target=self._uploadThread, args=(self.WatchGeneration,), name="GadgetUpload")
+                self.UploadThread.daemon = True
+                self.UploadThread.start()
+
             # Start a new timer.
-            self.Timer = RepeatTimer(self.Logger, "Gadget", Gadget.c_defaultIntervalSec, self._timerCallback)
+            # The timer is fixed rate, so the interval is from the start of each capture, not when the upload finishes.
+            self.Timer = RepeatTimer(self.Logger, "Gadget", Gadget.c_defaultIntervalSec, self._timerCallback, fixedRate=True)
             self.Timer.start()
 
 
@@ -97,7 +120,7 @@ class Gadget:
     # Returns the history of scores for this print.
     # Defaults to an empty list.
     def GetScoreHistoryFloats(self):
-        return self.ScoreHistory
+        return list(self.ScoreHistory)
 
 
     # Returns the seconds since the last Gadget score update.
@@ -140,7 +163,7 @@ class Gadget:
         # Reset the basic stats
         self.MostRecentIntervalSec = Gadget.c_defaultIntervalSec
         self.MostRecentGadgetScore = 0.0
-        self.ScoreHistory = []
+        self.ScoreHistory = deque(maxlen=Gadget.c_maxScoreHistoryItems)
 
         # At the start of each print, clear the host lock settings.
         self._clearHostLockHostname()
@@ -156,6 +179,12 @@ class Gadget:
             self.Logger.info("Gadget has stopped watching!")
             self.Timer.Stop()
             self.Timer = None
+        # Stop the upload thread. Any upload in flight will finish, but the result will be ignored.
+        with self.UploadCondition:
+            self.WatchGeneration += 1
+            self.PendingUpload = None
+            self.UploadThread = None
+            self.UploadCondition.notify_all()
 
 
     def _updateTimerInterval(self, newIntervalSec):
@@ -238,6 +267,41 @@ class Gadget:
                 self._updateTimerInterval(Gadget.c_defaultIntervalSec_NoSnapshot)
                 return
 
+            # Hand the inspection off to the upload thread, so we don't block the timer on the upload.
+            with self.UploadCondition:
+                if self.UploadThread is None:
+                    return
+                if self.PendingUpload is not None:
+                    self.Logger.debug("Gadget replaced a pending inspection that wasn't uploaded yet, the uplink is slower than the inspection interval.")
+                self.PendingUpload = { "Args": args, "Files": files }
+                self.UploadCondition.notify_all()
+
+            # Report if needed
+            self.Profiler.ReportIfNeeded()
+
+        except Exception as e:
+            Sentry.Exception("Exception in gadget timer", e)
+            # On any error, clear the HostLock hostname, so we hit the root domain again.
+            self._clearHostLockHostname()
+
+
+    # The upload thread for a watch session. This exits when the watch session ends.
+    def _uploadThread(self, generation:int):
+        while True:
+            # Wait for the next inspection to upload.
+            with self.UploadCondition:
+                while self.PendingUpload is None and generation == self.WatchGeneration:
+                    self.UploadCondition.wait()
+                if generation != self.WatchGeneration:
+                    return
+                upload = self.PendingUpload
+                self.PendingUpload = None
+            self._uploadInspection(generation, upload["Args"], upload["Files"])
+
+
+    # Sends a captured inspection to the server and handles the response.
+    def _uploadInspection(self, generation:int, args:dict, files:dict):
+        try:
             jsonResponse = None
             try:
                 # Setup the url.
@@ -248,6 +312,10 @@ class Gadget:
                 # Set a timeout, but make it long, so the server has time to process.
                 r = HttpSessions.GetSession(gadgetApiUrl).post(gadgetApiUrl, data=args, files=files, timeout=10*60)
 
+                # If the watch session ended while we were uploading, ignore the result, so it doesn't leak into the next print.
+                if generation != self.WatchGeneration:
+                    return
+
                 # Check for success. Anything but a 200 we will consider a connection failure.
                 if r.status_code != 200:
                     raise Exception("Bad response code "+str(r.status_code))
@@ -347,11 +415,8 @@ class Gadget:
             # Reset the failed attempts counter
             self.FailedConnectionAttempts = 0
 
-            # Report if needed
-            self.Profiler.ReportIfNeeded()
-
         except Exception as e:
-            Sentry.Exception("Exception in gadget timer", e)
+            Sentry.Exception("Exception in gadget upload", e)
             # On any error, clear the HostLock hostname, so we hit the root domain again.
             self._clearHostLockHostname()
 
@@ -359,9 +424,8 @@ class Gadget:
     def _updateGadgetScore(self, newScore):
         # We keep track of all scores, for stats.
         # Round the scores to 4 decimals, so 0.9583 is 95.8%
-        self.ScoreHistory.insert(0, round(newScore, 3))
-        while len(self.ScoreHistory) > Gadget.c_maxScoreHistoryItems:
-            self.ScoreHistory.pop()
+        # The history is a fixed size ring buffer, so the oldest score is dropped when it's full.
+        self.ScoreHistory.appendleft(round(newScore, 3))
 
         # To smooth out outliers, use the new score and a sample of the old score.
         # But we also want the most recent score to stay responsive, due to interval delays.
@@ -0,0 +1,120 @@
+import re
+import json
+import logging
+
+# A helper class used by the printer clients to parse and serialize the json messages they send and receive.
+#
+# If the orjson lib is installed, it's used since it's a lot faster than the built in json lib. It's not a required
+# dependency, since it doesn't have wheels for all of the platforms we run on, so if it's not there we fall back to the built in json lib.
+#
+# This also has some helpers that can peek at a key in a raw message without parsing it, so the clients can skip
+# the full parse for high frequency messages that nothing consumes.
+class JsonCodec:
+
+    # Set if orjson is loaded and used.
+    _OrJson = None
+
+    # Only the start of the raw message is scanned when peeking, since the keys we peek at are always at the start of the message.
+    c_PeekScanLimitBytes = 64
+
+    # Compiled peek patterns, by key name.
+    _PeekPatterns = {}
+
+    @staticmethod
+    def Init(logger:logging.Logger):
+        try:
+            # pylint: disable=import-outside-toplevel
+            import orjson
+            JsonCodec._OrJson = orjson
+            logger.info("JsonCodec is using orjson.")
+        except Exception:
+            JsonCodec._OrJson = None
+            logger.debug("JsonCodec is using the built in json lib, orjson isn't installed.")
+
+
+    # Returns True if the fast orjson parser is being used.
+    @staticmethod
+    def IsUsingOrJson() -> bool:
+        return JsonCodec._OrJson is not None
+
+
+    # Parses the json bytes, bytearray, or string.
+    # This will throw if the json is invalid, just like json.loads.
+    @staticmethod
+    def Loads(data):
+        orjson = JsonCodec._OrJson
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+    # Serializes the object to a json string.
+    # Like how we use json.dumps, any object that can't be serialized will be converted with str().
+    @staticmethod
+    def Dumps(obj) -> str:
+        orjson = JsonCodec._OrJson
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=str).decode("utf-8")
+            except Exception:
+                # orjson is more strict than the built in json lib for things like non string dict keys or big ints,
+                # so if it fails, fall back to the built in json lib.
+                pass
+        return json.dumps(obj, default=str)
+
+
+    # Looks at the start of the raw json message and returns the string value of the given root level key if it's found there.
+    # If the key isn't found in the start of the message, or we can't be sure it's a root level key, None is returned.
+    # Since this can return None for messages that have the key, the caller must always fall back to a full parse if None is returned.
+    @staticmethod
+    def PeekRootStringValue(data, key:str):
+        try:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            pattern = JsonCodec._GetPeekPattern(key)
+            match = pattern.search(data, 0, JsonCodec.c_PeekScanLimitBytes)
+            if match is None:
+                return None
+            # If there's more than one open brace before the key, it might be in a nested object, so we can't trust it.
+            if data.count(b"{", 0, match.start()) != 1:
+                return None
+            return match.group(1).decode("utf-8")
+        except Exception:
+            return None
+
+
+    # Scans the whole raw json message for a string value of the given key, at any depth.
+    # The value is only returned if the key shows up exactly once in the message, so there's no question which one it is.
+    # If the key isn't found, shows up more than once, or the value has escaped chars, None is returned and the caller should fall back to a full parse.
+    @staticmethod
+    def FindUniqueStringValue(data, key:str):
+        try:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+            # If the key shows up more than once, we can't know which one is the one the caller wants.
+            if data.count(b'"' + key.encode("utf-8") + b'"') != 1:
+                return None
+            match = JsonCodec._GetPeekPattern(key).search(data)
+            if match is None:
+                return None
+            return match.group(1).decode("utf-8")
+        except Exception:
+            return None
+
+
+    @staticmethod
+    def _GetPeekPattern(key:str):
+        pattern = JsonCodec._PeekPatterns.get(key, None)
+        if pattern is None:
+            pattern = re.compile(rb'"' + re.escape(key.encode("utf-8")) + rb'"\s*:\s*"([^"\\]*)"')
+            JsonCodec._PeekPatterns[key] = pattern
+        return pattern
+
+
+    # Returns True if the key name shows up anywhere in the raw json message.
+    # This can return True for messages that don't have the key, but it will never return False for a message that does.
+    @staticmethod
+    def MightContainKey(data, key:str) -> bool:
+        if isinstance(data, str):
+            return '"' + key + '"' in data
+        return b'"' + key.encode("utf-8") + b'"' in data
@@ -5,23 +5,45 @@ import json
 
 import dns.resolver
 
+from .sentry import Sentry
 from .localip import LocalIpHelper
 
 # A helper class to resolve mdns domain names to IP addresses, since the request lib doesn't support
 # the mdns lookup.
+#
+# The lookups made when handling requests only ever read from the in memory cache, they never wait on the network.
+# All of the mdns queries are done on a background resolver thread. The resolver resolves names that are missing or getting old when they are used,
+# and it prefetches names that have been used recently before their TTL expires, so the cache stays warm.
+# If a name fails to resolve, it's not tried again for a short time, so names that don't exist don't cause a query for every request.
 class MDns:
 
-    # How old a cache entry can be before we try to refresh it.
+    # How old a cache entry can be before we try to refresh it, if the mdns response didn't have a TTL.
+    # This is also the min refresh time, so a short TTL doesn't cause a lot of queries.
     # We want to keep the cache fresh, so we don't get stuck with a stale DHCP ip address.
     CacheRefreshTimeSec = 20.0
 
+    # How much of the TTL can pass before we refresh the entry, so it's refreshed before it expires.
+    CacheRefreshTtlFraction = 0.75
+
     # How old a cache entry can be before we stop using it.
-    # Allow cache entries to exist for up to 24 hours, so we don't have to do long lookups.
-    # The only down side to this is if the DHCP ip is hoping a lot, we might get stale IPs sometimes
-    # most DHCP systems don't change IPs often, and most of the time they are sticky.
-    # Remember! Since the cache entries persist between restarts, this also makes them live longer.
+    # While a refresh is pending we will use older entries, since anything is better than nothing, but not past this.
+    # If the DHCP ip has moved and the name can't be resolved anymore, this keeps us from using the stale ip forever.
+    # Remember! Since the cache entries persist between restarts, this also bounds how old the loaded entries can be.
     MaxCacheTimeSec = 24 * 60.0 * 60.0
 
+    # The cache file is saved when an IP changes, but the refreshed entries still need to be saved sometimes, since the loaded entries are
+    # dropped once they are older than MaxCacheTimeSec. This is how often the file is saved when only the update times changed.
+    CacheFileRefreshSaveIntervalSec = 60 * 60.0
+
+    # How long a failed resolve is remembered, so we don't try to resolve it again right away.
+    NegativeCacheTimeSec = 30.0
+
+    # Names used within this time are kept fresh by the background resolver.
+    PrefetchActiveWindowSec = 10 * 60.0
+
+    # How often the background resolver checks if any names need to be prefetched.
+    PrefetchCheckIntervalSec = 5.0
+
     _Instance = None
     _Debug = False
 
@@ -43,6 +65,7 @@ class MDns:
         self.CacheFilePath = os.path.join(pluginDataFolderPath, "mDnsCache.json")
 
         # Try to load past stats from the file. If we fail, just restart.
+        self.LastCacheFileSaveTimeSec = 0.0
         self.Cache = None
         self._LoadCacheFile()
         if self.Cache is None:
@@ -60,6 +83,21 @@ class MDns:
             self.dnsResolver = None
             self.Logger.warn("Failed to create DNS class, local dns resolve is disabled. "+str(e))
 
+        # The state for the background resolver, all protected by the lock.
+        # The domains that need to be resolved.
+        self.PendingResolves = set()
+        # The last time each domain was asked for, used to know which domains should be prefetched.
+        self.LastUsedTimeSec = {}
+        # The last time each domain failed to resolve.
+        self.FailedResolveTimeSec = {}
+        self.ResolverEvent = threading.Event()
+
+        # Start the background resolver, if we can resolve.
+        if self.dnsResolver is not None:
+            t = threading.Thread(target=self._ResolverThread, name="MDnsResolver")
+            t.daemon = True
+            t.start()
+
 
     # Given a full url with protocol, hostname, and path, this will look for a local mdns hostname, try to resolve it, and return the full URL again with
     # the localhost name replaced. If no localhost name is found, if the resolve fails, or there's no entry in the cache, None is returned.
@@ -97,7 +135,7 @@ class MDns:
 
         # If we don't get something back, we failed to resolve.
         if resolveResult is None:
-            self.Logger.info("mDNS found a .local domain to resolve, but it failed to resolve. hostname: "+str(hostname) + ", url: "+str(url))
+            self.Logger.info("mDNS found a .local domain to resolve, but it's not resolved yet or it failed to resolve. hostname: "+str(hostname) + ", url: "+str(url))
             return None
 
         # Inject the IP resolved into the url.
@@ -106,44 +144,86 @@ class MDns:
         return result
 
 
-    # Returns a string with the local IP if the IP can be found, otherwise, it returns None.
+    # Returns a string with the local IP if the IP is in the cache, otherwise, it returns None.
+    # This never waits on the network. If the domain isn't in the cache or the entry is getting old, a resolve is queued on the background resolver.
     def TryToGetLocalIp(self, domain):
         domainLower = domain.lower()
         nowSec = time.time()
 
-        # See if we have an entry in our cache.
         with self.Lock:
-            if domainLower in self.Cache:
-                # We have an entry.
-                entry = self.Cache[domainLower]
-                deltaSec = nowSec - self.GetUpdatedTimeSecFromEntryDict(entry)
-
-                # Check if we need to update async
-                if deltaSec > MDns.CacheRefreshTimeSec:
-                    self.LogDebug("Found a cache entry for domain, but it's getting old, kicking off an async update. domain: "+domain)
-                    self.TryToUpdateCacheAsync(domain)
-
-                # Check if the entry is too old
-                if deltaSec < MDns.MaxCacheTimeSec:
-                    self.LogDebug("Using cached entry for domain "+domain)
+            self.LastUsedTimeSec[domainLower] = nowSec
+            entry = self.Cache.get(domainLower, None)
+
+            # If the entry is fresh, use it.
+            if entry is not None and nowSec - self.GetUpdatedTimeSecFromEntryDict(entry) < self._GetRefreshTimeSec(entry):
+                self.LogDebug("Using cached entry for domain "+domain)
+                return self.GetIpAddressFromEntryDict(entry)
+
+            # Otherwise, queue a resolve, unless it failed recently.
+            if nowSec - self.FailedResolveTimeSec.get(domainLower, 0) > MDns.NegativeCacheTimeSec:
+                self.LogDebug("No cache entry found for domain or it's getting old, queuing a resolve. "+domain)
+                self.PendingResolves.add(domainLower)
+                self.ResolverEvent.set()
+
+            # If we have an entry that's getting old, use it while the refresh is pending, since anything is better than nothing.
+            # But if it's too old, drop it, so we don't keep using an ip that might have moved.
+            if entry is not None:
+                if nowSec - self.GetUpdatedTimeSecFromEntryDict(entry) < MDns.MaxCacheTimeSec:
                     return self.GetIpAddressFromEntryDict(entry)
+                self.LogDebug("Cache entry for domain is too old, dropping it. "+domain)
+                del self.Cache[domainLower]
+
+        self.LogDebug("No cache entry found for domain "+domain)
+        return None
+
 
-        # If we get here, we don't have an entry or it's too old, so use the normal lookup.
-        self.LogDebug("No cache entry found for domain or it's too old. Doing blocking resolve. "+domain)
-        result = self._TryToResolve(domain)
-        if result is not None:
-            return result
+    # Returns how old the entry can be before it should be refreshed.
+    def _GetRefreshTimeSec(self, entry) -> float:
+        ttlSec = entry.get("TtlSec", None)
+        if ttlSec is None:
+            return MDns.CacheRefreshTimeSec
+        return max(MDns.CacheRefreshTimeSec, ttlSec * MDns.CacheRefreshTtlFraction)
 
-        # If we failed to get a resolved result, try one more time for the cache. If anything is in there, we will use it, since anything is better than nothing.
-        self.LogDebug("We didn't use a cached entry and the resolved failed, trying the cache one more time.")
+
+    # The background resolver thread, which does all of the mdns queries.
+    def _ResolverThread(self):
+        while True:
+            try:
+                # Wait until a resolve is queued or it's time to check for prefetches.
+                self.ResolverEvent.wait(MDns.PrefetchCheckIntervalSec)
+                self.ResolverEvent.clear()
+
+                for domain in self._GetDomainsToResolve():
+                    if self._TryToResolve(domain) is None:
+                        with self.Lock:
+                            self.FailedResolveTimeSec[domain] = time.time()
+                    else:
+                        with self.Lock:
+                            self.FailedResolveTimeSec.pop(domain, None)
+            except Exception as e:
+                Sentry.Exception("Exception in MDns resolver thread.", e)
+                time.sleep(MDns.PrefetchCheckIntervalSec)
+
+
+    # Returns the domains that were queued to be resolved and the recently used domains that are getting old.
+    def _GetDomainsToResolve(self):
+        nowSec = time.time()
         with self.Lock:
-            if domainLower in self.Cache:
-                # We have an entry. No matter how old it is, try it.
-                self.LogDebug("We didn't use a cached entry and the resolved failed, and we found a cache entry, so we are using it.")
-                return self.GetIpAddressFromEntryDict(self.Cache[domainLower])
+            domains = self.PendingResolves
+            self.PendingResolves = set()
+            for domain, lastUsedSec in list(self.LastUsedTimeSec.items()):
+                # Forget about domains that haven't been used in a while, so we don't keep querying them.
+                if nowSec - lastUsedSec > MDns.PrefetchActiveWindowSec:
+                    del self.LastUsedTimeSec[domain]
+                    continue
+                entry = self.Cache.get(domain, None)
+                if entry is None or nowSec - self.FailedResolveTimeSec.get(domain, 0) <= MDns.NegativeCacheTimeSec:
+                    continue
+                if nowSec - self.GetUpdatedTimeSecFromEntryDict(entry) >= self._GetRefreshTimeSec(entry):
+                    self.LogDebug("Prefetching domain "+domain)
+                    domains.add(domain)
+        return domains
 
-        self.LogDebug("We didn't use a cached entry and the resolved failed, and no existing cache entry was found.")
-        return None
 
     # Returns a string with the local IP if the IP can be found, otherwise, it returns None.
     def _TryToResolve(self, domain):
@@ -180,6 +260,7 @@ class MDns:
                 # Look get the list of IPs returned from the query. Sometimes, there's a multiples. For example, we have seen if docker is installed
                 # there are sometimes 172.x addresses.
                 ipList = []
+                ttlSec = None
                 if answers is not None:
                     for data in answers:
                         # Validate.
@@ -189,6 +270,9 @@ class MDns:
 
                         self.LogDebug("Resolver found ip "+data.address+" for local hostname "+domain)
                         ipList.append(data.address)
+                    # Get the TTL, so we know when to refresh the entry.
+                    if answers.rrset is not None:
+                        ttlSec = answers.rrset.ttl
 
                 # If there are no ips, continue trying.
                 if len(ipList) == 0:
@@ -199,11 +283,12 @@ class MDns:
 
                 # Always update the cache
                 with self.Lock:
-                    self.Cache[domain.lower()] = self.CreateCacheEntryDict(primaryIp)
+                    oldEntry = self.Cache.get(domain.lower(), None)
+                    self.Cache[domain.lower()] = self.CreateCacheEntryDict(primaryIp, ttlSec)
 
-                # Save the cache file.
-                # TODO - We could async this, but since this will usually be called in the background as a cache refresh anyways, there's no need.
-                self._SaveCacheFile()
+                # Save the cache file if the IP changed. Since the prefetches will refresh the entries often, only save the refreshed update times every so often.
+                if oldEntry is None or oldEntry.get("IpAddress", None) != primaryIp or time.time() - self.LastCacheFileSaveTimeSec > MDns.CacheFileRefreshSaveIntervalSec:
+                    self._SaveCacheFile()
 
                 # Return the result.
                 return primaryIp
@@ -296,20 +381,6 @@ class MDns:
         return ipList[0]
 
 
-    # Starts a thread to update the domain in the cache async.
-    def TryToUpdateCacheAsync(self, domain):
-        # Spin off a thread to try to resolve the dns and update the cache.
-        workerThread = threading.Thread(target=self.TryToUpdateCacheAsync_Thread, args=(domain,))
-        workerThread.start()
-
-
-    def TryToUpdateCacheAsync_Thread(self, domain):
-        # Just use _TryToResolve, which will try to resolve and will update the IP on success.
-        self.LogDebug("Starting async update for domain "+domain)
-        if self._TryToResolve(domain) is None:
-            self.Logger.error("Failed to update mdns cache for domain "+str(domain))
-
-
     # Logs if the debug flag is set.
     def LogDebug(self, msg):
         if MDns._Debug:
@@ -317,10 +388,11 @@ class MDns:
 
     # Note, we have to use a dict instead of a class here so that it serializes correctly with
     # the normal json serializer.
-    def CreateCacheEntryDict(self, address):
+    def CreateCacheEntryDict(self, address, ttlSec = None):
         d = {}
         d["UpdateTimeSec"] = time.time()
         d["IpAddress"] = address
+        d["TtlSec"] = ttlSec
         return d
 
     def GetUpdatedTimeSecFromEntryDict(self, d):
@@ -348,6 +420,7 @@ class MDns:
 
     # Blocks to write the current stats to a file.
     def _SaveCacheFile(self):
+        self.LastCacheFileSaveTimeSec = time.time()
         try:
             data = {}
             data['Cache'] = self.Cache
@@ -388,6 +461,10 @@ class MDns:
     def Test(self):
         MDns._Debug = True
         expectedLocalIp = "192.168.1.64"
+        # The lookups only read from the cache, so queue the resolves and give the background resolver time to do them.
+        self.TryToGetLocalIp("prusa.local")
+        self.TryToGetLocalIp("invalid.local")
+        time.sleep(5)
         self.DoTest("https://prusa.local:90/test", "https://"+expectedLocalIp+":90/test")
         self.DoTest("https://prusa.local:90", "https://"+expectedLocalIp+":90")
         self.DoTest("https://invalid.local:90", None) # Fails to find anything
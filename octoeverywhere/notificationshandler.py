@@ -76,6 +76,10 @@ class NotificationsHandler:
         self.zOffsetTrackingStartTimeSec = 0.0
         self.FirstLayerDoneSince = 0.0
         self.ThirdLayerDoneSince = 0.0
+        self.HasLayerChangeBeenReported = False
+        self.LastReportedLayer = 0
+        self.LayerLock = threading.Lock()
+        self.LayerDelayCheckTimer:threading.Timer = None
         self.ProgressCompletionReported = []
         self.RestorePrintProgressPercentage = False
 
@@ -98,6 +102,8 @@ class NotificationsHandler:
         self.HasSendThirdLayerDoneMessage = False
         self.FirstLayerDoneSince = 0.0
         self.ThirdLayerDoneSince = 0.0
+        self.HasLayerChangeBeenReported = False
+        self.LastReportedLayer = 0
         # The following values are used to figure out when the first layer is done.
         self.zOffsetLowestSeenMM = 1337.0
         self.zOffsetNotAtLowestCount = 0
@@ -197,6 +203,12 @@ class NotificationsHandler:
         return self.Gadget
 
 
+    # Returns True if anything currently needs ReportPositiveExtrudeCommandSent to be called.
+    # Platforms that have to parse gcode to find positive extrudes can use this to skip the parsing.
+    def IsPositiveExtrudeReportNeeded(self) -> bool:
+        return self.zOffsetHasSeenPositiveExtrude is False or self.FinalSnapObj is not None
+
+
     def ReportPositiveExtrudeCommandSent(self):
         self.zOffsetHasSeenPositiveExtrude = True
         fsLocal = self.FinalSnapObj
@@ -576,6 +588,10 @@ class NotificationsHandler:
     FirstLayerTimerIntervalSec = 2.0
     FirstLayerCountAboveLowestBeforeNotify = 5
 
+    # When the platform gives us the current layer, this is how long the print must be past the layer before we consider it done.
+    # This makes sure it's not a zhop or something.
+    LayerDoneDelaySec = 10.0
+
 
     # Called by our firstLayerTimer at a fixed interval defined by FirstLayerTimerIntervalSec.
     # Returns True if the timer should continue, otherwise False
@@ -599,44 +615,11 @@ class NotificationsHandler:
         currentLayer, totalLayers = self.PrinterStateInterface.GetCurrentLayerInfo()
         if currentLayer is not None and totalLayers is not None:
             # We have layer info from the system, use this to handle the events.
-
-            # If we are over the first layer and haven't sent the notification, start the timer.
-            # We use this time to make sure that the print is still in the first layer complete state and it's not a zhop or something.
-            if currentLayer > 1 and self.HasSendFirstLayerDoneMessage is False:
-                if self.FirstLayerDoneSince < 0.1:
-                    self.Logger.debug("First Layer Logic - Starting delay timer.")
-                    self.FirstLayerDoneSince = time.time()
-                elif time.time() - self.FirstLayerDoneSince < 10.0:
-                    self.Logger.debug("First Layer Logic - Waiting delay time to expire.")
-                else:
-                    self.Logger.debug("First Layer Logic - Done.")
-                    self.HasSendFirstLayerDoneMessage = True
-                    self._sendEvent("firstlayerdone")
-
-            # If we fall out of the delay timer wait, reset the timer.
-            if currentLayer <= 1 and self.FirstLayerDoneSince > 0.0:
-                self.Logger.debug("First Layer Logic - Reset.")
-                self.FirstLayerDoneSince = 0.0
-
-            # If we are past the 3rd, layer, do the same.
-            if currentLayer > 3 and self.HasSendThirdLayerDoneMessage is False:
-                if self.ThirdLayerDoneSince < 0.1:
-                    self.Logger.debug( "Third Layer Logic - Starting delay timer.")
-                    self.ThirdLayerDoneSince = time.time()
-                elif time.time() - self.ThirdLayerDoneSince < 10.0:
-                    self.Logger.debug( "Third Layer Logic - Waiting delay time to expire.")
-                else:
-                    self.Logger.debug( "Third Layer Logic - Done.")
-                    self.HasSendThirdLayerDoneMessage = True
-                    self._sendEvent("thirdlayerdone")
-
-            if currentLayer <= 3 and self.ThirdLayerDoneSince > 0.0:
-                self.Logger.debug("Third Layer Logic - Reset.")
-                self.ThirdLayerDoneSince = 0.0
-
+            # If the platform pushes layer changes to us, there's no need to keep polling.
+            if self.HasLayerChangeBeenReported:
+                return False
             # If we return true, the time will continue, otherwise it will stop.
-            isDone = self.HasSendFirstLayerDoneMessage is True and self.HasSendThirdLayerDoneMessage is True
-            return isDone is False
+            return self._HandleCurrentLayer(currentLayer)
 
         #
         # We don't have a system provided layer info, use the second option with the z-offset.
@@ -766,6 +749,108 @@ class NotificationsHandler:
         return isDone is False
 
 
+    # Called by platforms that track the layers themselves when the current layer changes.
+    # This is called from the printer communication thread, so it must not block.
+    # totalLayers can be 0 if it's not known yet.
+    def OnLayerChanged(self, currentLayer:int, totalLayers:int):
+        if self.IsTrackingPrint() is False:
+            return
+        self.HasLayerChangeBeenReported = True
+        self.LastReportedLayer = currentLayer
+        self._HandleCurrentLayer(currentLayer)
+        # The first and third layer logic waits to make sure the layer didn't change back before firing.
+        # So if it's waiting, check again after the wait, with whatever the layer is then.
+        if self._IsLayerDelayPending():
+            self._StartLayerDelayCheckTimer()
+
+
+    # Called by platforms that track the layers themselves when they can't track the layers for this print anymore.
+    # Since the first layer timer stops polling once layer changes are reported, restart it so it can fallback to the z offset logic.
+    def OnLayerTrackingStopped(self):
+        self.HasLayerChangeBeenReported = False
+        if self.IsTrackingPrint() is False or self.PrinterStateInterface.ShouldPrintingTimersBeRunning() is False:
+            return
+        if self.HasSendFirstLayerDoneMessage and self.HasSendThirdLayerDoneMessage:
+            return
+        if self.FirstLayerTimer is not None:
+            return
+        self.Logger.info("Layer tracking stopped, restarting the first layer timer.")
+        self._StartFirstLayerTimer()
+
+
+    # Returns True if the first or third layer logic is waiting for the delay time to expire.
+    def _IsLayerDelayPending(self) -> bool:
+        return (self.FirstLayerDoneSince > 0.0 and self.HasSendFirstLayerDoneMessage is False) or (self.ThirdLayerDoneSince > 0.0 and self.HasSendThirdLayerDoneMessage is False)
+
+
+    # Starts a one shot timer to re-run the layer logic after the layer delay time, if one isn't already pending.
+    def _StartLayerDelayCheckTimer(self):
+        with self.LayerLock:
+            if self.LayerDelayCheckTimer is not None:
+                return
+            timer = threading.Timer(NotificationsHandler.LayerDoneDelaySec + 0.5, self._OnLayerDelayCheckTimer)
+            timer.daemon = True
+            self.LayerDelayCheckTimer = timer
+        timer.start()
+
+
+    def _OnLayerDelayCheckTimer(self):
+        with self.LayerLock:
+            self.LayerDelayCheckTimer = None
+        try:
+            if self.IsTrackingPrint() is False or self.PrinterStateInterface.ShouldPrintingTimersBeRunning() is False:
+                return
+            self._HandleCurrentLayer(self.LastReportedLayer)
+            # If there's a new delay pending, check again.
+            if self._IsLayerDelayPending():
+                self._StartLayerDelayCheckTimer()
+        except Exception as e:
+            Sentry.Exception("NotificationsHandler _OnLayerDelayCheckTimer exception.", e)
+
+
+    # Handles the first and third layer done logic, when the platform gives us the current layer.
+    # This is called by the first layer timer or when layer changes are reported.
+    # Returns True if the first or third layer logic still needs to run, otherwise False.
+    def _HandleCurrentLayer(self, currentLayer:int) -> bool:
+        with self.LayerLock:
+            # If we are over the first layer and haven't sent the notification, start the timer.
+            # We use this time to make sure that the print is still in the first layer complete state and it's not a zhop or something.
+            if currentLayer > 1 and self.HasSendFirstLayerDoneMessage is False:
+                if self.FirstLayerDoneSince < 0.1:
+                    self.Logger.debug("First Layer Logic - Starting delay timer.")
+                    self.FirstLayerDoneSince = time.time()
+                elif time.time() - self.FirstLayerDoneSince < NotificationsHandler.LayerDoneDelaySec:
+                    self.Logger.debug("First Layer Logic - Waiting delay time to expire.")
+                else:
+                    self.Logger.debug("First Layer Logic - Done.")
+                    self.HasSendFirstLayerDoneMessage = True
+                    self._sendEvent("firstlayerdone")
+
+            # If we fall out of the delay timer wait, reset the timer.
+            if currentLayer <= 1 and self.FirstLayerDoneSince > 0.0:
+                self.Logger.debug("First Layer Logic - Reset.")
+                self.FirstLayerDoneSince = 0.0
+
+            # If we are past the 3rd, layer, do the same.
+            if currentLayer > 3 and self.HasSendThirdLayerDoneMessage is False:
+                if self.ThirdLayerDoneSince < 0.1:
+                    self.Logger.debug( "Third Layer Logic - Starting delay timer.")
+                    self.ThirdLayerDoneSince = time.time()
+                elif time.time() - self.ThirdLayerDoneSince < NotificationsHandler.LayerDoneDelaySec:
+                    self.Logger.debug( "Third Layer Logic - Waiting delay time to expire.")
+                else:
+                    self.Logger.debug( "Third Layer Logic - Done.")
+                    self.HasSendThirdLayerDoneMessage = True
+                    self._sendEvent("thirdlayerdone")
+
+            if currentLayer <= 3 and self.ThirdLayerDoneSince > 0.0:
+                self.Logger.debug("Third Layer Logic - Reset.")
+                self.ThirdLayerDoneSince = 0.0
+
+            isDone = self.HasSendFirstLayerDoneMessage is True and self.HasSendThirdLayerDoneMessage is True
+            return isDone is False
+
+
     # If possible, gets a snapshot from the snapshot URL configured in OctoPrint.
     # SnapshotResizeParams can be passed BUT MIGHT BE IGNORED if the PIL lib can't be loaded.
     # SnapshotResizeParams will also be ignored if the current image is smaller than the requested size.
@@ -1247,14 +1332,18 @@ class NotificationsHandler:
         self.ProgressTimer = timer
 
         # Setup the first layer watcher - we use a different timer since this timer is really short lived and it fires much more often.
+        self._StartFirstLayerTimer()
+
+        # Start Gadget From Watching
+        self.Gadget.StartWatching()
+
+
+    def _StartFirstLayerTimer(self):
         intervalSec = NotificationsHandler.FirstLayerTimerIntervalSec
         firstLayerTimer = RepeatTimer(self.Logger, "Notifications-FirstLayerWatcher", intervalSec, self.FirstLayerTimerCallback)
         firstLayerTimer.start()
         self.FirstLayerTimer = firstLayerTimer
 
-        # Start Gadget From Watching
-        self.Gadget.StartWatching()
-
 
     # Let's the caller know if the ping timer is running, and thus we are tracking a print.
     def _IsPingTimerRunning(self):
@@ -2,6 +2,8 @@ import os
 import json
 import threading
 import time
+from collections import deque
+
 import requests
 
 from .sentry import Sentry
@@ -11,6 +13,10 @@ from .telemetry import Telemetry
 # The point of this class is to simply ping the available OctoEverywhere server regions occasionally to track which region is has the best
 # latency to. This information is used by the plugin to ensure it's connected to the best possible server.
 #
+# Between the full updates, the primary connection reports the round trip time of its websocket keep alive pings.
+# If the live latency drifts well above the best server we know of, the stats are updated early, and if the live latency is still
+# well above the best server, the primary connection is told so it can reconnect.
+#
 class OctoPingPong:
 
     LastWorkTimeKey = "LastWorkTime"
@@ -18,6 +24,21 @@ class OctoPingPong:
     LowestLatencyServerSubKey = "LowestLatencyServerSub"
     _Instance = None
 
+    # The number of live connection round trip times we keep, and how many we need before we will consider them.
+    c_LiveRttSampleCount = 5
+    c_LiveRttMinSampleCount = 3
+
+    # The live latency is considered drifted if it's both this many times and this many ms higher than the best server we know of.
+    # These are large on purpose, since the websocket ping and http ping don't measure exactly the same thing, and we don't want to flap between servers.
+    c_LiveRttDriftFactor = 1.5
+    c_LiveRttDriftMinMs = 50.0
+
+    # The min amount of time between early stats updates caused by live latency drift.
+    c_MinLiveRttReevaluateIntervalSec = 60 * 60 * 2
+
+    # How long the pings wait for the other pings to be ready, so the timed pings don't overlap the other connection setups.
+    c_PingWarmupBarrierTimeoutSec = 15.0
+
 
     @staticmethod
     def Init(logger, pluginDataFolderPath, printerId):
@@ -34,8 +55,19 @@ class OctoPingPong:
         self.PrinterId = printerId
         self.StatsFilePath = os.path.join(pluginDataFolderPath, "PingPongDataV2.json")
         self.PluginFirstRunLatencyCompleteCallback = None
+        self.LiveRttReevaluateCompleteCallback = None
         self.IsDisablePrimaryOverride = False
 
+        # Used to wake the worker thread early, when the live latency has drifted.
+        self.WorkEvent = threading.Event()
+        self.IsLiveRttReevaluateRequested = False
+        self.LastLiveRttReevaluateTime = 0
+
+        # The recent round trip times of the primary connection, and the endpoint they are for.
+        self.LiveRttLock = threading.Lock()
+        self.LiveRttSamplesMs = deque(maxlen=OctoPingPong.c_LiveRttSampleCount)
+        self.LiveRttEndpoint = None
+
         # Try to load past stats from the file.
         self.Stats = None
         self._LoadStatsFromFile()
@@ -89,6 +121,78 @@ class OctoPingPong:
         self.PluginFirstRunLatencyCompleteCallback = callback
 
 
+    # Called when the live latency drifted and the stats have been updated, but the live latency is still well above the best server.
+    # The callback should reconnect the connection to the lowest latency server, if it's not already connected to it.
+    def RegisterLiveRttReevaluateCompleteCallback(self, callback):
+        self.LiveRttReevaluateCompleteCallback = callback
+
+
+    # Called by the primary connection when it gets a websocket keep alive pong.
+    # This is called on the websocket thread, so it must be quick.
+    def ReportConnectionRtt(self, endpoint:str, rttMs:float):
+        try:
+            with self.LiveRttLock:
+                # If the connection changed, the old samples don't mean anything anymore.
+                if endpoint != self.LiveRttEndpoint:
+                    self.LiveRttSamplesMs.clear()
+                    self.LiveRttEndpoint = endpoint
+                self.LiveRttSamplesMs.append(rttMs)
+                liveRttMs = self._GetLiveRttMs()
+            if liveRttMs is None or self._IsLiveRttDrifted(liveRttMs) is False:
+                return
+            # Don't update the stats too often, even if the latency stays high.
+            if time.time() - self.LastLiveRttReevaluateTime < OctoPingPong.c_MinLiveRttReevaluateIntervalSec:
+                return
+            self.LastLiveRttReevaluateTime = time.time()
+            self.Logger.info(f"OctoPingPong live connection latency {int(liveRttMs)}ms has drifted above the best known server latency, updating the stats now.")
+            self.IsLiveRttReevaluateRequested = True
+            self.WorkEvent.set()
+        except Exception as e:
+            Sentry.Exception("Exception in OctoPingPong ReportConnectionRtt.", e)
+
+
+    # Returns the median of the recent live round trip times, or None if there aren't enough.
+    # Must be called under the LiveRttLock.
+    def _GetLiveRttMs(self):
+        if len(self.LiveRttSamplesMs) < OctoPingPong.c_LiveRttMinSampleCount:
+            return None
+        samples = sorted(self.LiveRttSamplesMs)
+        return samples[len(samples) // 2]
+
+
+    # Returns True if the live latency is well above the best server latency we know of.
+    def _IsLiveRttDrifted(self, liveRttMs:float) -> bool:
+        lowestLatencyMs = self._GetLowestLatencyServerAvgMs()
+        if lowestLatencyMs is None:
+            return False
+        return liveRttMs > lowestLatencyMs * OctoPingPong.c_LiveRttDriftFactor and liveRttMs - lowestLatencyMs > OctoPingPong.c_LiveRttDriftMinMs
+
+
+    # Returns the average latency of the current lowest latency server, or None if it's not known.
+    def _GetLowestLatencyServerAvgMs(self):
+        stats = self.Stats
+        lowestLatencySub = stats.get(OctoPingPong.LowestLatencyServerSubKey, None)
+        if lowestLatencySub is None:
+            return None
+        values = [v for v in stats.get(OctoPingPong.ServerStatsKey, {}).get(lowestLatencySub, []) if v is not None]
+        if len(values) == 0:
+            return None
+        return sum(values) / len(values)
+
+
+    # Called after a stats update that was caused by live latency drift.
+    def _OnLiveRttReevaluateComplete(self):
+        with self.LiveRttLock:
+            liveRttMs = self._GetLiveRttMs()
+        # If the live latency isn't drifted from the new stats, the stats were just stale and there's nothing to do.
+        if liveRttMs is None or self._IsLiveRttDrifted(liveRttMs) is False:
+            self.Logger.info("OctoPingPong live latency is no longer drifted after the stats update.")
+            return
+        callback = self.LiveRttReevaluateCompleteCallback
+        if callback is not None:
+            callback()
+
+
     # The main worker thread.
     def _WorkerThread(self):
         oneHourOfSeconds = 60 * 60
@@ -115,9 +219,12 @@ class OctoPingPong:
                     # We also don't want to restart right as the user gets setup, so delay a bit.
                     time.sleep(60 * 15)
 
-                # If it's not time to work, sleep until it is time.
+                # If it's not time to work, sleep until it is time, or until an early update is requested due to live latency drift.
                 if timeUntilNextWorkSec > 0:
-                    time.sleep(timeUntilNextWorkSec)
+                    self.WorkEvent.wait(timeUntilNextWorkSec)
+                    self.WorkEvent.clear()
+                isLiveRttReevaluate = self.IsLiveRttReevaluateRequested
+                self.IsLiveRttReevaluateRequested = False
 
                 # It's time to work, first update the time we are working is now.
                 # Also write to disk to ensure it's known and we don't get in a tight loop of working.
@@ -135,6 +242,10 @@ class OctoPingPong:
                         self.PluginFirstRunLatencyCompleteCallback()
                         callback = None
 
+                # If this update was due to the live latency drifting, see if the connection should move.
+                if isLiveRttReevaluate:
+                    self._OnLiveRttReevaluateComplete()
+
             except Exception as e:
                 Sentry.Exception("Exception in OctoPingPong thread.", e)
 
@@ -149,12 +260,24 @@ class OctoPingPong:
         if defaultServerResult is None:
             return
 
-        # Now ping each server we got back
+        # Now ping each server we got back, all at once.
+        # The barrier makes sure all of the connections are setup before any of the timed pings start, so the connection setup work doesn't skew the times.
+        # Note the result will be None if it failed.
+        subs = defaultServerResult[1]
         serverResults = {}
-        for sub in defaultServerResult[1]:
-            # Note this will be None if it failed.
-            result = self._DoPing(sub)
-            serverResults[sub] = result
+        for sub in subs:
+            serverResults[sub] = None
+        warmupBarrier = threading.Barrier(len(subs))
+        def pingThread(sub):
+            serverResults[sub] = self._DoPing(sub, warmupBarrier)
+        threads = []
+        for sub in subs:
+            t = threading.Thread(target=pingThread, args=(sub,), name="OctoPingPong-Ping")
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
 
         # Make sure the stats root exists.
         if OctoPingPong.ServerStatsKey not in self.Stats:
@@ -284,7 +407,9 @@ class OctoPingPong:
 
     # Returns the ping latency in ms to the server and the list of servers.
     # If subdomain is given it will be used, otherwise the default subdomain will be used.
-    def _DoPing(self, subdomain):
+    # If a barrier is given, it's waited on after the connection is setup and before the timed pings.
+    def _DoPing(self, subdomain, warmupBarrier:threading.Barrier = None):
+        hasWaitedOnBarrier = False
         try:
             # Make the URL
             if subdomain is None:
@@ -329,6 +454,10 @@ class OctoPingPong:
                     # Close this response so the connection gets put back into the pool
                     response.close()
 
+                    # Wait for the other pings to be ready.
+                    hasWaitedOnBarrier = True
+                    self._WaitOnBarrier(warmupBarrier)
+
                     # Now using the same session, use the direct ping call.
                     # The session will prevent all of the overhead and should have a pooled open connection
                     # So this is as close to an actual realtime ping as we can get.
@@ -363,9 +492,23 @@ class OctoPingPong:
 
         except Exception as e:
             self.Logger.info("Failed to call _DoPing "+str(e))
+        finally:
+            # If we failed before the barrier, we still need to show up, so the other pings don't wait on us.
+            if hasWaitedOnBarrier is False:
+                self._WaitOnBarrier(warmupBarrier)
         return None
 
 
+    def _WaitOnBarrier(self, barrier:threading.Barrier):
+        if barrier is None:
+            return
+        try:
+            barrier.wait(OctoPingPong.c_PingWarmupBarrierTimeoutSec)
+        except threading.BrokenBarrierError:
+            # If a ping took too long to be ready, the barrier is broken and all of the pings just continue.
+            pass
+
+
     # Resets the stats object to it's default state.
     def _ResetStats(self):
         self.Logger.info("OctoPingPong stats reset")
@@ -87,6 +87,8 @@ class OctoServerCon:
         # This callback wil only fire on the very first time the plugin is ran.
         if self.IsPrimaryConnection:
             OctoPingPong.Get().RegisterPluginFirstRunLatencyCompleteCallback(self.OnFirstRunLatencyDataComplete)
+            # Also register for the callback that fires if the live connection latency drifts well above the best server.
+            OctoPingPong.Get().RegisterLiveRttReevaluateCompleteCallback(self.OnLiveRttReevaluateComplete)
 
         # Note! Will be None for secondary connections!
         self.StatusChangeHandler = statusChangeHandler
@@ -115,7 +117,7 @@ class OctoServerCon:
                 # Check if we have a known lowest latency server.
                 lowestLatencySub = OctoPingPong.Get().GetLowestLatencyServerSub()
                 if lowestLatencySub is not None:
-                    newEndpoint = "wss://"+lowestLatencySub+".octoeverywhere.com/octoclientws"
+                    newEndpoint = self.GetLowestLatencyEndpoint(lowestLatencySub)
                     self.Logger.info("Attempting to use lowest latency server: "+newEndpoint)
 
         # Otherwise use the default endpoint.
@@ -126,6 +128,10 @@ class OctoServerCon:
         return self.CurrentEndpoint
 
 
+    def GetLowestLatencyEndpoint(self, lowestLatencySub):
+        return "wss://"+lowestLatencySub+".octoeverywhere.com/octoclientws"
+
+
     def OnOpened(self, ws):
         self.Logger.info("Connected To OctoEverywhere, server con "+self.GetConnectionString()+". Starting handshake...")
 
@@ -178,6 +184,13 @@ class OctoServerCon:
                 self.OnSessionError(localSessionId, 0)
 
 
+    # Fired when the websocket gets a keep alive pong, with the round trip time of the ping.
+    def OnPong(self, ws, rttMs):
+        # Only the primary connection picks which server to connect to, so only it reports the live latency.
+        if self.IsPrimaryConnection and self.ShouldUseLowestLatencyServer:
+            OctoPingPong.Get().ReportConnectionRtt(self.CurrentEndpoint, rttMs)
+
+
     def OnHandshakeComplete(self, sessionId, octoKey, connectedAccounts):
         if sessionId != self.ActiveSessionId:
             self.Logger.info("Got a handshake complete for an old session, "+str(sessionId)+", ignoring.")
@@ -307,6 +320,27 @@ class OctoServerCon:
             Sentry.Exception("Exception in OnFirstRunLatencyDataComplete during disconnect. "+self.GetConnectionString()+".", e)
 
 
+    # A callback fired only for the primary connection, when the live connection latency drifted well above the best known server,
+    # the latency stats were updated, and the live latency is still well above the best server.
+    def OnLiveRttReevaluateComplete(self):
+        try:
+            if self.ShouldUseLowestLatencyServer is False:
+                return
+            # Only reconnect if we would end up connected to a different server.
+            lowestLatencySub = OctoPingPong.Get().GetLowestLatencyServerSub()
+            if lowestLatencySub is None:
+                return
+            newEndpoint = self.GetLowestLatencyEndpoint(lowestLatencySub)
+            if newEndpoint == self.CurrentEndpoint:
+                self.Logger.info("Live latency callback fired, but we are already connected to the lowest latency server. Current: "+self.GetConnectionString()+".")
+                return
+            self.Logger.info("Live latency callback fired, disconnecting primary OctoStream to reconnect to the lowest latency server "+newEndpoint+". Current: "+self.GetConnectionString()+".")
+            self.NoWaitReconnect = True
+            self.Disconnect()
+        except Exception as e:
+            Sentry.Exception("Exception in OnLiveRttReevaluateComplete during disconnect. "+self.GetConnectionString()+".", e)
+
+
     def RunBlocking(self):
         runForTimeChecker = None
         try:
@@ -337,7 +371,7 @@ class OctoServerCon:
 
                     # Connect to the service.
                     # When this returns, make sure it's fully closed.
-                    self.Ws = Client(endpoint, self.OnOpened, self.OnMsg, None, self.OnClosed, self.OnError)
+                    self.Ws = Client(endpoint, self.OnOpened, self.OnMsg, None, self.OnClosed, self.OnError, onWsPong=self.OnPong)
                     with self.Ws:
                         self.Logger.info("Attempting to talk to OctoEverywhere, server con "+self.GetConnectionString() + " wsId:"+self.GetWsId(self.Ws))
                         self.Ws.RunUntilClosed()
@@ -1,14 +1,26 @@
 import os
+import atexit
 import json
 import time
 import logging
+import threading
 from pathlib import Path
 
 # The goal of this class is to keep track of info about the current print.
 # This is needed because sometimes we only get the info once, like at the start of a print, and then we want to keep it around for future notifications.
 # This class also writes out to disk, so for hosts where the host can crash or be restarted mid print, the print info can be recovered.
+#
+# To limit SD card wear, most updates are written to disk after a short delay, so a burst of updates only results in one write.
+# Print start and end are written immediately and synced to disk, since they are the important state for recovery.
 class PrintInfo:
 
+    # How long we wait after an update before writing the print info to disk.
+    c_SaveDelaySec = 5.0
+
+    # The print infos that have a delayed save pending, so they can be written when the process exits.
+    _PendingSavesLock = threading.Lock()
+    _PendingSaves = set()
+
     # Required Json Vars
     c_PrintCookieKey = "PrintCookie"
     c_PrintIdKey = "PrintId"
@@ -47,8 +59,8 @@ class PrintInfo:
             PrintInfo.c_PrintStartTimeSecKey : time.time()
         }
         pi = PrintInfo(logger, filePath, data)
-        # Save, but always return a object even if this fails.
-        pi.Save()
+        # This is a print start, so save now and sync it to disk, but always return a object even if this fails.
+        pi.Save(fsync=True)
         return pi
 
 
@@ -56,6 +68,11 @@ class PrintInfo:
         self.Logger = logger
         self.FilePath = filePath
         self.Data = data
+        # Used to debounce the delayed saves.
+        self.SaveLock = threading.Lock()
+        self.SaveTimer:threading.Timer = None
+        # Set when the manager deletes our file, after which we must not write it again.
+        self.IsDiscarded = False
 
 
     # Required var, this will always exist and can't be changed.
@@ -74,7 +91,7 @@ class PrintInfo:
     def SetLocalPrintStartTimeSec(self, startTimeSec:float) -> float:
         if self.GetLocalPrintStartTimeSec() != startTimeSec:
             self.Data[PrintInfo.c_PrintStartTimeSecKey] = startTimeSec
-            self.Save()
+            self.SaveDelayed()
 
 
     # The file name is optional.
@@ -84,7 +101,7 @@ class PrintInfo:
         current = self.GetFileName()
         if current is None or current != fileName:
             self.Data[PrintInfo.c_FileNameKey] = fileName
-            self.Save()
+            self.SaveDelayed()
 
 
     # The file size in kbytes is optional
@@ -93,7 +110,7 @@ class PrintInfo:
     def SetFileSizeKBytes(self, sizeBytes:int) -> None:
         if self.GetFileSizeKBytes() != sizeBytes:
             self.Data[PrintInfo.c_FileSizeInKBytes] = sizeBytes
-            self.Save()
+            self.SaveDelayed()
 
 
     # Estimated filament usage is optional.
@@ -102,7 +119,7 @@ class PrintInfo:
     def SetEstFilamentUsageMm(self, estMm:int) -> None:
         if self.GetEstFilamentUsageMm() != estMm:
             self.Data[PrintInfo.c_EstFilamentUsageMm] = estMm
-            self.Save()
+            self.SaveDelayed()
 
 
     # Estimated filament weight used is optional.
@@ -111,7 +128,7 @@ class PrintInfo:
     def SetEstFilamentWeightUsageMg(self, estG:int) -> None:
         if self.GetEstFilamentUsageMm() != estG:
             self.Data[PrintInfo.c_EstFilamentWeightMg] = estG
-            self.Save()
+            self.SaveDelayed()
 
 
     # This is only set when the print is done.
@@ -120,7 +137,8 @@ class PrintInfo:
         return self.Data.get(PrintInfo.c_FinalPrintDurationSec, None)
     def SetFinalPrintDurationSec(self, totalDurationSec:int) -> None:
         self.Data[PrintInfo.c_FinalPrintDurationSec] = int(totalDurationSec)
-        self.Save()
+        # This is a print end, so save now and sync it to disk.
+        self.Save(fsync=True)
 
 
     # Right now this is only used by Bambu, because the printer doesn't report the
@@ -134,16 +152,72 @@ class PrintInfo:
         return int(time.time() - self.GetLocalPrintStartTimeSec())
 
 
-    def Save(self) -> bool:
+    # Schedules a save after a short delay. If a save is already scheduled, this update will be included in it.
+    def SaveDelayed(self) -> None:
+        with self.SaveLock:
+            if self.IsDiscarded or self.SaveTimer is not None:
+                return
+            # The timer is a daemon, so it never holds up the process exit. Any pending save is written by FlushPendingSaves on exit.
+            self.SaveTimer = threading.Timer(PrintInfo.c_SaveDelaySec, self._OnSaveTimer)
+            self.SaveTimer.name = "PrintInfoSaveTimer"
+            self.SaveTimer.daemon = True
+            self.SaveTimer.start()
+            with PrintInfo._PendingSavesLock:
+                PrintInfo._PendingSaves.add(self)
+
+
+    def _OnSaveTimer(self) -> None:
+        with self.SaveLock:
+            self.SaveTimer = None
+        self.Save()
+
+
+    # Writes any print infos that have a delayed save pending. This is called when the process exits.
+    @staticmethod
+    def FlushPendingSaves() -> None:
+        with PrintInfo._PendingSavesLock:
+            pending = list(PrintInfo._PendingSaves)
+        for printInfo in pending:
+            printInfo.Save()
+
+
+    # Writes the print info to disk now. Any pending delayed save is no longer needed, since the current data is written.
+    # If fsync is set, this will block until the data is written to the disk.
+    def Save(self, fsync:bool = False) -> bool:
         try:
-            with open(self.FilePath, "w", encoding="utf-8") as f:
-                json.dump(self.Data, f)
+            with self.SaveLock:
+                if self.IsDiscarded:
+                    return False
+                self._CancelSaveTimer()
+                # Hold the lock while writing, so a timer save and a direct save can't write at the same time.
+                with open(self.FilePath, "w", encoding="utf-8") as f:
+                    json.dump(dict(self.Data), f)
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
             return True
         except Exception as e:
             self.Logger.error(f"Failed to write print context from file. {e}")
         return False
 
 
+    # Called by the manager when the file for this print info is deleted or replaced.
+    # After this, the print info will never write to disk again.
+    def Discard(self) -> None:
+        with self.SaveLock:
+            self.IsDiscarded = True
+            self._CancelSaveTimer()
+
+
+    # Cancels any pending delayed save. Must be called with the save lock held.
+    def _CancelSaveTimer(self) -> None:
+        if self.SaveTimer is not None:
+            self.SaveTimer.cancel()
+            self.SaveTimer = None
+        with PrintInfo._PendingSavesLock:
+            PrintInfo._PendingSaves.discard(self)
+
+
 # The goal of this class is to manage the current print info.
 # Ideally, the info should always be in memory, so we don't have to read it from disk.
 # But if the host crashes, we can recover the print info from disk.
@@ -157,6 +231,8 @@ class PrintInfoManager:
     @staticmethod
     def Init(logger:logging.Logger, localStorageFolderPath:str):
         PrintInfoManager._Instance = PrintInfoManager(logger, localStorageFolderPath)
+        # Make sure any delayed print info saves are written when the process exits.
+        atexit.register(PrintInfo.FlushPendingSaves)
 
 
     @staticmethod
@@ -169,6 +245,12 @@ class PrintInfoManager:
         self.ContextFolderPath = os.path.join(localStorageFolderPath, PrintInfoManager.c_ContextsFolder)
         Path(self.ContextFolderPath).mkdir(parents=True, exist_ok=True)
         self.CurrentContext:PrintInfo = None
+        # An in-memory index of the print info files on disk, file name -> full path.
+        # All print info files are created and deleted by this class, so once it's built we never need to list the folder again.
+        # This also means lookups for unknown cookies are answered from memory, without touching the disk.
+        # It's None until it's first needed.
+        self.Lock = threading.Lock()
+        self.OnDiskIndex:dict = None
 
 
     # Given a print cookie, if a print info.
@@ -182,29 +264,38 @@ class PrintInfoManager:
                 return None
 
             # First, see if the current context matches.
+            # This is the hot path, some platforms call this on every printer message.
             c = self.CurrentContext
             if c is not None and c.GetPrintCookie() == printCookie:
                 return c
 
-            # Else, go through the files looking for the correct context.
-            dirAndFiles = os.listdir(self.ContextFolderPath)
-            printCookieFileName = self._GetPrintCookieFileName(printCookie)
-            context = None
-            # Iterate all files. Any file that doesn't match or fails to parse we delete.
-            for name in dirAndFiles:
-                fullPath = os.path.join(self.ContextFolderPath, name)
-                if os.path.isfile(fullPath):
+            with self.Lock:
+                # Check again, since the context might have been set while we waited for the lock.
+                c = self.CurrentContext
+                if c is not None and c.GetPrintCookie() == printCookie:
+                    return c
+
+                # Else, go through the index looking for the correct context.
+                self._EnsureOnDiskIndex()
+                printCookieFileName = self._GetPrintCookieFileName(printCookie)
+                context = None
+                # Iterate all files. Any file that doesn't match or fails to parse we delete.
+                # After the first miss, the index will be empty, so repeated lookups for unknown cookies are free.
+                for name, fullPath in list(self.OnDiskIndex.items()):
                     if name == printCookieFileName:
                         context = PrintInfo.LoadFromFile(self.Logger, fullPath)
-                        if context is None:
-                            self._DeleteFile(fullPath)
-                    else:
-                        self._DeleteFile(fullPath)
-                else:
+                        if context is not None:
+                            continue
                     self._DeleteFile(fullPath)
-            # Always replace the current context even if it's empty, so the old context is removed.
-            self.CurrentContext = context
-            return context
+                    del self.OnDiskIndex[name]
+
+                # The current context's file doesn't match, so it was deleted above. Make sure it never writes again.
+                if c is not None:
+                    c.Discard()
+
+                # Always replace the current context even if it's empty, so the old context is removed.
+                self.CurrentContext = context
+                return context
         except Exception as e:
             self.Logger.error(f"Exception in PrintContextTracker.GetContext: {e}")
         return None
@@ -214,10 +305,18 @@ class PrintInfoManager:
     # like on a new print start or something.
     def ClearAllPrintInfos(self) -> None:
         try:
-            dirAndFiles = os.listdir(self.ContextFolderPath)
-            for name in dirAndFiles:
-                fullPath = os.path.join(self.ContextFolderPath, name)
-                self._DeleteFile(fullPath)
+            with self.Lock:
+                # Make sure the current context won't write its file again after we delete it.
+                c = self.CurrentContext
+                if c is not None:
+                    c.Discard()
+                self.CurrentContext = None
+                dirAndFiles = os.listdir(self.ContextFolderPath)
+                for name in dirAndFiles:
+                    fullPath = os.path.join(self.ContextFolderPath, name)
+                    self._DeleteFile(fullPath)
+                # We know the folder is empty now.
+                self.OnDiskIndex = {}
         except Exception as e:
             self.Logger.error(f"Exception in PrintContextTracker.ClearAllPrintInfos: {e}")
 
@@ -226,14 +325,37 @@ class PrintInfoManager:
     # This will always return a new PrintInfo, even if it fails to write to disk.
     def CreateNewPrintInfo(self, printCookie:str, printId:str) -> PrintInfo:
         try:
-            fullPath = os.path.join(self.ContextFolderPath, self._GetPrintCookieFileName(printCookie))
-            self.CurrentContext = PrintInfo.CreateNew(self.Logger, fullPath, printCookie, printId)
-            return self.CurrentContext
+            with self.Lock:
+                self._EnsureOnDiskIndex()
+                # If there's a current context, it's being replaced, so make sure it won't write its file again.
+                c = self.CurrentContext
+                if c is not None:
+                    c.Discard()
+                fileName = self._GetPrintCookieFileName(printCookie)
+                fullPath = os.path.join(self.ContextFolderPath, fileName)
+                self.CurrentContext = PrintInfo.CreateNew(self.Logger, fullPath, printCookie, printId)
+                self.OnDiskIndex[fileName] = fullPath
+                return self.CurrentContext
         except Exception as e:
             self.Logger.error(f"Exception in PrintContextTracker.CreateNew: {e}")
         return None
 
 
+    # Builds the on disk index if it hasn't been built yet. This must be called under the lock.
+    # Anything in the folder that's not a file is deleted.
+    def _EnsureOnDiskIndex(self) -> None:
+        if self.OnDiskIndex is not None:
+            return
+        index = {}
+        for name in os.listdir(self.ContextFolderPath):
+            fullPath = os.path.join(self.ContextFolderPath, name)
+            if os.path.isfile(fullPath):
+                index[name] = fullPath
+            else:
+                self._DeleteFile(fullPath)
+        self.OnDiskIndex = index
+
+
     def _GetPrintCookieFileName(self, printCookie:str):
         return f"{printCookie}.json"
 
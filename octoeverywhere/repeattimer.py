@@ -1,36 +1,63 @@
 import threading
 import logging
+import time
 
 from .sentry import Sentry
 
 class RepeatTimer(threading.Thread):
-    def __init__(self, logger:logging.Logger, name:str, intervalSec:int, func):
+    # If fixedRate is set, the interval is measured from the start of the last callback rather than the end of it,
+    # so the time the callback takes doesn't push out the next callback. In this mode, changing the interval while the timer
+    # is waiting will also take effect right away, rather than on the next wait.
+    def __init__(self, logger:logging.Logger, name:str, intervalSec:int, func, fixedRate:bool = False):
         threading.Thread.__init__(self, name=name)
         self.stopEvent = threading.Event()
         self.logger = logger
         self.intervalSec = intervalSec
         self.callback = func
         self.running = True
+        self.fixedRate = fixedRate
+        self.intervalChangedEvent = threading.Event()
+        self.lastCallbackStartSec = time.time()
 
 
     # Overwrite the thread function.
     def run(self):
         # Loop while the event isn't set and the thread is still alive.
-        while not self.stopEvent.wait(self.intervalSec) and self.is_alive() and self.running:
+        self.lastCallbackStartSec = time.time()
+        while self._waitForNextCallback() and self.is_alive() and self.running:
             try:
                 # Ensure we don't fire the callback if we weren't asked to.
                 if self.running is not True:
                     return
+                self.lastCallbackStartSec = time.time()
                 self.callback()
             except Exception as e:
                 Sentry.Exception("Exception in RepeatTimer thread.", e)
         self.logger.info("RepeatTimer thread exit")
 
 
+    # Blocks until the next callback should fire. Returns False if the timer was stopped.
+    def _waitForNextCallback(self) -> bool:
+        if self.fixedRate is False:
+            return not self.stopEvent.wait(self.intervalSec)
+        while self.running:
+            # Clear the event before we compute the wait time, so we can't miss an interval change.
+            self.intervalChangedEvent.clear()
+            remainingSec = self.lastCallbackStartSec + self.intervalSec - time.time()
+            if remainingSec <= 0:
+                return not self.stopEvent.is_set()
+            # This event is also set on stop, so we wake up right away.
+            self.intervalChangedEvent.wait(remainingSec)
+        return False
+
+
     # Used to update the repeat interval. This can be called while the timer is running
     # or even while in the callback.
     def SetInterval(self, intervalSec:int):
         self.intervalSec = intervalSec
+        # If we are waiting in fixed rate mode, wake up so the new interval is used for the current wait.
+        if self.fixedRate:
+            self.intervalChangedEvent.set()
 
 
     # Returns the current interval time in seconds
@@ -47,3 +74,4 @@ class RepeatTimer(threading.Thread):
     def Stop(self):
         self.running = False
         self.stopEvent.set()
+        self.intervalChangedEvent.set()
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import logging
+
+from .octohttprequest import OctoHttpRequest
+from .compression import Compression
+from .Proto.DataCompression import DataCompression
+
+# A common helper the platform Slipstream classes use to save their cached results to disk, so they survive restarts.
+#
+# The cache is saved to a folder as one body file per url, and a manifest that holds the headers and compression info for each.
+class SlipstreamDiskCache:
+
+    # The folder in the local storage dir the cache is saved to, and the file name of the manifest in it.
+    c_CacheDirName = "slipstream"
+    c_ManifestFileName = "manifest.json"
+
+
+    def __init__(self, logger:logging.Logger, localStorageDir:str, pluginVersion:str):
+        self.Logger = logger
+        self.CacheDir = os.path.join(localStorageDir, SlipstreamDiskCache.c_CacheDirName)
+        self.PluginVersion = pluginVersion
+
+
+    # Loads any cache entries saved to disk by the last run.
+    # Returns a dict of the url to the ready to go OctoHttpResult, in the order they were saved.
+    # On failure, an empty dict is returned.
+    def Load(self) -> dict:
+        cache = {}
+        try:
+            manifestFilePath = os.path.join(self.CacheDir, SlipstreamDiskCache.c_ManifestFileName)
+            if os.path.exists(manifestFilePath) is False:
+                return cache
+            with open(manifestFilePath, encoding="utf-8") as f:
+                manifest = json.load(f)
+
+            # The compressed buffers depend on the compression setup of the plugin version that saved them, so if the version changed, don't use them.
+            if manifest.get("PluginVersion", None) != self.PluginVersion:
+                self.Logger.info("Slipstream disk cache is from a different plugin version, so we won't use it.")
+                return cache
+
+            for url, entry in manifest.get("Entries", {}).items():
+                compressionType = entry["CompressionType"]
+                # If zstandard was used to save this but it can't be loaded now, we can't use the entry.
+                if compressionType == DataCompression.ZStandard and Compression.Get().CanUseZStandardLib is False:
+                    continue
+                with open(os.path.join(self.CacheDir, self._GetCacheFileName(url)), "rb") as f:
+                    buffer = f.read()
+                result = OctoHttpRequest.Result(200, entry["Headers"], url, False)
+                result.SetFullBodyBuffer(buffer, compressionType, entry["PreCompressSize"])
+                cache[url] = result
+            self.Logger.info(f"Slipstream loaded {len(cache)} cache entries from disk.")
+            return cache
+        except Exception as e:
+            self.Logger.warn(f"Slipstream failed to load the disk cache. {e}")
+        return {}
+
+
+    # Saves the given cache entries to disk and removes any saved files that are no longer used.
+    # changedPaths are the urls that have new content since the last save. If the url is in the file name (like a content hash), the body
+    # can't change for the same url, so no changed paths need to be given and a body file that exists is never written again.
+    def Save(self, cache:dict, changedPaths:set=None):
+        try:
+            if os.path.exists(self.CacheDir) is False:
+                os.makedirs(self.CacheDir)
+
+            # Write the body files that changed or don't exist yet.
+            entries = {}
+            fileNames = set()
+            for url, result in cache.items():
+                fileName = self._GetCacheFileName(url)
+                fileNames.add(fileName)
+                filePath = os.path.join(self.CacheDir, fileName)
+                if (changedPaths is not None and url in changedPaths) or os.path.exists(filePath) is False:
+                    with open(filePath, "wb") as f:
+                        f.write(result.FullBodyBuffer)
+                entries[url] = {
+                    "Headers": dict(result.Headers),
+                    "CompressionType": result.BodyBufferCompressionType,
+                    "PreCompressSize": result.BodyBufferPreCompressSize,
+                }
+
+            # Write the manifest after the body files, so it never references a file that doesn't exist.
+            with open(os.path.join(self.CacheDir, SlipstreamDiskCache.c_ManifestFileName), "w", encoding="utf-8") as f:
+                f.write(json.dumps({ "PluginVersion": self.PluginVersion, "Entries": entries }))
+
+            # Clean up any old files.
+            for f in os.listdir(self.CacheDir):
+                if f != SlipstreamDiskCache.c_ManifestFileName and f not in fileNames:
+                    os.remove(os.path.join(self.CacheDir, f))
+        except Exception as e:
+            self.Logger.warn(f"Slipstream failed to save the disk cache. {e}")
+
+
+    # Returns the file name used to save the body of the given url.
+    def _GetCacheFileName(self, url:str) -> str:
+        return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".bin"
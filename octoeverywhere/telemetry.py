@@ -1,16 +1,48 @@
+import atexit
+import json
 import logging
+import time
 import threading
 
 from .httpsessions import HttpSessions
 
 # A helper class for reporting telemetry.
+#
+# Writes are queued in memory and sent by a single background worker, so bursts of events don't create a thread and http request per event.
+# Events with the same name, fields, and tags are coalesced into one event with the values summed, since the service accumulates them anyways.
 class Telemetry:
     Logger = None
     ServerProtocolAndDomain = "https://octoeverywhere.com"
 
+    # The max number of unique events we will hold before we start dropping new events.
+    c_MaxPendingEvents = 100
+
+    # How often the worker will send any pending events.
+    c_FlushIntervalSec = 30.0
+
+    # If this many unique events are pending, the worker will be woken up to send them before the interval.
+    c_FlushThresholdEvents = 25
+
+    # The http timeout used when we are sending from the worker and when we are flushing on process exit.
+    # The exit timeout is also the total time the process exit will wait for the flush, after that anything still pending is discarded.
+    c_SendTimeoutSec = 1*60
+    c_SendOnExitTimeoutSec = 5
+
+    # The pending event state, all of which is protected by the lock.
+    _Lock = threading.Lock()
+    _PendingEvents = {}
+    _DroppedEventCount = 0
+    _WorkerThread:threading.Thread = None
+    _WorkerEvent = threading.Event()
+    _FlushDoneEvent = threading.Event()
+    _IsExiting = False
+    _ExitDeadlineSec = 0.0
+
     @staticmethod
     def Init(logger:logging.Logger):
         Telemetry.Logger = logger
+        # Make sure anything pending is sent when the process exits, this is important for short lived processes like the installer.
+        atexit.register(Telemetry._FlushOnExit)
 
     # Sends a telemetry data point to the service. These data points are suggestions, they are filtered and limited
     # by the service, so it may or may not actually accept them.
@@ -23,12 +55,6 @@ class Telemetry:
     # Example: Telemetry.Write("Test", 1, { "FieldKey":"FieldValue", "FieldKey2":1.5 }, { "TagKey":"TagValue" })
     @staticmethod
     def Write(measureStr:str, valueInt:int, fieldsOpt:dict=None, tagsOpt:dict=None):
-        thread = threading.Thread(target=Telemetry._WriteSync, args=(measureStr, valueInt, fieldsOpt, tagsOpt, ))
-        thread.start()
-
-    # Same as Write(), but it blocks on the request. True is returned on success, otherwise False.
-    @staticmethod
-    def _WriteSync(measureStr:str, valueInt:int, fieldsOpt:dict=None, tagsOpt:dict=None):
         try:
             # Ensure a value is set and ensure it's an int.
             if valueInt is None :
@@ -49,9 +75,116 @@ class Telemetry:
                     tagsOpt[key] = str(tagsOpt[key])
                 event["Tags"] = tagsOpt
 
+            # Events that only differ by value are coalesced, so the key is everything but the value.
+            key = json.dumps([measureStr, fieldsOpt, tagsOpt], sort_keys=True, default=str)
+
+            with Telemetry._Lock:
+                existing = Telemetry._PendingEvents.get(key, None)
+                if existing is not None:
+                    existing["Value"] += valueInt
+                    return
+                # If we are full, drop the event. We don't want to grow memory without bound if the service is unreachable.
+                if len(Telemetry._PendingEvents) >= Telemetry.c_MaxPendingEvents:
+                    Telemetry._DroppedEventCount += 1
+                    return
+                Telemetry._PendingEvents[key] = event
+                pendingCount = len(Telemetry._PendingEvents)
+
+                # Start the worker if it's not running.
+                if Telemetry._WorkerThread is None:
+                    Telemetry._WorkerThread = threading.Thread(target=Telemetry._Worker, name="TelemetryWorker")
+                    Telemetry._WorkerThread.daemon = True
+                    Telemetry._WorkerThread.start()
+
+            # If there are a lot of events pending, wake the worker now.
+            if pendingCount >= Telemetry.c_FlushThresholdEvents:
+                Telemetry._WorkerEvent.set()
+        except Exception as e:
+            if Telemetry.Logger is not None:
+                Telemetry.Logger.warn("Failed to queue telemetry "+str(measureStr)+", error: "+str(e))
+
+
+    # The worker that sends the pending events on an interval or when woken up.
+    @staticmethod
+    def _Worker():
+        while True:
+            try:
+                Telemetry._WorkerEvent.wait(Telemetry.c_FlushIntervalSec)
+                Telemetry._WorkerEvent.clear()
+                Telemetry._Flush(Telemetry.c_SendOnExitTimeoutSec if Telemetry._IsExiting else Telemetry.c_SendTimeoutSec)
+            except Exception as e:
+                if Telemetry.Logger is not None:
+                    Telemetry.Logger.warn("Telemetry worker exception. "+str(e))
+            finally:
+                Telemetry._FlushDoneEvent.set()
+
+
+    # Called when the process is exiting to send anything still pending.
+    # The send is done by the worker, so the exit is never held up longer than the exit timeout, even if the worker is blocked on a slow request.
+    @staticmethod
+    def _FlushOnExit():
+        try:
+            with Telemetry._Lock:
+                # The worker is started with the first event, so if it's not running there's nothing to send.
+                if Telemetry._WorkerThread is None or len(Telemetry._PendingEvents) == 0:
+                    return
+                Telemetry._ExitDeadlineSec = time.time() + Telemetry.c_SendOnExitTimeoutSec
+                Telemetry._IsExiting = True
+                Telemetry._FlushDoneEvent.clear()
+            Telemetry._WorkerEvent.set()
+            # If the worker is busy with a send, it will pick up the pending events when it's done, as long as it's within the deadline.
+            while True:
+                remainingSec = Telemetry._ExitDeadlineSec - time.time()
+                if remainingSec <= 0 or Telemetry._FlushDoneEvent.wait(remainingSec) is False:
+                    break
+                with Telemetry._Lock:
+                    if len(Telemetry._PendingEvents) == 0:
+                        return
+                    Telemetry._FlushDoneEvent.clear()
+                Telemetry._WorkerEvent.set()
+            # We ran out of time, discard what's left so we don't hold up the exit.
+            with Telemetry._Lock:
+                discardedCount = len(Telemetry._PendingEvents)
+                Telemetry._PendingEvents = {}
+            if discardedCount > 0 and Telemetry.Logger is not None:
+                Telemetry.Logger.warn(f"Telemetry discarded {discardedCount} events that couldn't be sent before exit.")
+        except Exception:
+            pass
+
+
+    # Takes all of the pending events and sends them.
+    @staticmethod
+    def _Flush(timeoutSec:float):
+        with Telemetry._Lock:
+            if len(Telemetry._PendingEvents) == 0 and Telemetry._DroppedEventCount == 0:
+                return
+            events = list(Telemetry._PendingEvents.values())
+            Telemetry._PendingEvents = {}
+            droppedCount = Telemetry._DroppedEventCount
+            Telemetry._DroppedEventCount = 0
+
+        # If we had to drop any events, log how many.
+        if droppedCount > 0 and Telemetry.Logger is not None:
+            Telemetry.Logger.warn(f"Telemetry dropped {droppedCount} events because the pending queue was full.")
+
+        # The service accepts one event per request, but they are all sent from this one thread with the same http session.
+        for i, event in enumerate(events):
+            # If the process is exiting and we are past the exit deadline, stop, since the process won't wait for us anyways.
+            if Telemetry._IsExiting and time.time() > Telemetry._ExitDeadlineSec:
+                if Telemetry.Logger is not None:
+                    Telemetry.Logger.warn(f"Telemetry discarded {len(events) - i} events that couldn't be sent before exit.")
+                return
+            Telemetry._WriteSync(event, timeoutSec)
+
+
+    # Sends a single event and blocks on the request. True is returned on success, otherwise False.
+    @staticmethod
+    def _WriteSync(event:dict, timeoutSec:float):
+        measureStr = event.get("Name", "")
+        try:
             # Send the event.
             url = Telemetry.ServerProtocolAndDomain+'/api/stats/v2/telemetryaccumulator'
-            response = HttpSessions.GetSession(url).post(url, json=event, timeout=1*60)
+            response = HttpSessions.GetSession(url).post(url, json=event, timeout=timeoutSec)
 
             # Check for success.
             if response.status_code == 200:
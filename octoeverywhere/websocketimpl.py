@@ -9,7 +9,7 @@ from .sentry import Sentry
 # This class gives a bit of an abstraction over the normal ws
 class Client:
 
-    def __init__(self, url, onWsOpen = None, onWsMsg = None, onWsData = None, onWsClose = None, onWsError = None, headers:dict = None, subProtocolList:list = None):
+    def __init__(self, url, onWsOpen = None, onWsMsg = None, onWsData = None, onWsClose = None, onWsError = None, headers:dict = None, subProtocolList:list = None, onWsPong = None):
 
         # Set the default timeout for the socket. There's no other way to do this than this global var, and it will be shared by all websockets.
         # This is used when the system is writing or receiving, but not when it's waiting to receive, as that's a select()
@@ -72,6 +72,14 @@ class Client:
             # For this special case, call our function.
             self.handleWsError(exception)
 
+        def OnPong(ws, data):
+            if onWsPong:
+                # The websocket lib records the time it sent the last keep alive ping and got the last pong, so the difference is the round trip time.
+                lastPingSec = getattr(ws, "last_ping_tm", 0)
+                lastPongSec = getattr(ws, "last_pong_tm", 0)
+                if lastPingSec > 0 and lastPongSec >= lastPingSec:
+                    onWsPong(self, (lastPongSec - lastPingSec) * 1000.0)
+
         # Create the websocket. Once created, this is never destroyed while this class exists.
         self.Ws = WebSocketApp(url,
                                   on_open = OnOpen,
@@ -79,6 +87,7 @@ class Client:
                                   on_close = OnClosed,
                                   on_error = OnError,
                                   on_data = OnData,
+                                  on_pong = OnPong,
                                   header = headers,
                                   subprotocols = subProtocolList
         )
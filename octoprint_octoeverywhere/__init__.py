@@ -33,6 +33,7 @@ from .octoprintwebcamhelper import OctoPrintWebcamHelper
 from .localauth import LocalAuth
 from .slipstream import Slipstream
 from .smartpause import SmartPause
+from .gcodehookdispatcher import GcodeHookDispatcher
 
 class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
                             octoprint.plugin.SettingsPlugin,
@@ -50,6 +51,8 @@ class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
         # Default the handler to None since that will make the var name exist
         # but we can't actually create the class yet until the system is more initialized.
         self.NotificationHandler = None
+        self.GcodeHookDispatcher = None
+        self.LayerTracker = None
         # Init member vars
         self.octoKey = ""
         # Indicates if OnStartup has been called yet.
@@ -216,6 +219,10 @@ class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
         # Create the smart pause handler
         SmartPause.Init(self._logger, self._printer, self._printer_profile_manager.get_current_or_default())
 
+        # Setup the gcode hook handler, this must be done after the notification handler and smart pause are created.
+        self.LayerTracker = printerStateObject.GetLayerTracker()
+        self.GcodeHookDispatcher = GcodeHookDispatcher(self._logger, self.NotificationHandler, self.LayerTracker)
+
         # Spin off a thread to try to resolve hostnames for logging and debugging.
         resolverThread = threading.Thread(target=self.TryToPrintHostNameIps)
         resolverThread.start()
@@ -235,7 +242,7 @@ class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
         # Init slipstream - This must be inited after LocalAuth since it requires the auth key.
         # Is also must be done when the OctoPrint server is ready, since it's going to kick off a thread to
         # pull and cache the index.
-        Slipstream.Init(self._logger)
+        Slipstream.Init(self._logger, self.get_plugin_data_folder(), self._plugin_version)
 
     #
     # Functions for the Simple API Mixin
@@ -295,71 +302,23 @@ class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
     #
     def received_gcode(self, comm, line, *args, **kwargs):
         # Blocking will block the printer commands from being handled so we can't block here!
-
-        if line and self.NotificationHandler is not None:
-            # ToLower the line for better detection.
-            lineLower = line.lower()
-
-            # M600 is a filament change command.
-            # https://marlinfw.org/docs/gcode/M600.html
-            # On my Pursa, I see this "fsensor_update - M600" AND this "echo:Enqueuing to the front: "M600""
-            # We check for this both in sent and received, to make sure we cover all use cases. The OnFilamentChange will only allow one notification to fire every so often.
-            # This m600 usually comes from when the printer sensor has detected a filament run out.
-            if "m600" in lineLower or "fsensor_update" in lineLower:
-                self._logger.info("Firing On Filament Change Notification From GcodeReceived: "+str(line))
-                # No need to use a thread since all events are handled on a new thread.
-                self.NotificationHandler.OnFilamentChange()
-            else:
-                # Look for a line indicating user interaction is needed.
-                if "paused for user" in lineLower or "// action:paused" in lineLower:
-                    self._logger.info("Firing On User Interaction Required From GcodeReceived: "+str(line))
-                    # No need to use a thread since all events are handled on a new thread.
-                    self.NotificationHandler.OnUserInteractionNeeded()
-
+        dispatcher = self.GcodeHookDispatcher
+        if dispatcher is not None:
+            dispatcher.OnReceived(line)
         # We must return line the line won't make it to OctoPrint!
         return line
 
     def sent_gcode(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
         # Blocking will block the printer commands from being handled so we can't block here!
-
-        # M600 is a filament change command.
-        # https://marlinfw.org/docs/gcode/M600.html
-        # We check for this both in sent and received, to make sure we cover all use cases. The OnFilamentChange will only allow one notification to fire every so often.
-        # This M600 usually comes from filament change required commands embedded in the gcode, for color changes and such.
-        if self.NotificationHandler is not None and gcode and gcode == "M600":
-            self._logger.info("Firing On Filament Change Notification From GcodeSent: "+str(gcode))
-            # No need to use a thread since all events are handled on a new thread.
-            self.NotificationHandler.OnFilamentChange()
-
-        # Look for positive extrude commands, so we can keep track of them for final snap and our first layer tracking logic.
-        # Example cmd value: `G1 X112.979 Y93.81 E.03895`
-        if self.NotificationHandler is not None and gcode and cmd and gcode == "G1":
-            try:
-                indexOfE = cmd.find('E')
-                if indexOfE != -1:
-                    endOfEValue = cmd.find(' ', indexOfE)
-                    if endOfEValue == -1:
-                        endOfEValue = len(cmd)
-                    eValue = cmd[indexOfE+1:endOfEValue]
-                    # The value will look like one of these: -.333,1.33,.33
-                    # We don't care about negative values, so ignore them.
-                    if eValue[0] != '-':
-                        # If the value doesn't start with a 0, the float parse wil fail.
-                        if eValue[0] != '0':
-                            eValue = "0" + eValue
-                        # Now the value should be something like 1.33 or 0.33
-                        if float(eValue) > 0:
-                            self.NotificationHandler.ReportPositiveExtrudeCommandSent()
-            except Exception as e:
-                self._logger.debug("Failed to parse gcode %s, error %s", cmd, str(e))
+        dispatcher = self.GcodeHookDispatcher
+        if dispatcher is not None:
+            dispatcher.OnSent(cmd, gcode)
 
     def queuing_gcode(self, comm_instance, phase, cmd, cmd_type, gcode, subcode=None, tags=None, *args, **kwargs):
-        # Make sure smart pause is setup, since this can be called really early on startup.
-        smartPause = SmartPause.Get()
-        if smartPause is None:
-            return
-        # Smart pause needs to keep track of the positioning mode, so it can properly resume it after a pause.
-        smartPause.OnGcodeQueuing(cmd)
+        # This can be called really early on startup, before the dispatcher is setup.
+        dispatcher = self.GcodeHookDispatcher
+        if dispatcher is not None:
+            dispatcher.OnQueuing(cmd)
 
     def script_hook(self, comm, script_type, script_name, *args, **kwargs):
         # Make sure smart pause is setup, since this can be called really early on startup.
@@ -416,6 +375,12 @@ class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
         if event == "ClientAuthed":
             self.HandleClientAuthedEvent()
 
+        # When the settings are updated, the webcam settings might have changed, so drop the cached webcam config.
+        if event == "SettingsUpdated":
+            webcamHelper = WebcamHelper.Get()
+            if webcamHelper is not None:
+                webcamHelper.OnWebcamSettingsChanged()
+
         # Only check the event after the notification handler has been created.
         # Specifically here, we have seen the Error event be fired before `on_startup` is fired,
         # and thus the handler isn't created.
@@ -439,15 +404,28 @@ class OctoeverywherePlugin(octoprint.plugin.StartupPlugin,
             # See details in NotificationHandler._RecoverOrRestForNewPrint
             # TODO - With things like OctoKlipper, I'm not sure if the above is true, OctoPrint could restart and the print would still be active.
             self.NotificationHandler.OnStarted(f"{int(time.time())}", fileName, fileSizeKBytes, totalFilamentUsageMm)
+            # Start the layer tracker, it can only track prints from local files, since SD card prints aren't sent through the gcode hooks.
+            if self.LayerTracker is not None:
+                filePath = None
+                if self.GetDictStringOrEmpty(payload, "origin") == "local" and self._exists(payload, "path"):
+                    try:
+                        filePath = self._file_manager.path_on_disk("local", payload["path"])
+                    except Exception as e:
+                        self._logger.warn("Failed to get the path on disk for the print file. "+str(e))
+                self.LayerTracker.OnPrintStarted(filePath)
         elif event == "PrintFailed":
             fileName = self.GetDictStringOrEmpty(payload, "name")
             durationSec = self.GetDictStringOrEmpty(payload, "time")
             reason = self.GetDictStringOrEmpty(payload, "reason")
             self.NotificationHandler.OnFailed(fileName, durationSec, reason)
+            if self.LayerTracker is not None:
+                self.LayerTracker.OnPrintEnded()
         elif event == "PrintDone":
             fileName = self.GetDictStringOrEmpty(payload, "name")
             durationSec = self.GetDictStringOrEmpty(payload, "time")
             self.NotificationHandler.OnDone(fileName, durationSec)
+            if self.LayerTracker is not None:
+                self.LayerTracker.OnPrintEnded()
         elif event == "PrintPaused":
             fileName = self.GetDictStringOrEmpty(payload, "name")
             self.NotificationHandler.OnPaused(fileName)
@@ -239,7 +239,7 @@ if __name__ == '__main__':
     # The order matters, LocalAuth needs to be init before Slipstream.
     LocalAuth.Init(logger, None)
     LocalAuth.Get().SetApiKeyForTesting("SuperSecureApiKey")
-    Slipstream.Init(logger)
+    Slipstream.Init(logger, PluginFilePathRoot, "1.10.20")
     SmartPause.Init(logger, None, None)
 
     uiPopInvoker = UiPopupInvokerStub(logger)
@@ -0,0 +1,174 @@
+import re
+import time
+import logging
+
+from octoeverywhere.notificationshandler import NotificationsHandler
+
+from .smartpause import SmartPause
+from .layertracker import LayerTracker
+
+# Keeps track of how long a gcode hook takes to run.
+class GcodeHookTimingStats:
+
+    def __init__(self, name:str):
+        self.Name = name
+        self.Count = 0
+        self.TotalSec = 0.0
+        self.MaxSec = 0.0
+
+
+    def Add(self, durationSec:float):
+        self.Count += 1
+        self.TotalSec += durationSec
+        if durationSec > self.MaxSec:
+            self.MaxSec = durationSec
+
+
+    def GetAndReset(self) -> str:
+        avgMs = 0.0 if self.Count == 0 else (self.TotalSec / self.Count) * 1000.0
+        s = f"{self.Name} [count:{self.Count} avg:{format(avgMs, '.4f')}ms max:{format(self.MaxSec*1000.0, '.3f')}ms]"
+        self.Count = 0
+        self.TotalSec = 0.0
+        self.MaxSec = 0.0
+        return s
+
+
+# Handles the OctoPrint gcode hooks.
+#
+# These hooks are called on OctoPrint's serial communication thread for every line sent to and received from the printer,
+# so anything we do here directly delays the printer. Every handler rejects uninteresting lines with the cheapest check possible
+# before doing anything else, and only parses what the features that are currently active need.
+class GcodeHookDispatcher:
+
+    # How often the hook timing stats are logged.
+    c_TimingReportIntervalSec = 60 * 10
+
+    # If any hook call takes longer than this, the timing stats are logged as a warning.
+    c_SlowHookCallSec = 0.005
+
+    # Finds the received lines we care about, without needing to make a lowercase copy of the line.
+    # M600 is a filament change command. https://marlinfw.org/docs/gcode/M600.html
+    # On my Pursa, I see this "fsensor_update - M600" AND this "echo:Enqueuing to the front: "M600""
+    # The others indicate that user interaction is needed.
+    c_ReceivedLineRegex = re.compile(r"m600|fsensor_update|paused for user|// action:paused", re.IGNORECASE)
+
+    # The filament change part of the received line regex. If a line has both a filament change and a pause string, the filament change wins.
+    c_ReceivedFilamentChangeRegex = re.compile(r"m600|fsensor_update", re.IGNORECASE)
+
+    # Finds a positive E value in a G1 command. Negative values don't match, since there must be a digit or . after the E.
+    # Example cmd value: `G1 X112.979 Y93.81 E.03895`
+    c_PositiveExtrudeRegex = re.compile(r"E(\d*\.?\d+)")
+
+
+    def __init__(self, logger:logging.Logger, notificationHandler:NotificationsHandler, layerTracker:LayerTracker):
+        self.Logger = logger
+        self.NotificationHandler = notificationHandler
+        self.LayerTracker = layerTracker
+        self.ReceivedStats = GcodeHookTimingStats("Received")
+        self.SentStats = GcodeHookTimingStats("Sent")
+        self.QueuingStats = GcodeHookTimingStats("Queuing")
+        self.LastTimingReportSec = time.time()
+
+
+    # Called for every line received from the printer.
+    def OnReceived(self, line:str) -> None:
+        start = time.perf_counter()
+        try:
+            # Most lines are "ok" or temp reports, so quickly reject them.
+            if line is None or len(line) < 4:
+                return
+            match = GcodeHookDispatcher.c_ReceivedLineRegex.search(line)
+            if match is None:
+                return
+            # We check for M600 both in sent and received, to make sure we cover all use cases. The OnFilamentChange will only allow one notification to fire every so often.
+            # This m600 usually comes from when the printer sensor has detected a filament run out.
+            # The search returns the first match in the line, so if it's a pause string, make sure there's no filament change after it.
+            found = match.group(0).lower()
+            if found == "m600" or found == "fsensor_update" or GcodeHookDispatcher.c_ReceivedFilamentChangeRegex.search(line, match.end()) is not None:
+                self.Logger.info("Firing On Filament Change Notification From GcodeReceived: "+str(line))
+                # No need to use a thread since all events are handled on a new thread.
+                self.NotificationHandler.OnFilamentChange()
+            else:
+                self.Logger.info("Firing On User Interaction Required From GcodeReceived: "+str(line))
+                # No need to use a thread since all events are handled on a new thread.
+                self.NotificationHandler.OnUserInteractionNeeded()
+        except Exception as e:
+            self.Logger.debug("GcodeHookDispatcher failed to handle received line %s, error %s", line, str(e))
+        finally:
+            self._AddTiming(self.ReceivedStats, start)
+
+
+    # Called for every command sent to the printer.
+    # gcode is the command OctoPrint parsed out of the line, like G1 or M600, it can be None.
+    def OnSent(self, cmd:str, gcode:str) -> None:
+        start = time.perf_counter()
+        try:
+            # We only care about G and M commands.
+            if not gcode:
+                return
+            # The layer tracker needs to see all of the moves and positioning mode changes.
+            self.LayerTracker.OnSent(cmd, gcode)
+            firstChar = gcode[0]
+            if firstChar == 'G':
+                if gcode == "G1":
+                    self._HandleSentG1(cmd)
+            elif firstChar == 'M':
+                # M600 is a filament change command.
+                # This M600 usually comes from filament change required commands embedded in the gcode, for color changes and such.
+                if gcode == "M600":
+                    self.Logger.info("Firing On Filament Change Notification From GcodeSent: "+str(gcode))
+                    # No need to use a thread since all events are handled on a new thread.
+                    self.NotificationHandler.OnFilamentChange()
+        except Exception as e:
+            self.Logger.debug("GcodeHookDispatcher failed to handle sent gcode %s, error %s", cmd, str(e))
+        finally:
+            self._AddTiming(self.SentStats, start)
+
+
+    # Called for every command queued to be sent to the printer.
+    def OnQueuing(self, cmd:str) -> None:
+        start = time.perf_counter()
+        try:
+            # Smart pause only needs the positioning mode commands, which are always 3 chars long.
+            if cmd is None or len(cmd) != 3:
+                return
+            # Make sure smart pause is setup, since this can be called really early on startup.
+            smartPause = SmartPause.Get()
+            if smartPause is None:
+                return
+            # Smart pause needs to keep track of the positioning mode, so it can properly resume it after a pause.
+            smartPause.OnGcodeQueuing(cmd)
+        except Exception as e:
+            self.Logger.debug("GcodeHookDispatcher failed to handle queuing gcode %s, error %s", cmd, str(e))
+        finally:
+            self._AddTiming(self.QueuingStats, start)
+
+
+    # Look for positive extrude commands, so we can keep track of them for final snap and our first layer tracking logic.
+    def _HandleSentG1(self, cmd:str) -> None:
+        if cmd is None or self.NotificationHandler.IsPositiveExtrudeReportNeeded() is False:
+            return
+        match = GcodeHookDispatcher.c_PositiveExtrudeRegex.search(cmd)
+        if match is None:
+            return
+        # The value will look like one of these: 1.33, .33, 0
+        if float(match.group(1)) > 0:
+            self.NotificationHandler.ReportPositiveExtrudeCommandSent()
+
+
+    def _AddTiming(self, stats:GcodeHookTimingStats, startPerfCounter:float) -> None:
+        duration = time.perf_counter() - startPerfCounter
+        stats.Add(duration)
+        # Only check the time every so often, to keep the overhead down.
+        if stats.Count % 1000 != 0 and duration < GcodeHookDispatcher.c_SlowHookCallSec:
+            return
+        now = time.time()
+        if now - self.LastTimingReportSec < GcodeHookDispatcher.c_TimingReportIntervalSec:
+            return
+        self.LastTimingReportSec = now
+        isSlow = max(self.ReceivedStats.MaxSec, self.SentStats.MaxSec, self.QueuingStats.MaxSec) > GcodeHookDispatcher.c_SlowHookCallSec
+        msg = "Gcode hook timing: " + self.ReceivedStats.GetAndReset() + " " + self.SentStats.GetAndReset() + " " + self.QueuingStats.GetAndReset()
+        if isSlow:
+            self.Logger.warning(msg)
+        else:
+            self.Logger.debug(msg)
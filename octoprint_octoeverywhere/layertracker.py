@@ -0,0 +1,253 @@
+import re
+import bisect
+import logging
+import threading
+
+from octoeverywhere.sentry import Sentry
+
+# Follows the gcode moves to find where each layer starts.
+#
+# A new layer starts the first time the printer extrudes while moving in X/Y at a Z height above the last layer's Z height.
+# Since we only count moves that extrude, z-hops and travel moves don't start a new layer.
+# This same logic is used for the live gcode stream and the background file pass, so both of them agree on where the layers are.
+class LayerZCounter:
+
+    # Finds the Z and E values in a G0 or G1 command. Example: `G1 X112.979 Y93.81 Z0.2 E.03895`
+    c_ZValueRegex = re.compile(r"Z(-?\d*\.?\d+)")
+    c_EValueRegex = re.compile(r"E(-?\d*\.?\d+)")
+
+    # The min amount the Z height must be above the last layer to be considered a new layer.
+    c_MinLayerStepMm = 0.001
+
+    def __init__(self):
+        self.IsRelativeXYZ = False
+        self.IsRelativeE = False
+        self.CurrentZ = 0.0
+        self.LastE = 0.0
+        # The Z height of the current layer, None until the first layer starts.
+        self.LayerZ = None
+        self.LayerCount = 0
+
+
+    # Handles any command that isn't a move, which can change how the moves are interpreted.
+    # gcode must be the upper case command, like G91 or M83.
+    def OnCommand(self, gcode:str, cmd:str) -> None:
+        if gcode == "G90":
+            self.IsRelativeXYZ = False
+            self.IsRelativeE = False
+        elif gcode == "G91":
+            self.IsRelativeXYZ = True
+            self.IsRelativeE = True
+        elif gcode == "M82":
+            self.IsRelativeE = False
+        elif gcode == "M83":
+            self.IsRelativeE = True
+        elif gcode == "G92":
+            # Setting the position resets the values given, most commonly this is `G92 E0`
+            if 'E' in cmd:
+                match = LayerZCounter.c_EValueRegex.search(cmd)
+                if match is not None:
+                    self.LastE = float(match.group(1))
+            if 'Z' in cmd:
+                match = LayerZCounter.c_ZValueRegex.search(cmd)
+                if match is not None:
+                    self.CurrentZ = float(match.group(1))
+
+
+    # Handles a G0 or G1 move.
+    # Returns True if this move started a new layer.
+    def OnMove(self, cmd:str) -> bool:
+        if 'Z' in cmd:
+            match = LayerZCounter.c_ZValueRegex.search(cmd)
+            if match is not None:
+                z = float(match.group(1))
+                self.CurrentZ = self.CurrentZ + z if self.IsRelativeXYZ else z
+
+        # Only look at the extrude value if it's needed.
+        # In relative mode, we only need it when we are above the current layer. In absolute mode we always need to track the last value.
+        if 'E' not in cmd:
+            return False
+        isAboveLayer = self.LayerZ is None or self.CurrentZ > self.LayerZ + LayerZCounter.c_MinLayerStepMm
+        if self.IsRelativeE and isAboveLayer is False:
+            return False
+        match = LayerZCounter.c_EValueRegex.search(cmd)
+        if match is None:
+            return False
+        e = float(match.group(1))
+        if self.IsRelativeE:
+            extrudeDelta = e
+        else:
+            extrudeDelta = e - self.LastE
+            self.LastE = e
+
+        # Only moves that extrude while moving in X or Y count, so retracts and primes don't start a new layer.
+        if isAboveLayer is False or extrudeDelta <= 0 or ('X' not in cmd and 'Y' not in cmd):
+            return False
+        self.LayerZ = self.CurrentZ
+        self.LayerCount += 1
+        return True
+
+
+# Tracks the current layer of an OctoPrint print, since OctoPrint doesn't track it for us.
+#
+# The tracker is fed every command sent to the printer from the sent gcode hook, so it must be as cheap as possible.
+# When a print starts, the gcode file is read on a background thread to find the Z height of each layer and the total layer count.
+# When the layer changes, the notification handler is told about it, so it doesn't have to poll for layer changes.
+#
+# Prints from the SD card aren't sent through the gcode hooks, so for those the layer info is reported as not supported.
+class LayerTracker:
+
+    def __init__(self, logger:logging.Logger):
+        self.Logger = logger
+        self.NotificationHandler = None
+        self.Lock = threading.Lock()
+        self.Counter = LayerZCounter()
+        # Set when a print from a local file is running, so we know the gcode hooks will see the print commands.
+        self.IsTracking = False
+        # Incremented for each print, so old file pass threads know they are stale.
+        self.PrintGeneration = 0
+        # The Z height of each layer in the file, in order. None until the file pass is done or if it failed.
+        self.FileLayerZs:list = None
+        self.LastReportedLayer = 0
+
+
+    # Sets the notification handler for use. This is required.
+    def SetNotificationHandler(self, handler):
+        self.NotificationHandler = handler
+
+
+    # Called when a print starts.
+    # filePath is the path on disk of the gcode file, or None if the print isn't from a local file.
+    def OnPrintStarted(self, filePath:str) -> None:
+        with self.Lock:
+            self.PrintGeneration += 1
+            self.Counter = LayerZCounter()
+            self.FileLayerZs = None
+            self.LastReportedLayer = 0
+            self.IsTracking = filePath is not None
+            generation = self.PrintGeneration
+        if filePath is None:
+            return
+        t = threading.Thread(target=self._FilePassThread, args=(filePath, generation), name="LayerTrackerFilePass")
+        t.daemon = True
+        t.start()
+
+
+    # Called when the print is done, failed, or cancelled.
+    def OnPrintEnded(self) -> None:
+        with self.Lock:
+            self.PrintGeneration += 1
+            self.IsTracking = False
+            self.FileLayerZs = None
+
+
+    # Called from the sent gcode hook for every command sent to the printer.
+    # gcode is the command OctoPrint parsed out of the line, like G1 or M83.
+    def OnSent(self, cmd:str, gcode:str) -> None:
+        if self.IsTracking is False:
+            return
+        if gcode == "G1" or gcode == "G0":
+            if self.Counter.OnMove(cmd):
+                self._OnNewLayer()
+        else:
+            self.Counter.OnCommand(gcode, cmd)
+
+
+    # Returns the layer info, in the same format as the PrinterStateObject.GetCurrentLayerInfo interface function.
+    def GetCurrentLayerInfo(self):
+        if self.IsTracking is False:
+            return (None, None)
+        fileLayerZs = self.FileLayerZs
+        if fileLayerZs is None:
+            # The file pass isn't done yet, so we don't know the total.
+            return (0, 0)
+        return (self._GetCurrentLayer(fileLayerZs), len(fileLayerZs))
+
+
+    def _GetCurrentLayer(self, fileLayerZs:list) -> int:
+        layerZ = self.Counter.LayerZ
+        if layerZ is None:
+            return 0
+        # Find the layer of the file we are on by height, so we are consistent with the file's total.
+        # If we don't know the file layers, fallback to the layer count we have seen.
+        if fileLayerZs is None:
+            return self.Counter.LayerCount
+        return min(bisect.bisect_right(fileLayerZs, layerZ + LayerZCounter.c_MinLayerStepMm), len(fileLayerZs))
+
+
+    def _OnNewLayer(self) -> None:
+        fileLayerZs = self.FileLayerZs
+        currentLayer = self._GetCurrentLayer(fileLayerZs)
+        if currentLayer == self.LastReportedLayer:
+            return
+        self.LastReportedLayer = currentLayer
+        handler = self.NotificationHandler
+        if handler is not None:
+            handler.OnLayerChanged(currentLayer, 0 if fileLayerZs is None else len(fileLayerZs))
+
+
+    # Reads the gcode file to find the Z height of each layer.
+    # If the file has layer change comments, those are used to find the layers. Otherwise we use the same Z move logic used for the live tracking.
+    def _FilePassThread(self, filePath:str, generation:int) -> None:
+        try:
+            counter = LayerZCounter()
+            zMoveLayerZs = []
+            markerLayerZs = []
+            isMarkerPending = False
+            with open(filePath, "r", encoding="utf-8", errors="ignore") as f:
+                lineCount = 0
+                for line in f:
+                    # Check if the print is still the same every so often, so we don't waste time reading a file no one cares about.
+                    lineCount += 1
+                    if lineCount % 100000 == 0 and generation != self.PrintGeneration:
+                        return
+                    if line.startswith(";"):
+                        # Cura uses ;LAYER:<n>, PrusaSlicer, Orca, and others use ;LAYER_CHANGE
+                        if line.startswith(";LAYER:") or line.startswith(";LAYER_CHANGE"):
+                            isMarkerPending = True
+                        continue
+                    commentStart = line.find(";")
+                    if commentStart != -1:
+                        line = line[:commentStart]
+                    line = line.strip().upper()
+                    if len(line) == 0:
+                        continue
+                    gcode = line.split(" ", 1)[0]
+                    if gcode == "G1" or gcode == "G0":
+                        if counter.OnMove(line):
+                            zMoveLayerZs.append(counter.LayerZ)
+                        # For the markers, the layer's Z height is the height of the first extrude after the marker.
+                        if isMarkerPending and 'E' in line and ('X' in line or 'Y' in line):
+                            isMarkerPending = False
+                            markerLayerZs.append(counter.CurrentZ)
+                    else:
+                        counter.OnCommand(gcode, line)
+
+            # Only use the markers if they make sense, since things like sequential printing will have layer heights that go back down.
+            fileLayerZs = zMoveLayerZs
+            if len(markerLayerZs) > 0 and all(markerLayerZs[i] < markerLayerZs[i+1] for i in range(len(markerLayerZs) - 1)):
+                fileLayerZs = markerLayerZs
+            if len(fileLayerZs) == 0:
+                self.Logger.info("LayerTracker didn't find any layers in the gcode file.")
+                self._StopTrackingIfGeneration(generation)
+                return
+            with self.Lock:
+                if generation != self.PrintGeneration:
+                    return
+                self.FileLayerZs = fileLayerZs
+            self.Logger.info(f"LayerTracker found {len(fileLayerZs)} layers in the gcode file.")
+        except Exception as e:
+            Sentry.Exception("LayerTracker failed to read the gcode file.", e)
+            self._StopTrackingIfGeneration(generation)
+
+
+    # If we can't find the layers in the file, stop tracking so the layer info is reported as not supported.
+    # That way the notification handler will fallback to the z offset logic.
+    def _StopTrackingIfGeneration(self, generation:int) -> None:
+        with self.Lock:
+            if generation != self.PrintGeneration or self.IsTracking is False:
+                return
+            self.IsTracking = False
+        handler = self.NotificationHandler
+        if handler is not None:
+            handler.OnLayerTrackingStopped()
@@ -1,5 +1,8 @@
-import secrets
+import time
 import string
+import hashlib
+import secrets
+import threading
 
 from octoprint.access.permissions import Permissions
 from octoeverywhere.compat import Compat
@@ -23,12 +26,24 @@ class LocalAuth:
     # We use the same key length as OctoPrint, because why not.
     _ApiGeneratedKeyLength = 32
 
+    # How long a validated key is cached before we will look up the user again.
+    c_ValidatedKeyCacheTtlSec = 10 * 60
+    # The max number of validated keys we will cache.
+    c_ValidatedKeyCacheMaxEntries = 8
+
 
     @staticmethod
     def Init(logger, userManager):
         LocalAuth._Instance = LocalAuth(logger, userManager)
         # Since this platform supports this object, set it in our compat layer.
         Compat.SetLocalAuth(LocalAuth._Instance)
+        # Listen for user changes, so we can drop any cached users.
+        # This only exists in newer versions of OctoPrint, for older versions the cache TTL will handle it.
+        if userManager is not None and hasattr(userManager, "register_login_status_listener"):
+            try:
+                userManager.register_login_status_listener(LocalAuthUserChangeListener(LocalAuth._Instance))
+            except Exception as e:
+                logger.warn("LocalAuth failed to register for user changes. "+str(e))
 
 
     @staticmethod
@@ -43,6 +58,10 @@ class LocalAuth:
         self.OctoPrintUserManager = userManager
         # Create a new random API key each time OctoPrint is started so we don't have to write it to disk and it changes over time.
         self.ApiKey = ''.join(secrets.choice(string.ascii_uppercase + string.digits) for _ in range(LocalAuth._ApiGeneratedKeyLength))
+        # Maps the sha256 hash of a validated key to a tuple of (user, expireTimeSec).
+        # Only the hash is stored, so the keys themselves aren't kept around.
+        self.ValidatedKeyCache = {}
+        self.ValidatedKeyCacheLock = threading.Lock()
 
 
     # Used only for testing without actual OctoPrint, this can set the API key
@@ -50,6 +69,7 @@ class LocalAuth:
     def SetApiKeyForTesting(self, apiKey):
         self.Logger.warn("LocalAuth is using a dev API key: "+str(apiKey))
         self.ApiKey = apiKey
+        self.ClearValidatedKeyCache()
 
 
     # Adds the auth header with the auth key.
@@ -66,12 +86,60 @@ class LocalAuth:
         if(api_key is None or api_key != self.ApiKey):
             return None
 
+        # Walking all of the users can be slow on setups with many users or with something like LDAP,
+        # so if we have validated this key recently, return the same user.
+        keyHash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+        now = time.time()
+        with self.ValidatedKeyCacheLock:
+            entry = self.ValidatedKeyCache.get(keyHash, None)
+            if entry is not None:
+                if entry[1] > now:
+                    return entry[0]
+                del self.ValidatedKeyCache[keyHash]
+
         # This is us trying to make a request.
         # We need to return a valid user with admin permissions.
         allUsers = self.OctoPrintUserManager.get_all_users()
         for user in allUsers:
             if user.has_permission(Permissions.ADMIN):
+                with self.ValidatedKeyCacheLock:
+                    # If we are full, drop the entry that expires first.
+                    if len(self.ValidatedKeyCache) >= LocalAuth.c_ValidatedKeyCacheMaxEntries:
+                        oldestKeyHash = min(self.ValidatedKeyCache, key=lambda k: self.ValidatedKeyCache[k][1])
+                        del self.ValidatedKeyCache[oldestKeyHash]
+                    self.ValidatedKeyCache[keyHash] = (user, now + LocalAuth.c_ValidatedKeyCacheTtlSec)
                 return user
 
         self.Logger.warn("Failed to find local user with admin permissions to return for authed call.")
         return None
+
+
+    # Drops all of the cached validated keys, so the next call will look up the user again.
+    # This is called when any user is changed, since the user we returned might have lost admin or been removed.
+    def ClearValidatedKeyCache(self):
+        with self.ValidatedKeyCacheLock:
+            self.ValidatedKeyCache.clear()
+
+
+# Gets user change callbacks from OctoPrint's user manager.
+# This implements the same functions as OctoPrint's LoginStatusListener, which is how the user manager calls it.
+class LocalAuthUserChangeListener:
+
+    def __init__(self, localAuth:LocalAuth):
+        self.LocalAuth = localAuth
+
+
+    def on_user_logged_in(self, user):
+        pass
+
+
+    def on_user_logged_out(self, user, stale=False):
+        pass
+
+
+    def on_user_modified(self, user):
+        self.LocalAuth.ClearValidatedKeyCache()
+
+
+    def on_user_removed(self, userid):
+        self.LocalAuth.ClearValidatedKeyCache()
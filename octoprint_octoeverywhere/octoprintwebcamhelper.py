@@ -1,6 +1,5 @@
 import logging
 import json
-import time
 
 from octoeverywhere.Webcam.webcamhelper import WebcamHelper
 from octoeverywhere.Webcam.webcamsettingitem import WebcamSettingItem
@@ -10,23 +9,10 @@ from octoeverywhere.sentry import Sentry
 # This class implements the webcam platform helper interface for OctoPrint.
 class OctoPrintWebcamHelper():
 
-    # The amount of time we will cache webcam settings to avoid somewhat costly calls to get the current settings
-    # the trade off here is freshness of data vs the compute cost of getting the settings.
-    c_WebcamSettingsCacheTimeSeconds = 10.0
-
     def __init__(self, logger:logging.Logger, octoPrintSettingsObject):
         self.Logger = logger
         self.OctoPrintSettingsObject = octoPrintSettingsObject
 
-        self.CachedWebcamSettingsResults = []
-        self.LastCacheUpdateTimeSec:float = 0
-        self._ResetCache()
-
-
-    def _ResetCache(self):
-        self.CachedWebcamSettingsResults = []
-        self.LastCacheUpdateTimeSec = 0
-
 
     # !! Interface Function !!
     # This must return an array of WebcamSettingItems.
@@ -42,16 +28,9 @@ class OctoPrintWebcamHelper():
                 WebcamSettingItem("Dev", f"{baseUrl}/webcam/?action=snapshot", f"{baseUrl}/webcam/?action=stream")
             ]
 
-        # Since OctoPrint 1.9.0+ needs to call plugins to return webcam settings, we want to reduce how often we make the call.
-        # The trade off there is that when a user changes an option, there will be a longer delay before the setting shows up in OctoEverywhere
-        # But that's a very rare case, and in most cases, we want to avoid calling the plugins frequently. GetWebcamConfig() is called every time
-        # we need a service snapshot, so for image based live links, it can be 1 time per second. It's also called for all notification and Gadget calls.
-        if len(self.CachedWebcamSettingsResults) != 0:
-            if time.time() - self.LastCacheUpdateTimeSec < OctoPrintWebcamHelper.c_WebcamSettingsCacheTimeSeconds:
-                return self.CachedWebcamSettingsResults
-
-        # Reset the cache if we are pulling again.
-        self._ResetCache()
+        # Since OctoPrint 1.9.0+ needs to call plugins to return webcam settings, this call isn't cheap.
+        # The WebcamHelper caches the result in its webcam config snapshot, so this is only called when the snapshot is rebuilt.
+        # When OctoPrint fires the SettingsUpdated event, the plugin invalidates the snapshot so new settings are picked up quickly.
 
         # A list of webcams we find.
         results = []
@@ -199,10 +178,6 @@ class OctoPrintWebcamHelper():
                 self.Logger.info(f"Camera-streamer webrtc {item.Name} stream url {item.StreamUrl} converted to jmpeg {cameraStreamerJmpegUrl}")
                 item.StreamUrl = cameraStreamerJmpegUrl
 
-        # Save the results in our cache.
-        self.CachedWebcamSettingsResults = results
-        self.LastCacheUpdateTimeSec = time.time()
-
         # Return the results.
         return results
 
@@ -2,6 +2,8 @@ from octoprint.printer import PrinterInterface
 
 from octoeverywhere.sentry import Sentry
 
+from .layertracker import LayerTracker
+
 # Implements a common interface shared by OctoPrint and Moonraker.
 class PrinterStateObject:
 
@@ -9,11 +11,19 @@ class PrinterStateObject:
         self.Logger = logger
         self.OctoPrintPrinterObject = octoPrintPrinterObject
         self.NotificationHandler = None
+        # OctoPrint doesn't track layers, so we do it ourselves from the gcode that's sent.
+        self.LayerTracker = LayerTracker(logger)
 
 
     # Sets the notification handler for use. This is required.
     def SetNotificationHandler(self, handler):
         self.NotificationHandler = handler
+        self.LayerTracker.SetNotificationHandler(handler)
+
+
+    # Returns the layer tracker, which needs to be fed the print events and sent gcode.
+    def GetLayerTracker(self) -> LayerTracker:
+        return self.LayerTracker
 
 
     # ! Interface Function ! The entire interface must change if the function is changed.
@@ -88,8 +98,9 @@ class PrinterStateObject:
     #     If the values are known, (currentLayer(int), totalLayers(int)) is returned.
     #          Note that total layers will always be > 0, but current layer can be 0!
     def GetCurrentLayerInfo(self):
-        # OctoPrint doesn't compute or track the layer height right now.
-        return (None, None)
+        # OctoPrint doesn't track the layers, but our layer tracker does for prints from local files.
+        # For prints it can't track, like SD card prints, this returns (None, None) so the z offset logic is used.
+        return self.LayerTracker.GetCurrentLayerInfo()
 
 
     # ! Interface Function ! The entire interface must change if the function is changed.
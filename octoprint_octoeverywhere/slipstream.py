@@ -1,5 +1,5 @@
-import threading
 import time
+import threading
 
 from octoeverywhere.sentry import Sentry
 from octoeverywhere.compat import Compat
@@ -9,6 +9,7 @@ from octoeverywhere.WebStream.octoheaderimpl import HeaderHelper
 from octoeverywhere.WebStream.octoheaderimpl import BaseProtocol
 from octoeverywhere.octostreammsgbuilder import OctoStreamMsgBuilder
 from octoeverywhere.compression import Compression, CompressionContext
+from octoeverywhere.slipstreamdiskcache import SlipstreamDiskCache
 
 from .localauth import LocalAuth
 
@@ -25,6 +26,9 @@ from .localauth import LocalAuth
 # We also pre-compress the response, so we can use a better compression quality and we don't have to compress it in realtime.
 #
 # This class has also been expanded to cache static resources required by the index that are large.
+#
+# The compressed cache entries are also saved to disk, so after a restart the cache is warm right away. Entries are then revalidated
+# with conditional requests using the ETag and Last-Modified values OctoPrint gave us, so we only download and compress them again if they changed.
 class Slipstream:
     # A const that defines the common cache path for the index.
     # This is a special case for the index, since we ignore query parameters and anchors for the cache lookup logic.
@@ -68,8 +72,8 @@ class Slipstream:
 
 
     @staticmethod
-    def Init(logger):
-        Slipstream._Instance = Slipstream(logger)
+    def Init(logger, localStorageDir:str, pluginVersion:str):
+        Slipstream._Instance = Slipstream(logger, localStorageDir, pluginVersion)
         # Since OctoPrint supports this, add it to our compat layer
         Compat.SetSlipstream(Slipstream._Instance)
 
@@ -79,14 +83,17 @@ class Slipstream:
         return Slipstream._Instance
 
 
-    def __init__(self, logger):
+    def __init__(self, logger, localStorageDir:str, pluginVersion:str):
         self.Logger = logger
+        self.DiskCache = SlipstreamDiskCache(logger, localStorageDir, pluginVersion)
 
+        # Load anything we have saved from the last run, so the cache is ready before the first refresh finishes.
         self.Lock = threading.Lock()
         self.IsRefreshing = False
-        self.Cache = {}
+        self.Cache = self.DiskCache.Load()
 
         # Kick off a thread to grab the initial index, no delay we build the cache ASAP.
+        # If we loaded entries from disk, this will only revalidate them.
         # Note on server boot this index cache call can take a long time (25-30s)
         self.UpdateCache(0)
 
@@ -123,6 +130,7 @@ class Slipstream:
 
             # Each time the index is requested, kick off a thread to refresh the cache.
             # We request a 20s delay so that the rest of the portal load isn't effected by the cache refreshing.
+            # The refresh is a conditional request, so if nothing changed it's very cheap.
             self.UpdateCache(20000)
 
             # Special case for the index page.
@@ -190,12 +198,15 @@ class Slipstream:
     def _GetAndProcessIndex(self):
         start = time.time()
 
-        # Start by trying to get the index.
-        indexResult = self._GetCacheReadyOctoHttpResult(Slipstream.IndexCachePath)
+        # Start by trying to get the index, if we have it cached this is a conditional request.
+        with self.Lock:
+            cachedIndexResult = self.Cache.get(Slipstream.IndexCachePath, None)
+        indexResult = self._GetCacheReadyOctoHttpResult(Slipstream.IndexCachePath, cachedIndexResult)
 
         # On failure leave.
         if indexResult is None:
             return
+        indexChanged = indexResult is not cachedIndexResult
 
         # On success, copy the index's body buffer.
         # This isn't efficient, but since this is a background thread it's fine.
@@ -224,6 +235,9 @@ class Slipstream:
         # Now process the index to see if there's more we should cache.
         # We explicitly look for known files in the index should reference that are large.
         # If we don't find them, no big deal.
+        anythingChanged = indexChanged
+        changedPaths = set([Slipstream.IndexCachePath]) if indexChanged else set()
+        referencedPaths = set([Slipstream.IndexCachePath])
         for subPath in Slipstream.OptionalPartialCachePaths:
             # This function will try to find the full url or path in the index body, including the query string.
             fullPath = self.TryToFindFullUrl(indexBodyStr, subPath)
@@ -231,22 +245,47 @@ class Slipstream:
             # No big deal if it can't be found.
             if fullPath is None:
                 continue
+            referencedPaths.add(fullPath)
+
+            # The full paths include a hash query string, so if the index didn't change and we already have this path, it didn't change either.
+            with self.Lock:
+                cachedResult = self.Cache.get(fullPath, None)
+            if cachedResult is not None and indexChanged is False:
+                continue
 
             # If we find it, try to cache it.
-            result = self._GetCacheReadyOctoHttpResult(fullPath)
+            result = self._GetCacheReadyOctoHttpResult(fullPath, cachedResult)
             if result is None:
+                anythingChanged = True
                 continue
 
             # Add it to our cache.
+            if result is not cachedResult:
+                anythingChanged = True
+                changedPaths.add(fullPath)
+                with self.Lock:
+                    self.Cache[fullPath] = result
+
+        # Remove anything the index doesn't reference anymore, so old versions of files don't hang around.
+        with self.Lock:
+            for path in list(self.Cache.keys()):
+                if path not in referencedPaths:
+                    anythingChanged = True
+                    del self.Cache[path]
+
+        # If anything changed, save the new cache state.
+        if anythingChanged:
             with self.Lock:
-                self.Cache[fullPath] = result
+                cache = dict(self.Cache)
+            self.DiskCache.Save(cache, changedPaths)
 
-        self.Logger.info("Slipstream took "+str(time.time()-start)+" to fully update the cache")
+        self.Logger.info("Slipstream took "+str(time.time()-start)+" to fully update the cache. Changed: "+str(anythingChanged))
 
 
     # On success returns the fully ready OctoHttpResult object.
+    # If a cached result is passed, the request is conditional and if the server says the content hasn't changed, the cached result is returned.
     # On failure, returns None
-    def _GetCacheReadyOctoHttpResult(self, url) -> OctoHttpRequest.Result:
+    def _GetCacheReadyOctoHttpResult(self, url, cachedResult:OctoHttpRequest.Result=None) -> OctoHttpRequest.Result:
         success = False
         try:
             # Take the starting time.
@@ -261,9 +300,26 @@ class Slipstream:
             # We need to use the local auth helper to add a auth header to the call so it doesn't fail due to unauthed.
             LocalAuth.Get().AddAuthHeader(headers)
 
+            # If we have a cached result, add the validators so the server can tell us if it's unchanged.
+            if cachedResult is not None:
+                for key in cachedResult.Headers:
+                    keyLower = key.lower()
+                    if keyLower == "etag":
+                        headers["If-None-Match"] = cachedResult.Headers[key]
+                    elif keyLower == "last-modified":
+                        headers["If-Modified-Since"] = cachedResult.Headers[key]
+
             # Make the call using our helper.
             octoHttpResult = OctoHttpRequest.MakeHttpCall(self.Logger, url, PathTypes.Relative, "GET", headers)
 
+            # If the content hasn't changed, keep using the cached result.
+            if cachedResult is not None and octoHttpResult is not None and octoHttpResult.StatusCode == 304:
+                with octoHttpResult:
+                    pass
+                self.Logger.debug("Slipstream cache revalidated "+url)
+                success = True
+                return cachedResult
+
             # Check for success
             if octoHttpResult is None or octoHttpResult.StatusCode != 200:
                 self.Logger.error("Slipstream failed to make the http request for "+url)
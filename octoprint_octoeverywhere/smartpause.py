@@ -12,6 +12,10 @@ class SmartPause:
     # The static instance.
     _Instance = None
 
+    # The positioning mode commands we keep track of, in any casing.
+    c_G9Commands = frozenset(["G90", "G91", "g90", "g91"])
+    c_M8Commands = frozenset(["M82", "M83", "m82", "m83"])
+
     @staticmethod
     def Init(logger, octoPrintPrinterObj, octoPrintPrinterProfileObj):
         SmartPause._Instance = SmartPause(logger, octoPrintPrinterObj, octoPrintPrinterProfileObj)
@@ -211,10 +215,10 @@ class SmartPause:
 
         # Try to match the command. If we find it, use the exact command casing that was
         # originally sent.
-        cmdLower = cmd.lower()
-        if cmdLower == "g90" or cmdLower == "g91":
+        # This is called for every queued command, so we use set lookups rather than making a lowercase copy.
+        if cmd in SmartPause.c_G9Commands:
             self.LastG9Command = cmd
-        if cmdLower == "m82" or cmdLower == "m83":
+        elif cmd in SmartPause.c_M8Commands:
             self.LastM8Command = cmd
 
 
@@ -0,0 +1,120 @@
+import logging
+
+from moonraker_octoeverywhere.filemetadatacache import FileMetadataCache
+
+
+class _Result:
+    def __init__(self, result):
+        self.Result = result
+
+    def HasError(self):
+        return self.Result is None
+
+    def GetResult(self):
+        return self.Result
+
+    def GetLoggingErrorStr(self):
+        return "error"
+
+
+# Acts like the MoonrakerClient, serving the metadata and file list from a dict of files.
+class _FakeMoonrakerClient:
+    def __init__(self):
+        # Maps the file name to the (modified, size, estimated_time)
+        self.Files = {}
+        self.MetadataCalls = []
+        self.FileListCalls = 0
+
+    def SendJsonRpcRequest(self, method, params):
+        if method == "server.files.list":
+            self.FileListCalls += 1
+            return _Result([{ "path": p, "modified": f[0], "size": f[1] } for p, f in self.Files.items()])
+        if method == "server.files.metadata":
+            name = params["filename"]
+            self.MetadataCalls.append(name)
+            f = self.Files.get(name, None)
+            if f is None:
+                return _Result(None)
+            return _Result({ "modified": f[0], "size": f[1], "estimated_time": f[2] })
+        raise Exception("Unexpected method " + method)
+
+
+def _Create(tmp_path, client=None):
+    client = client if client is not None else _FakeMoonrakerClient()
+    return FileMetadataCache(logging.getLogger("test"), client, str(tmp_path)), client
+
+
+def test_cached_entry_is_used_for_the_same_file(tmp_path):
+    cache, client = _Create(tmp_path)
+    client.Files["a.gcode"] = (100.0, 2048, 60.0)
+    assert cache.GetEstimatedPrintTimeSec("a.gcode") == 60.0
+    assert cache.GetFileSizeKBytes("a.gcode") == 2
+    assert client.MetadataCalls == ["a.gcode"]
+
+
+def test_unknown_file_returns_defaults(tmp_path):
+    cache, _ = _Create(tmp_path)
+    assert cache.GetEstimatedPrintTimeSec("missing.gcode") == -1.0
+    assert cache.GetLayerInfo(None) == (-1.0, -1.0, -1.0, -1.0)
+
+
+def test_lru_evicts_the_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileMetadataCache, "c_MaxEntries", 3)
+    cache, client = _Create(tmp_path)
+    for name in ("a", "b", "c"):
+        client.Files[name] = (1.0, 10, 1.0)
+        cache.GetEstimatedPrintTimeSec(name)
+    # Use "a" so "b" is the oldest, then add "d".
+    cache.GetEstimatedPrintTimeSec("a")
+    client.Files["d"] = (1.0, 10, 1.0)
+    cache.GetEstimatedPrintTimeSec("d")
+    assert [k[0] for k in cache.Entries] == ["c", "a", "d"]
+    client.MetadataCalls.clear()
+    cache.GetEstimatedPrintTimeSec("b")
+    assert client.MetadataCalls == ["b"]
+
+
+def test_modified_file_notification_invalidates_entry(tmp_path):
+    cache, client = _Create(tmp_path)
+    client.Files["a.gcode"] = (100.0, 2048, 60.0)
+    cache.OnMoonrakerWsOpened()
+    assert cache.GetEstimatedPrintTimeSec("a.gcode") == 60.0
+
+    client.Files["a.gcode"] = (200.0, 4096, 90.0)
+    cache.OnFileListChanged({ "params": [{ "action": "modify_file", "item": { "path": "a.gcode", "root": "gcodes", "modified": 200.0, "size": 4096 } }] })
+    assert cache.GetEstimatedPrintTimeSec("a.gcode") == 90.0
+    assert client.MetadataCalls == ["a.gcode", "a.gcode"]
+    assert len(cache.Entries) == 1
+
+
+def test_deleted_file_notification_removes_entry(tmp_path):
+    cache, client = _Create(tmp_path)
+    client.Files["a.gcode"] = (100.0, 2048, 60.0)
+    cache.GetEstimatedPrintTimeSec("a.gcode")
+    cache.OnFileListChanged({ "params": [{ "action": "delete_file", "item": { "path": "a.gcode", "root": "gcodes" } }] })
+    assert len(cache.Entries) == 0
+
+
+def test_restart_uses_disk_cache_and_file_list_without_metadata_rpc(tmp_path):
+    cache, client = _Create(tmp_path)
+    client.Files["a.gcode"] = (100.0, 2048, 60.0)
+    client.Files["b.gcode"] = (100.0, 2048, 30.0)
+    cache.GetEstimatedPrintTimeSec("a.gcode")
+    cache.GetEstimatedPrintTimeSec("b.gcode")
+
+    # b changes while we are down.
+    client.Files["b.gcode"] = (300.0, 1024, 45.0)
+    client.MetadataCalls.clear()
+    restarted, _ = _Create(tmp_path, client)
+
+    # Before the file list is pulled, the disk entries are trusted.
+    assert restarted.GetEstimatedPrintTimeSec("a.gcode") == 60.0
+    assert client.MetadataCalls == []
+
+    # Once the file list is pulled, the unchanged entry is still used and the changed one is dropped.
+    restarted.OnMoonrakerWsOpened()
+    assert client.FileListCalls == 1
+    assert restarted.GetEstimatedPrintTimeSec("a.gcode") == 60.0
+    assert client.MetadataCalls == []
+    assert restarted.GetEstimatedPrintTimeSec("b.gcode") == 45.0
+    assert client.MetadataCalls == ["b.gcode"]
@@ -0,0 +1,57 @@
+from octoeverywhere.jsoncodec import JsonCodec
+
+
+def test_peek_root_string_value_finds_root_key():
+    assert JsonCodec.PeekRootStringValue(b'{"Id":"abc123","Data":{"Id":"nested"}}', "Id") == "abc123"
+
+
+def test_peek_root_string_value_accepts_str_and_whitespace():
+    assert JsonCodec.PeekRootStringValue('{ "method" : "notify_status_update", "params": []}', "method") == "notify_status_update"
+
+
+def test_peek_root_string_value_ignores_nested_key():
+    # The key only shows up inside a nested object, so it's not a root level key.
+    assert JsonCodec.PeekRootStringValue(b'{"Data":{"Id":"nested"}}', "Id") is None
+
+
+def test_peek_root_string_value_only_scans_the_start():
+    data = b'{"Padding":"' + (b"x" * JsonCodec.c_PeekScanLimitBytes) + b'","Id":"abc"}'
+    assert JsonCodec.PeekRootStringValue(data, "Id") is None
+
+
+def test_peek_root_string_value_rejects_escaped_and_non_string_values():
+    assert JsonCodec.PeekRootStringValue(b'{"Id":"a\\"b"}', "Id") is None
+    assert JsonCodec.PeekRootStringValue(b'{"Id":12}', "Id") is None
+
+
+def test_peek_root_string_value_missing_key():
+    assert JsonCodec.PeekRootStringValue(b'{"Other":"abc"}', "Id") is None
+    assert JsonCodec.PeekRootStringValue(b'', "Id") is None
+
+
+def test_find_unique_string_value_at_any_depth():
+    assert JsonCodec.FindUniqueStringValue(b'{"Data":{"Inner":{"RequestID":"r-1"}}}', "RequestID") == "r-1"
+    assert JsonCodec.FindUniqueStringValue('{"RequestID": "r-2"}', "RequestID") == "r-2"
+
+
+def test_find_unique_string_value_rejects_duplicate_keys():
+    assert JsonCodec.FindUniqueStringValue(b'{"RequestID":"a","Data":{"RequestID":"b"}}', "RequestID") is None
+
+
+def test_find_unique_string_value_missing_or_escaped():
+    assert JsonCodec.FindUniqueStringValue(b'{"Other":"a"}', "RequestID") is None
+    assert JsonCodec.FindUniqueStringValue(b'{"RequestID":"a\\nb"}', "RequestID") is None
+    assert JsonCodec.FindUniqueStringValue(b'{"RequestID":null}', "RequestID") is None
+
+
+def test_might_contain_key():
+    assert JsonCodec.MightContainKey(b'{"Id":1}', "Id") is True
+    assert JsonCodec.MightContainKey('{"Id":1}', "Id") is True
+    assert JsonCodec.MightContainKey(b'{"Identity":1}', "Id") is False
+    assert JsonCodec.MightContainKey('{"Other":"Id"}', "Id") is True
+
+
+def test_loads_and_dumps_round_trip():
+    obj = {"a": 1, "b": [1, 2, "three"], "c": None}
+    assert JsonCodec.Loads(JsonCodec.Dumps(obj)) == obj
+    assert JsonCodec.Loads(b'{"a":1}') == {"a": 1}
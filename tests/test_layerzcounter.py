@@ -0,0 +1,93 @@
+import os
+import logging
+import importlib.util
+
+# The octoprint_octoeverywhere package init imports OctoPrint, so the layer tracker module is loaded directly from its file.
+_Spec = importlib.util.spec_from_file_location("layertracker", os.path.join(os.path.dirname(__file__), "..", "octoprint_octoeverywhere", "layertracker.py"))
+_Module = importlib.util.module_from_spec(_Spec)
+_Spec.loader.exec_module(_Module)
+LayerZCounter = _Module.LayerZCounter
+
+
+# Feeds the lines to the counter like the file pass does, and returns the layer count.
+def _Run(counter, lines):
+    for line in lines:
+        gcode = line.split(" ", 1)[0].upper()
+        if gcode in ("G0", "G1"):
+            counter.OnMove(line)
+        else:
+            counter.OnCommand(gcode, line)
+    return counter.LayerCount
+
+
+def test_absolute_layers_are_counted():
+    lines = [
+        "G90", "M82", "G92 E0",
+        "G1 Z0.2", "G1 X10 Y10 E1.0", "G1 X20 Y10 E2.0",
+        "G1 Z0.4", "G1 X10 Y10 E3.0",
+        "G1 Z0.6", "G1 X10 Y10 E4.0",
+    ]
+    assert _Run(LayerZCounter(), lines) == 3
+
+
+def test_z_hop_and_travel_without_extrusion_are_not_layers():
+    lines = [
+        "G90", "M82", "G92 E0",
+        "G1 Z0.2", "G1 X10 Y10 E1.0",
+        # A z hop with a travel move and no extrusion.
+        "G1 Z0.6", "G1 X50 Y50", "G1 Z0.2", "G1 X60 Y60 E2.0",
+    ]
+    assert _Run(LayerZCounter(), lines) == 1
+
+
+def test_retract_and_prime_are_not_layers():
+    lines = [
+        "G90", "M82", "G92 E0",
+        "G1 Z0.2", "G1 X10 Y10 E1.0",
+        "G1 Z0.4",
+        # Retract then prime without moving in X or Y.
+        "G1 E0.5", "G1 E1.0",
+        "G1 X20 Y20 E1.0",
+    ]
+    counter = LayerZCounter()
+    assert _Run(counter, lines) == 1
+    # The next real extrude starts the layer.
+    assert counter.OnMove("G1 X30 Y30 E1.5") is True
+    assert counter.LayerCount == 2
+
+
+def test_relative_extrusion_and_positioning():
+    lines = [
+        "G91",
+        "G1 Z0.2", "G1 X10 Y0 E0.5",
+        "G1 Z0.2", "G1 X10 Y0 E0.5",
+        "G1 X10 Y0 E-0.5",
+    ]
+    counter = LayerZCounter()
+    assert _Run(counter, lines) == 2
+    assert abs(counter.LayerZ - 0.4) < 0.0001
+
+
+def test_g92_resets_extrude_and_z():
+    counter = LayerZCounter()
+    assert _Run(counter, ["G90", "M82", "G1 Z0.2", "G1 X1 Y1 E5.0", "G92 E0", "G1 Z0.4", "G1 X2 Y2 E0.5"]) == 2
+    counter.OnCommand("G92", "G92 Z0.2")
+    assert counter.CurrentZ == 0.2
+    assert counter.OnMove("G1 X3 Y3 E1.0") is False
+
+
+def test_failed_file_pass_tells_the_handler_tracking_stopped(tmp_path):
+    class _Handler:
+        StoppedCalls = 0
+        def OnLayerTrackingStopped(self):
+            self.StoppedCalls += 1
+    tracker = _Module.LayerTracker(logging.getLogger("test"))
+    handler = _Handler()
+    tracker.SetNotificationHandler(handler)
+    # A file with no layers stops the tracking, so the handler needs to fallback.
+    path = tmp_path / "empty.gcode"
+    path.write_text("G28\nM104 S200\n")
+    tracker.OnPrintStarted(str(path))
+    tracker._FilePassThread(str(path), tracker.PrintGeneration)
+    assert tracker.GetCurrentLayerInfo() == (None, None)
+    assert handler.StoppedCalls >= 1